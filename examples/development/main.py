@@ -12,6 +12,7 @@ from softlearning.environments.utils import get_environment_from_params
 from softlearning.algorithms.utils import get_algorithm_from_variant
 from softlearning.policies.utils import get_policy_from_variant, get_policy
 from softlearning.replay_pools.utils import get_replay_pool_from_variant
+from softlearning.replay_pools.flexible_replay_pool import has_chunks
 from softlearning.samplers.utils import get_sampler_from_variant
 from softlearning.value_functions.utils import get_Q_function_from_variant
 
@@ -145,22 +146,42 @@ class ExperimentRunner(tune.Trainable):
 
         return os.path.join(checkpoint_dir, '')
 
+    def _replay_pool_chunks_dir(self, checkpoint_dir, pool_name):
+        return os.path.join(checkpoint_dir, pool_name)
+
     def _save_replay_pool(self, checkpoint_dir):
-        replay_pool_pickle_path = self._replay_pool_pickle_path(
-            checkpoint_dir)
-        self.replay_pool.save_latest_experience(replay_pool_pickle_path)
+        compression = self._variant['run_params'].get(
+            'replay_pool_compression', 'zlib')
+        pools = {
+            'replay_pool': self.replay_pool,
+            **self.algorithm.checkpoint_pools(),
+        }
+        for pool_name, pool in pools.items():
+            pool.save_latest_chunk(
+                self._replay_pool_chunks_dir(checkpoint_dir, pool_name),
+                compression=compression)
 
-    def _restore_replay_pool(self, current_checkpoint_dir):
+    def _restore_replay_pool(self, current_checkpoint_dir, pool_name, pool):
         experiment_root = os.path.dirname(current_checkpoint_dir)
+        current_index = int(current_checkpoint_dir.split('_')[-1])
 
-        experience_paths = [
-            self._replay_pool_pickle_path(checkpoint_dir)
-            for checkpoint_dir in sorted(glob.iglob(
-                os.path.join(experiment_root, 'checkpoint_*')))
-        ]
+        checkpoint_dirs = sorted(
+            (checkpoint_dir for checkpoint_dir in glob.iglob(
+                os.path.join(experiment_root, 'checkpoint_*'))
+             if int(checkpoint_dir.split('_')[-1]) <= current_index),
+            key=lambda checkpoint_dir: int(checkpoint_dir.split('_')[-1]))
 
-        for experience_path in experience_paths:
-            self.replay_pool.load_experience(experience_path)
+        chunks_dirs = [
+            self._replay_pool_chunks_dir(checkpoint_dir, pool_name)
+            for checkpoint_dir in checkpoint_dirs
+        ]
+        if any(has_chunks(chunks_dir) for chunks_dir in chunks_dirs):
+            pool.load_chunks(chunks_dirs)
+        elif pool_name == 'replay_pool':
+            # Checkpoints written before the chunked format.
+            for checkpoint_dir in checkpoint_dirs:
+                pool.load_experience(
+                    self._replay_pool_pickle_path(checkpoint_dir))
 
     def _restore(self, checkpoint_dir):
         assert isinstance(checkpoint_dir, str), checkpoint_dir
@@ -181,7 +202,8 @@ class ExperimentRunner(tune.Trainable):
             get_replay_pool_from_variant(self._variant, training_environment))
 
         if self._variant['run_params'].get('checkpoint_replay_pool', False):
-            self._restore_replay_pool(checkpoint_dir)
+            self._restore_replay_pool(
+                checkpoint_dir, 'replay_pool', replay_pool)
 
         sampler = self.sampler = picklable['sampler']
         Qs = self.Qs = picklable['Qs']
@@ -212,6 +234,11 @@ class ExperimentRunner(tune.Trainable):
             session=self._session)
         self.algorithm.__setstate__(picklable['algorithm'].__getstate__())
 
+        if self._variant['run_params'].get('checkpoint_replay_pool', False):
+            for pool_name, pool in self.algorithm.checkpoint_pools(
+                    create=True).items():
+                self._restore_replay_pool(checkpoint_dir, pool_name, pool)
+
         tf_checkpoint = self._get_tf_checkpoint()
         status = tf_checkpoint.restore(tf.train.latest_checkpoint(
             os.path.split(self._tf_checkpoint_prefix(checkpoint_dir))[0]))
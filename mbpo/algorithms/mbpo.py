@@ -1,9 +1,11 @@
 ## adapted from https://github.com/rail-berkeley/softlearning/blob/master/softlearning/algorithms/sac.py
 
 import os
+import re
 import math
 import pickle
 from collections import OrderedDict
+from contextlib import contextmanager
 from numbers import Number
 from itertools import count
 import gtimer as gt
@@ -14,16 +16,23 @@ import tensorflow as tf
 from tensorflow.python.training import training_util
 
 from softlearning.algorithms.rl_algorithm import RLAlgorithm
-from softlearning.replay_pools.simple_replay_pool import SimpleReplayPool
+from softlearning.replay_pools.utils import POOL_CLASSES
+from softlearning.utils.metrics import (
+    MetricsSink, set_metrics_sink, close_metrics_sink, log_metrics)
 
 from mbpo.models.constructor import construct_model, format_samples_for_training
 from mbpo.models.fake_env import FakeEnv
 from mbpo.utils.writer import Writer
 from mbpo.utils.visualization import visualize_policy
 from mbpo.utils.logging import Progress
+from mbpo.utils.prefetch import BatchPrefetcher
 import mbpo.utils.filesystem as filesystem
 
 
+## saved models, named '{name}_{timestep}' by BNN.save
+MODEL_FILE_PATTERN = re.compile(r'^BNN_(\d+)\.(bnn|nns)$')
+
+
 def td_target(reward, discount, next_value):
     return reward + discount * next_value
 
@@ -74,6 +83,7 @@ class MBPO(RLAlgorithm):
             max_model_t=None,
             dir_name=None,
             evaluate_explore_freq=0,
+            explore_eval_dir=None,
             num_Q_per_grp=2,
             num_Q_grp=1,
             cross_grp_diff_batch=False,
@@ -81,6 +91,16 @@ class MBPO(RLAlgorithm):
             model_load_dir=None,
             model_load_index=None,
             model_log_freq=0,
+            fused_rollout=False,
+            graph_rollout=False,
+            fused_training=False,
+            staged_training_batches=1,
+            prefetch_batches=0,
+            incremental_model_training=False,
+            model_train_max_epoch_rows=None,
+            model_train_in_graph=False,
+            model_pool_params=None,
+            stream_metrics=False,
             **kwargs,
     ):
         """
@@ -106,6 +126,48 @@ class MBPO(RLAlgorithm):
             critic_same_as_actor ('bool'): If True, use the same sampling schema
                 (model free or model based) as the actor in critic training. 
                 Otherwise, use model free sampling to train critic.
+            explore_eval_dir ('str'): Directory the exploration evaluations
+                are written to, in a subdirectory named `dir_name`. Defaults
+                to `exploration_eval` under the log dir.
+            fused_rollout ('bool'): If True, each row of a model rollout is
+                only passed through the elite it was assigned to, instead of
+                through the whole ensemble.
+            graph_rollout ('bool'): If True, model rollouts run as a single
+                in-graph policy -> model -> termination loop instead of one
+                session call per rollout step.
+            fused_training ('bool'): If True, the misc, actor, critic and
+                target ops due at an iteration are fetched together in as few
+                session calls as the feed dicts allow (one, unless the critic
+                uses a different batch than the actor).
+            staged_training_batches ('int'): If greater than 1, the training
+                iterations of a timestep run in chunks of this many per session
+                call. The batches of a chunk are drawn from the pools at once
+                and stacked, and an in-graph loop runs the actor, critic and
+                target updates of every iteration on them. Capped at the
+                number of training iterations per timestep. Not supported with
+                `cross_grp_diff_batch`.
+            prefetch_batches ('int'): If positive, training batches are
+                sampled and mixed in a background thread, keeping up to this
+                many batches ready ahead of the gradient steps. Batches
+                prefetched before new env samples or model rollouts reach the
+                pools are dropped.
+            incremental_model_training ('bool'): If True, the model keeps its
+                holdout split, bootstrap assignment and scaler statistics
+                across retrains and is only updated with the new env samples.
+            model_train_max_epoch_rows ('int'): Maximum number of env samples
+                visited per model training epoch in incremental training; all
+                new samples plus a random subset of the old ones.
+            model_train_in_graph ('bool'): If True, the model training set is
+                uploaded to the model graph once per retrain and minibatches
+                are drawn in the graph instead of being gathered and fed from
+                the host. Not used by incremental model training.
+            model_pool_params ('dict'): `type` and `kwargs` of the replay pool
+                holding the model rollouts, e.g. `{'type': 'MemmapReplayPool',
+                'kwargs': {'directory': '/scratch'}}` to keep a large model
+                pool on disk. Defaults to an in-memory `SimpleReplayPool`.
+            stream_metrics ('bool'): If True, per-step training, model
+                training, rollout and sampler metrics are streamed to
+                columnar tables under `metrics` in the log dir.
         """
 
         super(MBPO, self).__init__(**kwargs)
@@ -143,6 +205,8 @@ class MBPO(RLAlgorithm):
         # self._model_pool = SimpleReplayPool(pool._observation_space, pool._action_space, self._model_pool_size)
 
         self._model_retain_epochs = model_retain_epochs
+        self._model_pool_params = model_pool_params or {
+            'type': 'SimpleReplayPool', 'kwargs': {}}
 
         self._model_train_freq = model_train_freq
         self._rollout_batch_size = int(rollout_batch_size)
@@ -151,13 +215,19 @@ class MBPO(RLAlgorithm):
 
         self._log_dir = os.getcwd()
         self._writer = Writer(self._log_dir)
+        self._stream_metrics = stream_metrics
+        if self._stream_metrics:
+            set_metrics_sink(MetricsSink(os.path.join(self._log_dir, 'metrics')))
 
         self._training_environment = training_environment
         self._evaluation_environment = evaluation_environment
         self._policy = policy
 
         self._Qs = Qs
-        self._Q_ensemble = len(Qs)
+        ## a batched ensemble Q is a single model with one output per head
+        self._Q_ensemble = sum(int(Q.output_shape[-1]) for Q in Qs)
+        self._batched_Q = self._Q_ensemble > len(Qs)
+        assert not self._batched_Q or len(Qs) == 1, len(Qs)
         self._Q_elites = num_Q_elites
         self._Q_targets = tuple(tf.keras.models.clone_model(Q) for Q in Qs)
 
@@ -204,6 +274,7 @@ class MBPO(RLAlgorithm):
 
         self._dir_name = dir_name
         self._evaluate_explore_freq = evaluate_explore_freq
+        self._explore_eval_dir = explore_eval_dir or os.path.join(self._log_dir, 'exploration_eval')
 
         # Inter-group Qs are trained with the same data; Cross-group Qs different.
         self._num_Q_per_grp = num_Q_per_grp
@@ -211,6 +282,28 @@ class MBPO(RLAlgorithm):
         self._cross_grp_diff_batch = cross_grp_diff_batch
 
         self._model_log_freq = model_log_freq
+        self._fused_rollout = fused_rollout
+        self._graph_rollout = graph_rollout
+        self._fused_training = fused_training
+        if staged_training_batches > 1 and cross_grp_diff_batch:
+            raise ValueError(
+                "staged_training_batches > 1 is not supported with"
+                " cross_grp_diff_batch, which samples one batch per Q group.")
+        if staged_training_batches > self._n_train_repeat:
+            print('[ MBPO ] Capping staged training batches at {} (was {}): only {} are used per timestep'.format(
+                self._n_train_repeat, staged_training_batches, self._n_train_repeat))
+        self._staged_training_batches = min(staged_training_batches, self._n_train_repeat)
+        self._incremental_model_training = incremental_model_training
+        self._model_train_max_epoch_rows = model_train_max_epoch_rows
+        self._model_train_in_graph = model_train_in_graph
+        self._model_train_samples = 0
+        ## in staged training, every prefetched item is a stack of batches
+        self._prefetcher = (
+            BatchPrefetcher(
+                self._sample_staged_batches if self._staged_training_batches > 1
+                else self._sample_training_batch,
+                prefetch_batches)
+            if prefetch_batches > 0 else None)
 
         self._build()
 
@@ -230,6 +323,48 @@ class MBPO(RLAlgorithm):
         self._init_placeholders()
         self._init_actor_update()
         self._init_critic_update()
+        self._init_target_update()
+        if self._staged_training_batches > 1:
+            self._init_staged_training()
+        if self._graph_rollout:
+            self._init_rollout()
+        if self._stream_metrics:
+            self._init_metrics()
+
+    def _init_metrics(self):
+        ## fetched with the training ops, whose forward passes already compute
+        ## the losses on the batches they are trained on
+        self._actor_training_ops['metrics'] = {
+            'policy_loss': self._policy_loss,
+            'alpha': self._alpha,
+        }
+        critic_metrics = [
+            {'Q_loss': tf.reduce_mean(Q_losses)}
+            for Q_losses in self._Q_group_losses
+        ]
+        if self._cross_grp_diff_batch:
+            for critic_training_ops, metrics in zip(self._critic_training_ops, critic_metrics):
+                critic_training_ops['metrics'] = metrics
+        else:
+            self._critic_training_ops['metrics'] = critic_metrics[0]
+
+    def _log_training_metrics(self, iteration, actor_results=None, critic_results=()):
+        """Logs the metrics fetched with the actor and critic ops of an iteration."""
+        if not self._stream_metrics:
+            return
+
+        metrics = dict(actor_results['metrics']) if actor_results is not None else {}
+        if critic_results:
+            ## mean over the Q groups, each trained on its own batch
+            metrics['Q_loss'] = np.mean([
+                critic_result['metrics']['Q_loss'] for critic_result in critic_results])
+        if metrics:
+            log_metrics(
+                'training',
+                epoch=self._epoch,
+                timestep=self._total_timestep,
+                iteration=iteration,
+                **metrics)
 
     def _train(self):
         
@@ -282,7 +417,7 @@ class MBPO(RLAlgorithm):
                 self._timestep_before_hook()
                 gt.stamp('timestep_before_hook')
 
-                if self._timestep % self._model_train_freq == 0 and self._real_ratio < 1.0:
+                if self._num_period_starts(self._timestep, self._model_train_freq) > 0 and self._real_ratio < 1.0:
                     
                     self._training_progress.pause()
                     print('[ MBPO ] log_dir: {} | ratio: {}'.format(self._log_dir, self._real_ratio))
@@ -299,8 +434,9 @@ class MBPO(RLAlgorithm):
                     self._origin_model_train_epochs += 1
                     
                     self._set_rollout_length()
-                    self._reallocate_model_pool()
-                    model_rollout_metrics = self._rollout_model(rollout_batch_size=self._rollout_batch_size, deterministic=self._deterministic)
+                    with self._pools_paused(invalidate=True):
+                        model_metrics.update(self._reallocate_model_pool())
+                        model_rollout_metrics = self._rollout_model(rollout_batch_size=self._rollout_batch_size, deterministic=self._deterministic)
                     model_metrics.update(model_rollout_metrics)
                     
                     if self._model_log_freq != 0 and self._timestep % self._model_log_freq == 0:
@@ -384,7 +520,14 @@ class MBPO(RLAlgorithm):
 
             yield diagnostics
 
+        diagnostics.update(
+            self._final_evaluation_diagnostics(evaluation_environment))
+
         self.sampler.terminate()
+        if self._prefetcher is not None:
+            self._prefetcher.stop()
+        if self._stream_metrics:
+            close_metrics_sink()
 
         self._training_after_hook()
 
@@ -392,44 +535,41 @@ class MBPO(RLAlgorithm):
 
         yield {'done': True, **diagnostics}
     
-    def _evaluate_exploration(self):
+    def _evaluate_exploration(self, evaluation_size=3000, action_repeat=20, max_batch_size=int(1e5)):
         print("=============evaluate exploration=========")
 
         # specify data dir
-        base_dir = "/home/linus/Research/mbpo/mbpo_experiment/exploration_eval"
         if not self._dir_name:
             return
-        data_dir = os.path.join(base_dir, self._dir_name)
-        if not os.path.isdir(data_dir):
-            os.mkdir(data_dir)
+        data_dir = os.path.join(self._explore_eval_dir, self._dir_name)
+        os.makedirs(data_dir, exist_ok=True)
 
         # specify data name
-        exp_name = "%d.pkl"%self._epoch
+        exp_name = "%d.npz"%self._epoch
         path = os.path.join(data_dir, exp_name)
 
-        evaluation_size = 3000
-        action_repeat = 20
         batch = self.sampler.random_batch(evaluation_size)
         obs = batch['observations']
-        actions_repeat = [self._policy.actions_np(obs) for _ in range(action_repeat)]
+        num_obs = len(obs)
+
+        ## [ action_repeat * num_obs, ... ], action-major
+        obs_repeat = np.tile(obs, (action_repeat, 1))
+        actions_repeat = self._policy.actions_np(obs_repeat)
 
         Qs = []
-        policy_std = []
-        for action in actions_repeat:
-            Q = []
-            for (s,a) in zip(obs, action):
-                s, a = np.array(s).reshape(1, -1), np.array(a).reshape(1, -1)
-                Q.append(
-                    self._session.run(
-                        self._Q_values,
-                        feed_dict = {
-                            self._observations_ph: s,
-                            self._actions_ph: a
-                        }
-                    )
-                )
-            Qs.append(Q)
-        Qs = np.array(Qs).squeeze()
+        for start in range(0, len(obs_repeat), max_batch_size):
+            Qs.append(np.concatenate(
+                self._session.run(
+                    self._Q_values,
+                    feed_dict = {
+                        self._observations_ph: obs_repeat[start:start + max_batch_size],
+                        self._actions_ph: actions_repeat[start:start + max_batch_size]
+                    }
+                ),
+                axis=-1
+            ))
+        ## [ action_repeat, num_obs, num_Q ]
+        Qs = np.concatenate(Qs, axis=0).reshape(action_repeat, num_obs, -1)
         Qs_mean_action = np.mean(Qs, axis = 0) # Compute mean across different actions of one given state.
         if self._cross_grp_diff_batch:
             inter_grp_q_stds = [np.std(Qs_mean_action[:, i * self._num_Q_per_grp:(i+1) * self._num_Q_per_grp], axis = 1) for i in range(self._num_Q_grp)]
@@ -439,7 +579,8 @@ class MBPO(RLAlgorithm):
         else:
             q_std = np.std(Qs_mean_action, axis=1) # In fact V std
 
-        policy_std = [np.prod(np.exp(self._policy.policy_log_scale_model.predict(np.array(s).reshape(1,-1)))) for s in obs]
+        policy_log_scale = self._policy.policy_log_scale_model.predict(obs, batch_size=max_batch_size)
+        policy_std = np.prod(np.exp(policy_log_scale), axis=-1)
 
         if self._cross_grp_diff_batch:
             data = { 
@@ -454,8 +595,7 @@ class MBPO(RLAlgorithm):
                 'q_std': q_std,
                 'pi_std': policy_std
             }
-        with open(path, 'wb') as f:
-            pickle.dump(data, f)
+        np.savez(path, **data)
         print("==========================================")
 
 
@@ -504,23 +644,45 @@ class MBPO(RLAlgorithm):
             print('[ MBPO ] Initializing new model pool with size {:.2e}'.format(
                 new_pool_size
             ))
-            self._model_pool = SimpleReplayPool(obs_space, act_space, new_pool_size)
+            self._model_pool = POOL_CLASSES[self._model_pool_params['type']](
+                obs_space, act_space, new_pool_size,
+                **self._model_pool_params.get('kwargs', {}))
         
         elif self._model_pool._max_size != new_pool_size:
             print('[ MBPO ] Updating model pool | {:.2e} --> {:.2e}'.format(
                 self._model_pool._max_size, new_pool_size
             ))
-            samples = self._model_pool.return_all_samples()
-            new_pool = SimpleReplayPool(obs_space, act_space, new_pool_size)
-            new_pool.add_samples(samples)
-            assert self._model_pool.size == new_pool.size
-            self._model_pool = new_pool
+            ## resize in place instead of copying into a fresh pool, which
+            ## would hold two full pools in memory at once
+            resize_stats = self._model_pool.resize(new_pool_size)
+            print('[ MBPO ] Model pool resize | peak memory: {:.2e} bytes ({:.2e} --> {:.2e})'.format(
+                resize_stats['peak_bytes'], resize_stats['before_bytes'], resize_stats['after_bytes']
+            ))
+            return {'model_pool_resize_peak_bytes': resize_stats['peak_bytes']}
+
+        return {}
 
     def _train_model(self, **kwargs):
+        if self._incremental_model_training:
+            return self._train_model_incremental(**kwargs)
+
         env_samples = self._pool.return_all_samples()
         # train_inputs, train_outputs = format_samples_for_training(env_samples, self.multigoal)
         train_inputs, train_outputs = format_samples_for_training(env_samples)
-        model_metrics = self._model.train(train_inputs, train_outputs, **kwargs)
+        model_metrics = self._model.train(train_inputs, train_outputs, in_graph_batches=self._model_train_in_graph, **kwargs)
+        return model_metrics
+
+    def _train_model_incremental(self, **kwargs):
+        ## samples in insertion order, so that the newest are at the end
+        env_samples = self._pool.last_n_batch(self._pool.size)
+        ## the sampler only writes to the pool when a path ends, so count the rows the pool received
+        num_new = self._pool.total_samples - self._model_train_samples
+        self._model_train_samples = self._pool.total_samples
+
+        train_inputs, train_outputs = format_samples_for_training(env_samples)
+        model_metrics = self._model.train_incremental(
+            train_inputs, train_outputs, num_new,
+            max_epoch_rows=self._model_train_max_epoch_rows, **kwargs)
         return model_metrics
 
     def _rollout_model(self, rollout_batch_size, **kwargs):
@@ -533,7 +695,14 @@ class MBPO(RLAlgorithm):
         obs = batch['observations']
         steps_added = []
         sampled_actions = []
+        if self._graph_rollout:
+            self._model.copy_vars_to(self._session)
         for _ in range(self._sample_repeat):
+            if self._graph_rollout:
+                ## every repeat starts from the sampled batch of start states
+                steps_added.append(self._rollout_model_graph(obs))
+                continue
+
             for i in range(self._rollout_length):
                 # TODO: alter policy distribution in different times of sample repeating
                 # self._policy: softlearning.policies.gaussian_policy.FeedforwardGaussianPolicy
@@ -544,7 +713,7 @@ class MBPO(RLAlgorithm):
                 act = self._policy.actions_np(obs)
                 sampled_actions.append(act)
                 
-                next_obs, rew, term, info = self.fake_env.step(obs, act, **kwargs)
+                next_obs, rew, term, info = self.fake_env.step(obs, act, fused=self._fused_rollout, info_keys=(), **kwargs)
                 steps_added.append(len(obs))
 
                 samples = {'observations': obs, 'actions': act, 'next_observations': next_obs, 'rewards': rew, 'terminals': term}
@@ -560,11 +729,56 @@ class MBPO(RLAlgorithm):
 
         mean_rollout_length = sum(steps_added) / rollout_batch_size
         rollout_stats = {'mean_rollout_length': mean_rollout_length}
+        log_metrics(
+            'model_rollout',
+            epoch=self._epoch,
+            timestep=self._total_timestep,
+            rollout_length=self._rollout_length,
+            steps_added=sum(steps_added),
+            mean_rollout_length=mean_rollout_length,
+            model_pool_size=self._model_pool.size)
         print('[ Model Rollout ] Added: {:.1e} | Model pool: {:.1e} (max {:.1e}) | Length: {} | Train rep: {}'.format(
             sum(steps_added), self._model_pool.size, self._model_pool._max_size, mean_rollout_length, self._n_train_repeat
         ))
         return rollout_stats
 
+    def _init_rollout(self):
+        self._rollout_observations_ph = tf.placeholder(
+            tf.float32,
+            shape=(None, *self._observation_shape),
+            name='rollout_observations',
+        )
+        self._rollout_length_ph = tf.placeholder(
+            tf.int32, shape=(), name='rollout_length')
+        self._rollout_elite_inds_ph = tf.placeholder(
+            tf.int32, shape=(None, ), name='rollout_elite_inds')
+
+        self._rollout_ops = self.fake_env.rollout_ph(
+            self._rollout_observations_ph,
+            self._policy,
+            self._rollout_length_ph,
+            self._rollout_elite_inds_ph,
+            deterministic=self._deterministic)
+
+    def _rollout_model_graph(self, obs):
+        rollout = self._session.run(
+            self._rollout_ops,
+            feed_dict={
+                self._rollout_observations_ph: obs,
+                self._rollout_length_ph: self._rollout_length,
+                self._rollout_elite_inds_ph: self._model._model_inds,
+            })
+
+        ## [ rollout_length, batch_size, ... ] --> [ rollout_length * batch_size, ... ]
+        alive = rollout.pop('alive').reshape(-1)
+        samples = {
+            key: value.reshape(alive.shape[0], *value.shape[2:])
+            for key, value in rollout.items()
+        }
+        self._model_pool.add_selected_samples(samples, np.flatnonzero(alive))
+
+        return alive.sum()
+
     def _visualize_model(self, env, timestep):
         ## save env state
         state = env.unwrapped.state_vector()
@@ -578,7 +792,40 @@ class MBPO(RLAlgorithm):
         ## set env state
         env.unwrapped.set_state(qpos, qvel)
 
+    @contextmanager
+    def _pools_paused(self, invalidate=False):
+        """Keeps the prefetching thread away from the pools while they are written."""
+        if self._prefetcher is None:
+            yield
+        else:
+            with self._prefetcher.paused(invalidate=invalidate):
+                yield
+
+    def _do_sampling(self, timestep):
+        with self._pools_paused():
+            total_samples = self._pool.total_samples
+            super(MBPO, self)._do_sampling(timestep)
+            ## batches prefetched before would miss the samples that just reached the pool
+            if self._prefetcher is not None and self._pool.total_samples != total_samples:
+                self._prefetcher.invalidate()
+
+    @property
+    def _prefetching(self):
+        ## the model pool only exists after the first model rollout
+        return self._prefetcher is not None and (
+            self._real_ratio >= 1.0 or hasattr(self, '_model_pool'))
+
     def _training_batch(self, batch_size=None):
+        if self._prefetching and batch_size is None and self._staged_training_batches == 1:
+            return self._prefetcher.get()
+        return self._sample_training_batch(batch_size)
+
+    def _staged_training_batch(self):
+        if self._prefetching:
+            return self._prefetcher.get()
+        return self._sample_staged_batches()
+
+    def _sample_training_batch(self, batch_size=None):
         batch_size = batch_size or self.sampler._batch_size
         env_batch_size = int(batch_size*self._real_ratio)
         model_batch_size = batch_size - env_batch_size
@@ -600,6 +847,30 @@ class MBPO(RLAlgorithm):
             batch = env_batch
         return batch, env_batch
 
+    def _sample_staged_batches(self):
+        """Draws the batches of `staged_training_batches` iterations with a single sample per pool.
+
+        Returns the mixed and the env batches like `_sample_training_batch`, with every field
+        stacked to shape [staged_training_batches, batch_size, ...].
+        """
+        num_batches = self._staged_training_batches
+        batch_size = self.sampler._batch_size
+        env_batch_size = int(batch_size*self._real_ratio)
+        model_batch_size = batch_size - env_batch_size
+
+        ## the rows are drawn independently, so consecutive runs of them are batches
+        def stack(batch, size):
+            return {k: v.reshape(num_batches, size, *v.shape[1:]) for k, v in batch.items()}
+
+        env_batches = stack(self._pool.random_batch(num_batches * env_batch_size), env_batch_size)
+
+        if model_batch_size > 0:
+            model_batches = stack(self._model_pool.random_batch(num_batches * model_batch_size), model_batch_size)
+            batches = {k: np.concatenate((env_batches[k], model_batches[k]), axis=1) for k in env_batches.keys()}
+        else:
+            batches = env_batches
+        return batches, env_batches
+
     def _init_global_step(self):
         self.global_step = training_util.get_or_create_global_step()
         self._training_ops.update({
@@ -664,27 +935,53 @@ class MBPO(RLAlgorithm):
                 name='raw_actions',
             )
 
-    def _get_Q_target(self):
-        next_actions = self._policy.actions([self._next_observations_ph])
+        ## the batch fields the losses are built on
+        self._batch_phs = {
+            'observations': self._observations_ph,
+            'actions': self._actions_ph,
+            'next_observations': self._next_observations_ph,
+            'rewards': self._rewards_ph,
+            'terminals': self._terminals_ph,
+        }
+
+    def _get_Q_target(self, batch):
+        next_observations = batch['next_observations']
+        next_actions = self._policy.actions([next_observations])
         next_log_pis = self._policy.log_pis(
-            [self._next_observations_ph], next_actions)
+            [next_observations], next_actions)
 
-        next_Qs_values = tuple(
-            Q([self._next_observations_ph, next_actions])
-            for Q in self._Q_targets)
+        next_Qs_values = self._Q_heads(
+            self._Q_targets, [next_observations, next_actions])
         Qs_subset = np.random.choice(next_Qs_values, self._Q_elites, replace=False).tolist()
         
         # Line 8 of REDQ: min over M random indices
         min_next_Q = tf.reduce_min(Qs_subset, axis=0)
-        next_value = min_next_Q - self._alpha * next_log_pis
+        ## alpha is read where the target is built, e.g. in every step of staged training
+        next_value = min_next_Q - tf.exp(self._log_alpha) * next_log_pis
 
         Q_target = td_target(
-            reward=self._reward_scale * self._rewards_ph,
+            reward=self._reward_scale * batch['rewards'],
             discount=self._discount,
-            next_value=(1 - self._terminals_ph) * next_value)
+            next_value=(1 - batch['terminals']) * next_value)
 
         return Q_target
 
+    def _critic_losses(self, batch):
+        """Returns the values and the TD losses of all the Q heads on `batch`."""
+        Q_target = tf.stop_gradient(self._get_Q_target(batch))
+
+        assert Q_target.shape.as_list() == [None, 1]
+
+        Q_values = self._Q_heads(
+            self._Qs, [batch['observations'], batch['actions']])
+
+        Q_losses = tuple(
+            tf.losses.mean_squared_error(
+                labels=Q_target, predictions=Q_value, weights=0.5)
+            for Q_value in Q_values)
+
+        return Q_values, Q_losses
+
     def _init_critic_update(self):
         """Create minimization operation for critic Q-function.
 
@@ -692,18 +989,12 @@ class MBPO(RLAlgorithm):
         critic Q-function with gradient descent, and appends it to
         `self._training_ops` attribute.
         """
-        Q_target = tf.stop_gradient(self._get_Q_target())
-
-        assert Q_target.shape.as_list() == [None, 1]
+        Q_values, Q_losses = self._critic_losses(self._batch_phs)
+        self._Q_values, self._Q_losses = Q_values, Q_losses
 
-        Q_values = self._Q_values = tuple(
-            Q([self._observations_ph, self._actions_ph])
-            for Q in self._Qs)
-
-        Q_losses = self._Q_losses = tuple(
-            tf.losses.mean_squared_error(
-                labels=Q_target, predictions=Q_value, weights=0.5)
-            for Q_value in Q_values)
+        if self._batched_Q:
+            self._init_batched_critic_update(Q_losses)
+            return
 
         self._Q_optimizers = tuple(
             tf.train.AdamOptimizer(
@@ -729,16 +1020,77 @@ class MBPO(RLAlgorithm):
         self._training_ops.update({'Q': tf.group(Q_training_ops)})
         if self._cross_grp_diff_batch:
             assert len(Q_training_ops) >= self._num_Q_grp * self._num_Q_per_grp
+            ## groups hold num_Q_per_grp heads each, the last one also any extra heads
             for i in range(self._num_Q_grp - 1):
                 self._critic_training_ops[i].update({
-                    'Q': tf.group(Q_training_ops[i * self._num_Q_grp: (i+1) * self._num_Q_grp])
+                    'Q': tf.group(Q_training_ops[i * self._num_Q_per_grp: (i+1) * self._num_Q_per_grp])
                 })
 
             self._critic_training_ops[self._num_Q_grp - 1].update({
-                'Q': tf.group(Q_training_ops[(self._num_Q_grp - 1) * self._num_Q_grp:])
+                'Q': tf.group(Q_training_ops[(self._num_Q_grp - 1) * self._num_Q_per_grp:])
             })
+            self._Q_group_losses = [
+                Q_losses[i * self._num_Q_per_grp: (i+1) * self._num_Q_per_grp]
+                for i in range(self._num_Q_grp - 1)
+            ] + [Q_losses[(self._num_Q_grp - 1) * self._num_Q_per_grp:]]
         else:
             self._critic_training_ops.update({'Q': tf.group(Q_training_ops)})
+            self._Q_group_losses = [Q_losses]
+
+    def _Q_heads(self, Qs, inputs):
+        """Returns the outputs of all the Q heads, each of shape [None, 1]."""
+        return tuple(
+            Q_value
+            for Q in Qs
+            for Q_value in tf.split(Q(inputs), int(Q.output_shape[-1]), axis=-1))
+
+    def _init_batched_critic_update(self, Q_losses):
+        """Create one update op per group of heads of a batched ensemble Q.
+
+        The loss of a group does not depend on the weight slices of the other
+        heads, so their gradients are zero. Each group has its own optimizer,
+        whose moments for those slices therefore stay zero as well, and the
+        other heads are left exactly unchanged by the group's update.
+        """
+        Q, = self._Qs
+
+        if self._cross_grp_diff_batch:
+            num_groups, heads_per_group = self._num_Q_grp, self._num_Q_per_grp
+        else:
+            num_groups, heads_per_group = 1, self._Q_ensemble
+        assert num_groups * heads_per_group <= self._Q_ensemble
+
+        self._Q_group_losses = [
+            Q_losses[i * heads_per_group:(i+1) * heads_per_group]
+            for i in range(num_groups - 1)
+        ] + [Q_losses[(num_groups - 1) * heads_per_group:]]
+        group_losses = [tf.add_n(Q_losses) for Q_losses in self._Q_group_losses]
+
+        self._Q_optimizers = tuple(
+            tf.train.AdamOptimizer(
+                learning_rate=self._Q_lr,
+                name='{}_{}_optimizer'.format(Q._name, i)
+            ) for i in range(num_groups))
+
+        Q_training_ops = tuple(
+            tf.contrib.layers.optimize_loss(
+                group_loss,
+                self.global_step,
+                learning_rate=self._Q_lr,
+                optimizer=Q_optimizer,
+                variables=Q.trainable_variables,
+                increment_global_step=False,
+                summaries=((
+                    "loss", "gradients", "gradient_norm", "global_gradient_norm"
+                ) if self._tf_summaries else ()))
+            for group_loss, Q_optimizer in zip(group_losses, self._Q_optimizers))
+
+        self._training_ops.update({'Q': tf.group(Q_training_ops)})
+        if self._cross_grp_diff_batch:
+            for i, Q_training_op in enumerate(Q_training_ops):
+                self._critic_training_ops[i].update({'Q': Q_training_op})
+        else:
+            self._critic_training_ops.update({'Q': Q_training_ops[0]})
 
     def _init_actor_update(self):
         """Create minimization operations for policy and entropy.
@@ -747,22 +1099,16 @@ class MBPO(RLAlgorithm):
         policy and entropy with gradient descent, and adds them to
         `self._training_ops` attribute.
         """
-
-        actions = self._policy.actions([self._observations_ph])
-        log_pis = self._policy.log_pis([self._observations_ph], actions)
-
-        assert log_pis.shape.as_list() == [None, 1]
-
         log_alpha = self._log_alpha = tf.get_variable(
             'log_alpha',
             dtype=tf.float32,
             initializer=0.0)
-        alpha = tf.exp(log_alpha)
+        self._alpha = tf.exp(log_alpha)
 
-        if isinstance(self._target_entropy, Number):
-            alpha_loss = -tf.reduce_mean(
-                log_alpha * tf.stop_gradient(log_pis + self._target_entropy))
+        policy_loss, alpha_loss = self._actor_losses(self._observations_ph)
+        self._policy_loss = policy_loss
 
+        if alpha_loss is not None:
             self._alpha_optimizer = tf.train.AdamOptimizer(
                 self._policy_lr, name='alpha_optimizer')
             self._alpha_train_op = self._alpha_optimizer.minimize(
@@ -775,7 +1121,36 @@ class MBPO(RLAlgorithm):
                 'temperature_alpha': self._alpha_train_op
             })
 
-        self._alpha = alpha
+        self._policy_optimizer = tf.train.AdamOptimizer(
+            learning_rate=self._policy_lr,
+            name="policy_optimizer")
+        policy_train_op = tf.contrib.layers.optimize_loss(
+            policy_loss,
+            self.global_step,
+            learning_rate=self._policy_lr,
+            optimizer=self._policy_optimizer,
+            variables=self._policy.trainable_variables,
+            increment_global_step=False,
+            summaries=(
+                "loss", "gradients", "gradient_norm", "global_gradient_norm"
+            ) if self._tf_summaries else ())
+
+        self._training_ops.update({'policy_train_op': policy_train_op})
+        self._actor_training_ops.update({'policy_train_op': policy_train_op})
+
+    def _actor_losses(self, observations):
+        """Returns the policy loss and the temperature loss on `observations`.
+        The temperature loss is None if the temperature is not learned."""
+        actions = self._policy.actions([observations])
+        log_pis = self._policy.log_pis([observations], actions)
+
+        assert log_pis.shape.as_list() == [None, 1]
+
+        alpha = tf.exp(self._log_alpha)
+        alpha_loss = None
+        if isinstance(self._target_entropy, Number):
+            alpha_loss = -tf.reduce_mean(
+                self._log_alpha * tf.stop_gradient(log_pis + self._target_entropy))
 
         if self._action_prior == 'normal':
             policy_prior = tf.contrib.distributions.MultivariateNormalDiag(
@@ -785,9 +1160,7 @@ class MBPO(RLAlgorithm):
         elif self._action_prior == 'uniform':
             policy_prior_log_probs = 0.0
 
-        Q_log_targets = tuple(
-            Q([self._observations_ph, actions])
-            for Q in self._Qs)
+        Q_log_targets = self._Q_heads(self._Qs, [observations, actions])
         assert len(Q_log_targets) == self._Q_ensemble
 
         min_Q_log_target = tf.reduce_min(Q_log_targets, axis=0)
@@ -804,38 +1177,143 @@ class MBPO(RLAlgorithm):
 
         assert policy_kl_losses.shape.as_list() == [None, 1]
 
-        policy_loss = tf.reduce_mean(policy_kl_losses)
-
-        self._policy_optimizer = tf.train.AdamOptimizer(
-            learning_rate=self._policy_lr,
-            name="policy_optimizer")
-        policy_train_op = tf.contrib.layers.optimize_loss(
-            policy_loss,
-            self.global_step,
-            learning_rate=self._policy_lr,
-            optimizer=self._policy_optimizer,
-            variables=self._policy.trainable_variables,
-            increment_global_step=False,
-            summaries=(
-                "loss", "gradients", "gradient_norm", "global_gradient_norm"
-            ) if self._tf_summaries else ())
-
-        self._training_ops.update({'policy_train_op': policy_train_op})
-        self._actor_training_ops.update({'policy_train_op': policy_train_op})
+        return tf.reduce_mean(policy_kl_losses), alpha_loss
 
     def _init_training(self):
         self._update_target(tau=1.0)
 
+    def _init_target_update(self):
+        """Create a single op for the soft update of all the target Qs.
+
+        Keeps the Polyak averaging on the device instead of round-tripping
+        every weight through numpy with `get_weights`/`set_weights`.
+        """
+        self._target_update_tau_ph = tf.placeholder_with_default(
+            tf.constant(self._tau, dtype=tf.float32),
+            shape=(),
+            name='target_update_tau')
+        tau = self._target_update_tau_ph
+
+        self._target_update_op = self._target_update(tau, 'target_update')
+
+        if self._fused_training and not self._cross_grp_diff_batch:
+            ## can be fetched in the same session call as the critic step
+            with tf.control_dependencies(list(self._critic_training_ops.values())):
+                self._fused_target_update_op = self._target_update(tau, 'fused_target_update')
+
+    def _target_update(self, tau, name=None):
+        ## read_value creates the reads under the current control
+        ## dependencies, so they see the weights after the critic step
+        return tf.group(*(
+            tf.assign(target, tau * source.read_value() + (1.0 - tau) * target.read_value())
+            for Q, Q_target in zip(self._Qs, self._Q_targets)
+            for source, target in zip(Q.weights, Q_target.weights)
+        ), name=name)
+
+    def _init_staged_training(self):
+        """Create the placeholders of the stacked batches consumed by staged training."""
+        def staged_batch_phs(name):
+            return {
+                'observations': tf.placeholder(
+                    tf.float32, shape=(None, None, *self._observation_shape),
+                    name='{}_observations'.format(name)),
+                'actions': tf.placeholder(
+                    tf.float32, shape=(None, None, *self._action_shape),
+                    name='{}_actions'.format(name)),
+                'next_observations': tf.placeholder(
+                    tf.float32, shape=(None, None, *self._observation_shape),
+                    name='{}_next_observations'.format(name)),
+                'rewards': tf.placeholder(
+                    tf.float32, shape=(None, None, 1),
+                    name='{}_rewards'.format(name)),
+                'terminals': tf.placeholder(
+                    tf.float32, shape=(None, None, 1),
+                    name='{}_terminals'.format(name)),
+            }
+
+        self._staged_num_steps_ph = tf.placeholder(
+            tf.int32, shape=(), name='staged_num_steps')
+        self._staged_batch_phs = staged_batch_phs('staged')
+        self._staged_critic_batch_phs = (
+            self._staged_batch_phs if self._critic_same_as_actor
+            else staged_batch_phs('staged_critic'))
+        ## built on first use, one per combination of updates due at an iteration
+        self._staged_training_ops = {}
+
+    def _staged_training_op(self, train_actor, train_critic, update_target):
+        """Returns the fetches running the first `num_steps` staged batches through the
+        actor, critic and target updates in one session call.
+
+        The losses and updates are built inside the tf.while_loop body, so that every step
+        reads the weights written by the previous one, in the same order as `_do_training`.
+        """
+        key = (train_actor, train_critic, update_target)
+        if key in self._staged_training_ops:
+            return self._staged_training_ops[key]
+
+        def train_step(step, policy_loss_sum, Q_loss_sum):
+            batch = {name: values[step] for name, values in self._staged_batch_phs.items()}
+            critic_batch = {name: values[step] for name, values in self._staged_critic_batch_phs.items()}
+
+            updates = []
+            if train_actor:
+                policy_loss, alpha_loss = self._actor_losses(batch['observations'])
+                updates.append(self._policy_optimizer.minimize(
+                    policy_loss, var_list=self._policy.trainable_variables))
+                if alpha_loss is not None:
+                    updates.append(self._alpha_optimizer.minimize(
+                        alpha_loss, var_list=[self._log_alpha]))
+                policy_loss_sum += policy_loss
+
+            if train_critic:
+                with tf.control_dependencies(updates):
+                    _, Q_losses = self._critic_losses(critic_batch)
+                    if self._batched_Q:
+                        Q, = self._Qs
+                        updates = [self._Q_optimizers[0].minimize(
+                            tf.add_n(Q_losses), var_list=Q.trainable_variables)]
+                    else:
+                        updates = [
+                            Q_optimizer.minimize(Q_loss, var_list=Q.trainable_variables)
+                            for Q, Q_loss, Q_optimizer in zip(self._Qs, Q_losses, self._Q_optimizers)
+                        ]
+                Q_loss_sum += tf.reduce_mean(Q_losses)
+
+            if update_target:
+                with tf.control_dependencies(updates):
+                    updates = [self._target_update(self._tau)]
+
+            with tf.control_dependencies(updates):
+                return step + 1, policy_loss_sum, Q_loss_sum
+
+        steps, policy_loss_sum, Q_loss_sum = tf.while_loop(
+            lambda step, *_: step < self._staged_num_steps_ph,
+            train_step,
+            [tf.constant(0), tf.constant(0.0), tf.constant(0.0)],
+            parallel_iterations=1,
+            back_prop=False)
+
+        ## metrics are averaged over the steps of the call
+        num_steps = tf.cast(tf.maximum(steps, 1), tf.float32)
+        fetches = {
+            'increment_global_step': tf.assign_add(self.global_step, tf.cast(steps, tf.int64)),
+        }
+        if train_actor:
+            with tf.control_dependencies([steps]):
+                alpha = tf.exp(self._log_alpha.read_value())
+            fetches['actor'] = {'metrics': {'policy_loss': policy_loss_sum / num_steps, 'alpha': alpha}}
+        if train_critic:
+            fetches['critic'] = {'metrics': {'Q_loss': Q_loss_sum / num_steps}}
+
+        self._staged_training_ops[key] = fetches
+        return fetches
+
     def _update_target(self, tau=None):
         tau = tau or self._tau
 
-        for Q, Q_target in zip(self._Qs, self._Q_targets):
-            source_params = Q.get_weights()
-            target_params = Q_target.get_weights()
-            Q_target.set_weights([
-                tau * source + (1.0 - tau) * target
-                for source, target in zip(source_params, target_params)
-            ])
+        self._session.run(
+            self._target_update_op,
+            feed_dict={self._target_update_tau_ph: tau})
 
     def _do_training(self, iteration, batch):
         """Runs the operations for updating training and target ops."""
@@ -860,24 +1338,116 @@ class MBPO(RLAlgorithm):
         else:
             critic_feed_dict = self._get_feed_dict(iteration, mf_batch)
 
+        if self._fused_training:
+            self._do_fused_training(iteration, single_mix_feed_dict, critic_feed_dict)
+            return
+
         self._session.run(self._misc_training_ops, single_mix_feed_dict)
 
+        actor_results, critic_results = None, []
         if iteration % self._actor_train_freq == 0:
-            self._session.run(self._actor_training_ops, single_mix_feed_dict)
+            actor_results = self._session.run(self._actor_training_ops, single_mix_feed_dict)
         if iteration % self._critic_train_freq == 0:
             if self._cross_grp_diff_batch:
                 assert len(self._critic_training_ops) == len(critic_feed_dict)
-                [
+                critic_results = [
                     self._session.run(op, feed_dict)
                     for (op, feed_dict) in zip(self._critic_training_ops, critic_feed_dict)
                 ]
             else:
-                self._session.run(self._critic_training_ops, critic_feed_dict)
+                critic_results = [self._session.run(self._critic_training_ops, critic_feed_dict)]
+        self._log_training_metrics(iteration, actor_results, critic_results)
 
         if iteration % self._target_update_interval == 0:
             # Run target ops here.
             self._update_target()
 
+    def _do_training_steps(self, iteration, num_steps):
+        if self._staged_training_batches == 1:
+            super(MBPO, self)._do_training_steps(iteration, num_steps)
+            return
+
+        for start in range(0, num_steps, self._staged_training_batches):
+            self._do_staged_training(
+                iteration,
+                self._staged_training_batch(),
+                min(self._staged_training_batches, num_steps - start))
+
+    def _do_staged_training(self, iteration, batch, num_steps):
+        """Runs `num_steps` training iterations on the first batches of a stack in one session call."""
+        mix_batch, mf_batch = batch
+
+        self._training_progress.update(num_steps)
+        self._training_progress.set_description()
+
+        fetches = self._staged_training_op(
+            train_actor=iteration % self._actor_train_freq == 0,
+            train_critic=iteration % self._critic_train_freq == 0,
+            update_target=iteration % self._target_update_interval == 0)
+
+        feed_dict = {self._staged_num_steps_ph: num_steps}
+        feed_dict.update({
+            self._staged_batch_phs[name]: mix_batch[name]
+            for name in self._staged_batch_phs.keys()
+        })
+        if not self._critic_same_as_actor:
+            feed_dict.update({
+                self._staged_critic_batch_phs[name]: mf_batch[name]
+                for name in self._staged_critic_batch_phs.keys()
+            })
+
+        results = self._session.run(fetches, feed_dict)
+        self._log_training_metrics(
+            iteration,
+            actor_results=results.get('actor'),
+            critic_results=[results['critic']] if 'critic' in results else [])
+
+    def _do_fused_training(self, iteration, mix_feed_dict, critic_feed_dict):
+        """Runs the ops due at this iteration in as few session calls as possible.
+
+        Consecutive ops sharing a feed dict are fetched together; the target
+        update joins the critic call through a control dependency.
+        """
+        train_critic = iteration % self._critic_train_freq == 0
+
+        runs = [('misc', self._misc_training_ops, mix_feed_dict)]
+        if iteration % self._actor_train_freq == 0:
+            runs.append(('actor', self._actor_training_ops, mix_feed_dict))
+        if train_critic:
+            if self._cross_grp_diff_batch:
+                runs.extend(
+                    ('critic', critic_training_ops, feed_dict)
+                    for critic_training_ops, feed_dict in zip(self._critic_training_ops, critic_feed_dict))
+            else:
+                runs.append(('critic', self._critic_training_ops, critic_feed_dict))
+        if iteration % self._target_update_interval == 0:
+            if self._cross_grp_diff_batch:
+                ## must not race with the last critic group
+                runs.append(('target', self._target_update_op, {}))
+            elif train_critic:
+                runs.append(('target', self._fused_target_update_op, critic_feed_dict))
+            else:
+                ## no Q is trained in this call, so nothing to race with
+                runs.append(('target', self._target_update_op, runs[-1][2]))
+
+        fused_runs = []
+        for name, fetches, feed_dict in runs:
+            if fused_runs and fused_runs[-1][2] is feed_dict:
+                fused_runs[-1][0].append(name)
+                fused_runs[-1][1].append(fetches)
+            else:
+                fused_runs.append(([name], [fetches], feed_dict))
+
+        results = [
+            (name, result)
+            for names, fetches, feed_dict in fused_runs
+            for name, result in zip(names, self._session.run(fetches, feed_dict))
+        ]
+        self._log_training_metrics(
+            iteration,
+            actor_results=next((result for name, result in results if name == 'actor'), None),
+            critic_results=[result for name, result in results if name == 'critic'])
+
     def _get_feed_dict(self, iteration, batch):
         """Construct TensorFlow feed_dict from sample batch."""
 
@@ -967,7 +1537,26 @@ class MBPO(RLAlgorithm):
 
         return saveables
 
+    def checkpoint_pools(self, create=False):
+        ## the model pool is otherwise only created at the first rollout,
+        ## so a restored run creates it up front to load the saved rollouts
+        if create and not hasattr(self, '_model_pool'):
+            self._set_rollout_length()
+            self._reallocate_model_pool()
+        if not hasattr(self, '_model_pool'):
+            return {}
+        return {'model_pool': self._model_pool}
+
     def _get_latest_index(self):
         if self._model_load_dir is None:
             return
-        return max([int(i.split("_")[1].split(".")[0]) for i in os.listdir(self._model_load_dir)])
\ No newline at end of file
+        ## '.bnn' artifacts and legacy '.nns' structure files; other files
+        ## (e.g. artifacts still being written) are ignored
+        model_indices = [
+            int(match.group(1))
+            for match in map(MODEL_FILE_PATTERN.match, os.listdir(self._model_load_dir))
+            if match is not None
+        ]
+        if not model_indices:
+            raise ValueError("No saved models found in {}.".format(self._model_load_dir))
+        return max(model_indices)
\ No newline at end of file
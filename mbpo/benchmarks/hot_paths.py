@@ -0,0 +1,438 @@
+"""Micro-benchmarks of the MBPO hot paths.
+
+Times model steps, model training and prediction, replay pool writes and
+reads, model rollouts, training iterations and target updates. Every path
+runs on environments that do not need MuJoCo. One is ContinuousGrid-v0. The
+others are synthetic environments with the observation and action dimensions
+of Hopper, Walker2d and Humanoid (see mbpo/env/synthetic.py).
+
+    python -m mbpo.benchmarks.hot_paths --output baseline.json
+    python -m mbpo.benchmarks.hot_paths --baseline baseline.json
+
+Each result reports:
+- the throughput, computed from the median time of the timed calls
+- the peak python/numpy memory allocated during one call, measured with
+  tracemalloc (it does not see TensorFlow's allocator)
+- the peak resident set size of the process so far
+
+Results are only comparable between runs with the same arguments on the
+same machine.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import tensorflow as tf
+
+from softlearning.environments.utils import get_environment
+from softlearning.misc.utils import (
+    datetimestamp, get_git_rev, initialize_tf_variables, set_seed)
+from softlearning.policies.utils import get_policy_from_variant
+from softlearning.replay_pools.utils import POOL_CLASSES
+from softlearning.samplers.simple_sampler import SimpleSampler
+from softlearning.value_functions.utils import get_Q_function_from_variant
+from mbpo.algorithms.mbpo import MBPO
+from mbpo.models.constructor import format_samples_for_training
+from mbpo.utils.logging import Silent
+import mbpo.static
+
+
+## {name: environment}; the synthetic environments only share the observation
+## and action dimensions, and the termination functions, of the MuJoCo tasks
+BENCHMARK_ENVIRONMENTS = {
+    'continuousgrid': {
+        'domain': 'ContinuousGrid',
+        'task': 'v0',
+        'kwargs': {},
+        'static_fns': 'continuousgrid',
+    },
+    'hopper': {
+        'domain': 'Synthetic',
+        'task': 'v0',
+        'kwargs': {'observation_dim': 11, 'action_dim': 3},
+        'static_fns': 'hopper',
+    },
+    'walker2d': {
+        'domain': 'Synthetic',
+        'task': 'v0',
+        'kwargs': {'observation_dim': 17, 'action_dim': 6},
+        'static_fns': 'walker2d',
+    },
+    'humanoid': {
+        'domain': 'Synthetic',
+        'task': 'v0',
+        'kwargs': {'observation_dim': 45, 'action_dim': 17},
+        'static_fns': 'humanoidtruncatedobs',
+    },
+}
+
+
+def max_rss_bytes():
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    ## kilobytes on linux, bytes on macOS
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+def time_calls(fn, num_items, repeats=5, warmup=1):
+    """Times `repeats` calls of fn, each processing `num_items` items, after
+    `warmup` untimed calls. The peak memory is measured in one extra call, so
+    that tracing does not slow down the timed ones."""
+    for _ in range(warmup):
+        fn()
+
+    seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        seconds.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak_traced_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    median_seconds = float(np.median(seconds))
+    return {
+        'num_items': num_items,
+        'median_seconds': median_seconds,
+        'min_seconds': float(np.min(seconds)),
+        'seconds_per_item': median_seconds / num_items,
+        'throughput': num_items / median_seconds,
+        'peak_traced_bytes': peak_traced_bytes,
+        'max_rss_bytes': max_rss_bytes(),
+    }
+
+
+def random_samples(observation_dim, action_dim, num_samples, random_state):
+    observations = random_state.normal(
+        size=(num_samples, observation_dim)).astype(np.float32)
+    return {
+        'observations': observations,
+        'actions': random_state.uniform(
+            -1, 1, size=(num_samples, action_dim)).astype(np.float32),
+        'next_observations': observations + random_state.normal(
+            scale=0.01, size=observations.shape).astype(np.float32),
+        'rewards': random_state.normal(
+            size=(num_samples, 1)).astype(np.float32),
+        'terminals': np.zeros((num_samples, 1), dtype=bool),
+    }
+
+
+def build_algorithm(environment_params, session, args):
+    environment = get_environment(
+        'gym',
+        environment_params['domain'],
+        environment_params['task'],
+        environment_params['kwargs'])
+
+    variant = {
+        'Q_params': {
+            'type': 'double_feedforward_Q_function',
+            'kwargs': {'hidden_layer_sizes': (256, 256)},
+            'Q_ensemble': 2,
+            'Q_elite': 2,
+        },
+        'policy_params': {
+            'type': 'GaussianPolicy',
+            'kwargs': {'hidden_layer_sizes': (256, 256), 'squash': True},
+        },
+    }
+    Qs = get_Q_function_from_variant(variant, environment)
+    policy = get_policy_from_variant(variant, environment, Qs)
+    pool = POOL_CLASSES['SimpleReplayPool'](
+        environment.observation_space, environment.action_space,
+        max_size=args.pool_size)
+    sampler = SimpleSampler(
+        max_path_length=1000, min_pool_size=0,
+        batch_size=args.training_batch_size)
+
+    algorithm = MBPO(
+        training_environment=environment,
+        evaluation_environment=environment,
+        policy=policy,
+        Qs=Qs,
+        pool=pool,
+        static_fns=mbpo.static[environment_params['static_fns']],
+        sampler=sampler,
+        session=session,
+        num_networks=args.num_networks,
+        num_elites=args.num_elites,
+        num_Q_elites=2,
+        hidden_dim=args.hidden_dim,
+        real_ratio=0.05,
+        rollout_batch_size=max(args.rollout_batch_sizes),
+        rollout_schedule=[20, 100, args.rollout_length, args.rollout_length],
+        model_retain_epochs=1,
+        **args.algorithm_kwargs)
+
+    initialize_tf_variables(session, only_uninitialized=True)
+    algorithm._init_training()
+    sampler.initialize(environment, policy, pool)
+
+    return algorithm
+
+
+def benchmark_environment(name, args):
+    """Runs every benchmark on the environment `name` in a fresh graph and
+    returns the results by key."""
+    environment_params = BENCHMARK_ENVIRONMENTS[name]
+    random_state = np.random.RandomState(args.seed)
+    results = {}
+
+    def record(benchmark, params, unit, timing):
+        key = '{}/{}/{}'.format(name, benchmark, ','.join(
+            '{}={}'.format(param, value) for param, value in params.items()))
+        results[key] = dict(
+            timing, environment=name, benchmark=benchmark, params=params, unit=unit)
+        print('[ benchmark ] {:<64} {:>12.1f} {}/s | peak traced memory {:.2e} bytes'.format(
+            key, timing['throughput'], unit, timing['peak_traced_bytes']))
+
+    tf.reset_default_graph()
+    tf.keras.backend.clear_session()
+    set_seed(args.seed)
+    session = tf.Session(config=tf.ConfigProto(
+        gpu_options=tf.GPUOptions(allow_growth=True)))
+    tf.keras.backend.set_session(session)
+
+    algorithm = build_algorithm(environment_params, session, args)
+    observation_dim = int(np.prod(algorithm._observation_shape))
+    action_dim = int(np.prod(algorithm._action_shape))
+    observation_space = algorithm._pool._observation_space
+    action_space = algorithm._pool._action_space
+
+    #### replay pools
+    for pool_type in args.pool_types:
+        pool = POOL_CLASSES[pool_type](
+            observation_space, action_space, args.pool_size)
+        pool.add_samples(random_samples(
+            observation_dim, action_dim, args.pool_size, random_state))
+
+        samples = random_samples(
+            observation_dim, action_dim, args.add_batch_size, random_state)
+        record(
+            'pool_add_samples',
+            {'pool_type': pool_type, 'batch_size': args.add_batch_size},
+            'samples',
+            time_calls(
+                lambda: pool.add_samples(samples),
+                args.add_batch_size, repeats=args.repeats))
+
+        for batch_size in args.sample_batch_sizes:
+            record(
+                'pool_random_batch',
+                {'pool_type': pool_type, 'batch_size': batch_size},
+                'samples',
+                time_calls(
+                    lambda: pool.random_batch(batch_size),
+                    batch_size, repeats=args.repeats))
+        del pool
+
+    #### model
+    algorithm._pool.add_samples(random_samples(
+        observation_dim, action_dim, args.env_samples, random_state))
+    train_inputs, train_targets = format_samples_for_training(
+        algorithm._pool.return_all_samples())
+    model = algorithm._model
+
+    for in_graph_batches in (False, True):
+        ## no early stopping, every call runs all epochs
+        record(
+            'bnn_train',
+            {'num_samples': args.env_samples, 'in_graph_batches': in_graph_batches},
+            'epochs',
+            time_calls(
+                lambda: model.train(
+                    train_inputs, train_targets,
+                    batch_size=256,
+                    max_epochs=args.train_epochs,
+                    max_epochs_since_update=args.train_epochs,
+                    holdout_ratio=0.2,
+                    in_graph_batches=in_graph_batches),
+                args.train_epochs, repeats=args.repeats))
+
+    for batch_size in args.batch_sizes:
+        inputs = random_state.normal(
+            size=(batch_size, observation_dim + action_dim))
+        record(
+            'bnn_predict',
+            {'batch_size': batch_size},
+            'samples',
+            time_calls(
+                lambda: model.predict(inputs, factored=True),
+                batch_size, repeats=args.repeats))
+
+    for batch_size in args.batch_sizes:
+        samples = random_samples(
+            observation_dim, action_dim, batch_size, random_state)
+        for fused in (False, True):
+            record(
+                'fake_env_step',
+                {'batch_size': batch_size, 'fused': fused},
+                'samples',
+                time_calls(
+                    lambda: algorithm.fake_env.step(
+                        samples['observations'], samples['actions'],
+                        fused=fused, info_keys=()),
+                    batch_size, repeats=args.repeats))
+
+    #### algorithm
+    algorithm._set_rollout_length()
+    algorithm._reallocate_model_pool()
+    for rollout_batch_size in args.rollout_batch_sizes:
+        record(
+            'mbpo_rollout_model',
+            {'rollout_batch_size': rollout_batch_size,
+             'rollout_length': args.rollout_length},
+            'samples',
+            time_calls(
+                lambda: algorithm._rollout_model(
+                    rollout_batch_size=rollout_batch_size),
+                rollout_batch_size * args.rollout_length,
+                repeats=args.repeats))
+
+    ## batches are drawn up front, so that only the training ops are timed
+    algorithm._training_progress = Silent()
+    batches = [
+        algorithm._training_batch()
+        for _ in range(args.training_iterations)
+    ]
+
+    def do_training():
+        for iteration, batch in enumerate(batches):
+            algorithm._do_training(iteration, batch)
+
+    record(
+        'mbpo_do_training',
+        {'batch_size': args.training_batch_size},
+        'iterations',
+        time_calls(
+            do_training, args.training_iterations, repeats=args.repeats))
+
+    def update_target():
+        for _ in range(args.target_updates):
+            algorithm._update_target()
+
+    record(
+        'mbpo_update_target',
+        {},
+        'updates',
+        time_calls(update_target, args.target_updates, repeats=args.repeats))
+
+    model.sess.close()
+    session.close()
+    return results
+
+
+def compare_to_baseline(results, baseline_results, tolerance):
+    """Prints the change of every result relative to the baseline and returns
+    the keys whose throughput dropped by more than `tolerance`."""
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline_results:
+            print('[ baseline ] {:<64} not in baseline'.format(key))
+            continue
+
+        baseline = baseline_results[key]
+        speedup = result['throughput'] / baseline['throughput']
+        memory_ratio = (
+            result['peak_traced_bytes'] / baseline['peak_traced_bytes']
+            if baseline['peak_traced_bytes'] else float('nan'))
+        print('[ baseline ] {:<64} throughput x{:.2f} | peak traced memory x{:.2f}'.format(
+            key, speedup, memory_ratio))
+
+        if speedup < 1 - tolerance:
+            regressions.append(key)
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--environments', nargs='+',
+                        default=list(BENCHMARK_ENVIRONMENTS),
+                        choices=list(BENCHMARK_ENVIRONMENTS))
+    parser.add_argument('--output', type=str, default=None,
+                        help='JSON file the results are written to.')
+    parser.add_argument('--baseline', type=str, default=None,
+                        help='JSON results of an earlier run to compare to.')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='Relative throughput drop reported as a regression.')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+
+    parser.add_argument('--batch_sizes', type=int, nargs='+',
+                        default=[1000, 10000, 100000],
+                        help='Batch sizes of BNN.predict and FakeEnv.step.')
+    parser.add_argument('--pool_types', nargs='+',
+                        default=['SimpleReplayPool'],
+                        choices=['SimpleReplayPool', 'MemmapReplayPool', 'CompactReplayPool'])
+    parser.add_argument('--pool_size', type=int, default=int(1e5))
+    parser.add_argument('--add_batch_size', type=int, default=1000)
+    parser.add_argument('--sample_batch_sizes', type=int, nargs='+',
+                        default=[256, 10000])
+
+    parser.add_argument('--num_networks', type=int, default=7)
+    parser.add_argument('--num_elites', type=int, default=5)
+    parser.add_argument('--hidden_dim', type=int, default=200)
+    parser.add_argument('--env_samples', type=int, default=10000,
+                        help='Size of the model training set.')
+    parser.add_argument('--train_epochs', type=int, default=5)
+
+    parser.add_argument('--rollout_batch_sizes', type=int, nargs='+',
+                        default=[10000, 100000])
+    parser.add_argument('--rollout_length', type=int, default=1)
+    parser.add_argument('--training_batch_size', type=int, default=256)
+    parser.add_argument('--training_iterations', type=int, default=100)
+    parser.add_argument('--target_updates', type=int, default=1000)
+    parser.add_argument('--algorithm_kwargs', type=json.loads, default={},
+                        help='Extra MBPO kwargs as JSON, e.g. \'{"fused_training": true}\'.')
+    args = parser.parse_args()
+
+    output_path = os.path.abspath(
+        args.output or 'hot_paths-{}.json'.format(datetimestamp()))
+    git_rev = get_git_rev()
+
+    ## MBPO logs to the working directory
+    cwd = os.getcwd()
+    results = {}
+    with tempfile.TemporaryDirectory() as log_dir:
+        os.chdir(log_dir)
+        try:
+            for name in args.environments:
+                results.update(benchmark_environment(name, args))
+        finally:
+            os.chdir(cwd)
+
+    with open(output_path, 'w') as f:
+        json.dump({
+            'created': datetimestamp(),
+            'git_rev': git_rev,
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'tensorflow': tf.__version__,
+            'args': vars(args),
+            'results': results,
+        }, f, indent=2, sort_keys=True)
+    print('[ benchmark ] Results written to {}'.format(output_path))
+
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as f:
+            baseline_results = json.load(f)['results']
+        regressions = compare_to_baseline(results, baseline_results, args.tolerance)
+        if regressions:
+            raise SystemExit('Throughput regressed by more than {:.0%}: {}'.format(
+                args.tolerance, regressions))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,30 @@
+import gym
+from gym import spaces
+import numpy as np
+
+
+class SyntheticEnv(gym.Env):
+    """Stand-in environment with the observation and action dimensions of a
+    larger task and cheap random-walk dynamics. Used where only the shapes
+    of a task matter, e.g. for benchmarks without MuJoCo."""
+
+    def __init__(self, observation_dim=11, action_dim=3, seed=0):
+        super(SyntheticEnv, self).__init__()
+        self.observation_space = spaces.Box(
+            low=-np.inf, high=np.inf, shape=(observation_dim, ), dtype=np.float32)
+        self.action_space = spaces.Box(
+            low=-1.0, high=1.0, shape=(action_dim, ), dtype=np.float32)
+
+        self._random_state = np.random.RandomState(seed)
+        self._state = None
+
+    def step(self, action):
+        noise = self._random_state.normal(scale=0.01, size=self._state.shape)
+        self._state = (self._state + noise).astype(np.float32)
+        reward = -float(np.sum(np.square(action)))
+        return self._state.copy(), reward, False, {}
+
+    def reset(self):
+        self._state = self._random_state.normal(
+            size=self.observation_space.shape).astype(np.float32)
+        return self._state.copy()
@@ -0,0 +1,83 @@
+"""Single-file model artifacts.
+
+Layout of a file:
+
+    8 bytes         magic, b'MBPOART\\x00'
+    8 bytes         little-endian uint64, length of the header
+    header          utf-8 JSON, padded with spaces to ALIGNMENT
+    blob            the arrays, each starting at a multiple of ALIGNMENT
+
+The header describes the model (any JSON-serializable dict) and lists every
+array in the blob with its name, dtype, shape and offset. Arrays are read as
+views of a read-only memory map, so loading only touches the pages that are
+actually used.
+"""
+import json
+import os
+import struct
+
+import numpy as np
+
+MAGIC = b'MBPOART\x00'
+VERSION = 1
+ALIGNMENT = 64
+
+
+def _align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def write_artifact(path, header, arrays):
+    """Writes `header` and the named numpy `arrays` to path. The file is
+    written next to path first and moved into place, so that readers never
+    see a partially written artifact."""
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+
+    offset, array_specs = 0, []
+    for name, array in arrays.items():
+        array_specs.append({
+            'name': name,
+            'dtype': array.dtype.str,
+            'shape': list(array.shape),
+            'offset': offset,
+        })
+        offset = _align(offset + array.nbytes)
+
+    header = dict(header, version=VERSION, arrays=array_specs)
+    header_bytes = json.dumps(header).encode('utf-8')
+    blob_start = _align(len(MAGIC) + 8 + len(header_bytes))
+    header_bytes += b' ' * (blob_start - len(MAGIC) - 8 - len(header_bytes))
+
+    tmp_path = '{}.tmp{}'.format(path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(header_bytes)))
+        f.write(header_bytes)
+        for spec, array in zip(array_specs, arrays.values()):
+            f.seek(blob_start + spec['offset'])
+            f.write(array.tobytes())
+        f.truncate(blob_start + offset)
+    os.replace(tmp_path, path)
+
+
+def read_artifact(path):
+    """Returns the header and a dict of read-only arrays mapped from path."""
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError('{} is not a model artifact.'.format(path))
+        header_length, = struct.unpack('<Q', f.read(8))
+        header = json.loads(f.read(header_length).decode('utf-8'))
+
+    if header['version'] > VERSION:
+        raise ValueError('{} has artifact version {}, only versions up to {} are supported.'.format(
+            path, header['version'], VERSION))
+
+    blob_start = len(MAGIC) + 8 + header_length
+    blob = np.memmap(path, dtype=np.uint8, mode='r')
+    arrays = {
+        spec['name']: np.ndarray(
+            shape=spec['shape'], dtype=np.dtype(spec['dtype']),
+            buffer=blob, offset=blob_start + spec['offset'])
+        for spec in header['arrays']
+    }
+    return header, arrays
@@ -11,12 +11,14 @@ from collections import OrderedDict
 import tensorflow as tf
 import numpy as np
 from tqdm import trange
-from scipy.io import savemat, loadmat
+from scipy.io import loadmat
 
 from mbpo.models.utils import get_required_argument, TensorStandardScaler
 from mbpo.models.fc import FC
+from mbpo.models.artifact import write_artifact, read_artifact
 
 from mbpo.utils.logging import Progress, Silent
+from softlearning.utils.metrics import log_metrics
 
 np.set_printoptions(precision=5)
 
@@ -60,6 +62,7 @@ class BNN:
         self.decays, self.optvars, self.nonoptvars = [], [], []
         self.end_act, self.end_act_name = None, None
         self.scaler = None
+        self._artifact = None
 
         # Training objects
         self.optimizer = None
@@ -70,6 +73,10 @@ class BNN:
         self.sy_pred_in2d, self.sy_pred_mean2d_fac, self.sy_pred_var2d_fac = None, None, None
         self.sy_pred_mean2d, self.sy_pred_var2d = None, None
         self.sy_pred_in3d, self.sy_pred_mean3d_fac, self.sy_pred_var3d_fac = None, None, None
+        self.sy_pred_inds, self.sy_pred_mean_inds, self.sy_pred_var_inds = None, None, None
+
+        # Incremental training state, per row of the dataset
+        self._data_holdout, self._data_counts = None, None
 
         if params.get('load_model', False):
             if self.model_dir is None:
@@ -189,15 +196,41 @@ class BNN:
             self.sy_train_targ = tf.placeholder(dtype=tf.float32,
                                                 shape=[self.num_nets, None, self.layers[-1].get_output_dim() // 2],
                                                 name="training_targets")
-            train_loss = tf.reduce_sum(self._compile_losses(self.sy_train_in, self.sy_train_targ, inc_var_loss=True))
-            train_loss += tf.add_n(self.decays)
-            train_loss += 0.01 * tf.reduce_sum(self.max_logvar) - 0.01 * tf.reduce_sum(self.min_logvar)
+            train_loss = self._compile_train_loss(self.sy_train_in, self.sy_train_targ)
             self.mse_loss = self._compile_losses(self.sy_train_in, self.sy_train_targ, inc_var_loss=False)
 
+            # Losses of every network on one 2D batch, broadcast to the ensemble in the graph
+            self.sy_train_in2d = tf.placeholder(dtype=tf.float32,
+                                                shape=[None, self.layers[0].get_input_dim()],
+                                                name="2D_shared_inputs")
+            self.sy_train_targ2d = tf.placeholder(dtype=tf.float32,
+                                                  shape=[None, self.layers[-1].get_output_dim() // 2],
+                                                  name="2D_shared_targets")
+            self.mse_loss2d = self._compile_losses(self.sy_train_in2d, self.sy_train_targ2d, inc_var_loss=False)
+
             self.train_op = self.optimizer.minimize(train_loss, var_list=self.optvars)
 
+        # Set up training on a dataset that is uploaded to the graph once per train call, with the
+        # bootstrap indices drawn and shuffled in the graph
+        with tf.variable_scope(self.name):
+            self._construct_dataset_ops()
+            self._construct_holdout_ops()
+
         # Initialize all variables
         self.sess.run(tf.variables_initializer(self.optvars + self.nonoptvars + self.optimizer.variables()))
+        self.sess.run(tf.variables_initializer(self._dataset_vars + self._holdout_vars))
+
+        # Set up snapshots of the best networks seen during training
+        with tf.variable_scope(self.name):
+            self._snapshot_idx = tf.placeholder(tf.int32, shape=[], name="snapshot_index")
+            self._snapshot_mask = tf.placeholder(tf.bool, shape=[self.num_nets], name="snapshot_mask")
+            self._save_snapshot_ops, self._restore_snapshot_ops = [], []
+            for i, layer in enumerate(self.layers):
+                with tf.variable_scope("Layer%i" % i):
+                    save_ops, restore_ops = layer.construct_snapshot_ops(self._snapshot_idx, self._snapshot_mask)
+                    self._save_snapshot_ops.extend(save_ops)
+                    self._restore_snapshot_ops.extend(restore_ops)
+        self.sess.run(tf.variables_initializer(sum([layer.get_snapshot_vars() for layer in self.layers], [])))
 
         # Set up prediction
         with tf.variable_scope(self.name):
@@ -216,34 +249,114 @@ class BNN:
             self.sy_pred_mean3d_fac, self.sy_pred_var3d_fac = \
                 self.create_prediction_tensors(self.sy_pred_in3d, factored=True)
 
+            self.sy_pred_inds = tf.placeholder(dtype=tf.int32, shape=[None], name="model_indices")
+            self.sy_pred_mean_inds, self.sy_pred_var_inds = \
+                self.create_prediction_tensors_by_inds(self.sy_pred_in2d, self.sy_pred_inds)
+
         # Load model if needed
         if self.model_loaded:
             with self.sess.as_default():
-                params_dict = loadmat(os.path.join(self.model_dir, "%s.mat" % self.name))
-                all_vars = self.nonoptvars + self.optvars
-                for i, var in enumerate(all_vars):
-                    var.load(params_dict[str(i)])
+                if self._artifact is not None:
+                    self._load_artifact(*self._artifact)
+                else:
+                    params_dict = loadmat(os.path.join(self.model_dir, "%s.mat" % self.name))
+                    all_vars = self.nonoptvars + self.optvars
+                    for i, var in enumerate(all_vars):
+                        var.load(params_dict[str(i)])
         self.finalized = True
 
+    def _construct_dataset_ops(self):
+        input_dim, output_dim = self.layers[0].get_input_dim(), self.layers[-1].get_output_dim() // 2
+
+        self._dataset_in_ph = tf.placeholder(dtype=tf.float32, shape=[None, input_dim], name="dataset_inputs")
+        self._dataset_targ_ph = tf.placeholder(dtype=tf.float32, shape=[None, output_dim], name="dataset_targets")
+        self._dataset_batch_size = tf.placeholder(dtype=tf.int32, shape=[], name="dataset_batch_size")
+        self._dataset_num_steps = tf.placeholder(dtype=tf.int32, shape=[], name="dataset_num_steps")
+        self._dataset_num_logged = tf.placeholder(dtype=tf.int32, shape=[], name="dataset_num_logged")
+
+        dataset_in = tf.Variable(tf.zeros([0, input_dim]), trainable=False, validate_shape=False,
+                                 name="dataset_inputs")
+        dataset_targ = tf.Variable(tf.zeros([0, output_dim]), trainable=False, validate_shape=False,
+                                   name="dataset_targets")
+        dataset_idxs = tf.Variable(tf.zeros([self.num_nets, 0], dtype=tf.int32), trainable=False,
+                                   validate_shape=False, name="dataset_indices")
+        dataset_batch = tf.Variable(0, trainable=False, name="dataset_batch")
+        self._dataset_vars = [dataset_in, dataset_targ, dataset_idxs, dataset_batch]
+
+        num_rows = tf.shape(self._dataset_in_ph)[0]
+        self._dataset_upload_op = tf.group(
+            tf.assign(dataset_in, self._dataset_in_ph, validate_shape=False),
+            tf.assign(dataset_targ, self._dataset_targ_ph, validate_shape=False),
+            tf.assign(dataset_idxs, tf.random.uniform([self.num_nets, num_rows], maxval=num_rows, dtype=tf.int32),
+                      validate_shape=False),
+            tf.assign(dataset_batch, 0))
+
+        inputs = tf.reshape(dataset_in, [-1, input_dim])
+        targets = tf.reshape(dataset_targ, [-1, output_dim])
+        idxs = tf.reshape(dataset_idxs, [self.num_nets, -1])
+
+        # Same as shuffling the rows of the index array on the host, see train.
+        shuffle = tf.argsort(tf.random.uniform(tf.shape(idxs)), axis=-1)
+        self._dataset_shuffle_op = tf.group(
+            tf.assign(dataset_idxs, tf.batch_gather(idxs, shuffle), validate_shape=False),
+            tf.assign(dataset_batch, 0))
+
+        # Runs up to dataset_num_steps minibatch steps of the current epoch in one session call.
+        # Returns the number of steps taken and whether the epoch is done.
+        start_batch = dataset_batch.read_value()
+        num_batches = (tf.shape(idxs)[-1] + self._dataset_batch_size - 1) // self._dataset_batch_size
+        remaining_batches = num_batches - start_batch
+        num_steps = tf.minimum(self._dataset_num_steps, remaining_batches)
+
+        def train_step(step):
+            # The loss, weight decays and update are built inside the loop body, so that every step
+            # reads the weights written by the previous one.
+            start = (start_batch + step) * self._dataset_batch_size
+            batch_idxs = idxs[:, start:start + self._dataset_batch_size]
+            train_loss = self._compile_train_loss(tf.gather(inputs, batch_idxs), tf.gather(targets, batch_idxs),
+                                                  decays=self._compile_decays())
+            with tf.control_dependencies([self.optimizer.minimize(train_loss, var_list=self.optvars)]):
+                return step + 1
+
+        steps = tf.while_loop(lambda step: step < num_steps, train_step, [tf.constant(0)],
+                              parallel_iterations=1, back_prop=False)
+        with tf.control_dependencies([tf.assign_add(dataset_batch, steps)]):
+            self._dataset_train_op = (tf.identity(steps), tf.greater_equal(steps, remaining_batches))
+
+        logged_idxs = idxs[:, :self._dataset_num_logged]
+        self._dataset_mse_loss = self._compile_losses(
+            tf.gather(inputs, logged_idxs), tf.gather(targets, logged_idxs), inc_var_loss=False)
+
+    def _construct_holdout_ops(self):
+        input_dim, output_dim = self.layers[0].get_input_dim(), self.layers[-1].get_output_dim() // 2
+
+        holdout_in = tf.Variable(tf.zeros([0, input_dim]), trainable=False, validate_shape=False,
+                                 name="holdout_inputs")
+        holdout_targ = tf.Variable(tf.zeros([0, output_dim]), trainable=False, validate_shape=False,
+                                   name="holdout_targets")
+        self._holdout_vars = [holdout_in, holdout_targ]
+
+        # The holdout set is uploaded once per train call and evaluated after every epoch.
+        self._holdout_upload_op = tf.group(
+            tf.assign(holdout_in, self.sy_train_in2d, validate_shape=False),
+            tf.assign(holdout_targ, self.sy_train_targ2d, validate_shape=False))
+        self._holdout_mse_loss = self._compile_losses(
+            tf.reshape(holdout_in, [-1, input_dim]), tf.reshape(holdout_targ, [-1, output_dim]), inc_var_loss=False)
+
     ##################
     # Custom Methods #
     ##################
 
     def _save_state(self, idx):
-        self._state[idx] = [layer.get_model_vars(idx, self.sess) for layer in self.layers]
+        self.sess.run(self._save_snapshot_ops, feed_dict={self._snapshot_idx: idx})
+        self._snapshot_saved[idx] = True
 
     def _save_model_to_path(self, path):
         pass
 
     def _set_state(self):
-        keys = ['weights', 'biases']
-        ops = []
-        num_layers = len(self.layers)
-        for layer in range(num_layers):
-            # net_state = self._state[i]
-            params = {key: np.stack([self._state[net][layer][key] for net in range(self.num_nets)]) for key in keys}
-            ops.extend(self.layers[layer].set_model_vars(params))
-        self.sess.run(ops)
+        ## networks that were never snapshotted keep their current weights
+        self.sess.run(self._restore_snapshot_ops, feed_dict={self._snapshot_mask: self._snapshot_saved})
 
     def _save_best(self, epoch, holdout_losses):
         updated = False
@@ -270,7 +383,7 @@ class BNN:
             return False
 
     def _start_train(self):
-        self._state = {}
+        self._snapshot_saved = np.zeros(self.num_nets, dtype=bool)
         self._snapshots = {i: (None, 1e10) for i in range(self.num_nets)}
         self._epochs_since_update = 0
 
@@ -287,14 +400,20 @@ class BNN:
         print('[ BNN ] Resetting model')
         [layer.reset(self.sess) for layer in self.layers]
 
+    def copy_vars_to(self, sess):
+        """Loads the current values of all model variables into another session that shares
+        this model's graph, e.g. to evaluate graphs that combine the model with the policy.
+        """
+        all_vars = self.nonoptvars + self.optvars
+        for var, val in zip(all_vars, self.sess.run(all_vars)):
+            var.load(val, sess)
+
     def validate(self, inputs, targets):
-        inputs = np.tile(inputs[None], [self.num_nets, 1, 1])
-        targets = np.tile(targets[None], [self.num_nets, 1, 1])
         losses = self.sess.run(
-            self.mse_loss,
+            self.mse_loss2d,
             feed_dict={
-                self.sy_train_in: inputs,
-                self.sy_train_targ: targets
+                self.sy_train_in2d: inputs,
+                self.sy_train_targ2d: targets
                 }
         )
         mean_elite_loss = np.sort(losses)[:self.num_elites].mean()
@@ -306,7 +425,8 @@ class BNN:
 
     def train(self, inputs, targets,
               batch_size=32, max_epochs=None, max_epochs_since_update=5,
-              hide_progress=False, holdout_ratio=0.0, max_logging=5000, max_grad_updates=None, timer=None, max_t=None):
+              hide_progress=False, holdout_ratio=0.0, max_logging=5000, max_grad_updates=None, timer=None, max_t=None,
+              in_graph_batches=False, in_graph_steps=None):
         """Trains/Continues network training
 
         Arguments:
@@ -316,13 +436,14 @@ class BNN:
             batch_size (int): The minibatch size to be used for training.
             epochs (int): Number of epochs (full network passes that will be done.
             hide_progress (bool): If True, hides the progress bar shown at the beginning of training.
+            in_graph_batches (bool): If True, the training set is uploaded to the graph once and the
+                bootstrap indices, shuffles and minibatches are built in the graph, so that training
+                steps need no host-side gathering or feeding.
+            in_graph_steps (int/None): The number of minibatch steps run per session call when
+                in_graph_batches is set. If None, a whole epoch is run per call.
 
         Returns: None
         """
-        self._max_epochs_since_update = max_epochs_since_update
-        self._start_train()
-        break_train = False
-
         def shuffle_rows(arr):
             idxs = np.argsort(np.random.uniform(size=arr.shape), axis=-1)
             return arr[np.arange(arr.shape[0])[:, None], idxs]
@@ -332,14 +453,148 @@ class BNN:
         permutation = np.random.permutation(inputs.shape[0])
         inputs, holdout_inputs = inputs[permutation[num_holdout:]], inputs[permutation[:num_holdout]]
         targets, holdout_targets = targets[permutation[num_holdout:]], targets[permutation[:num_holdout]]
-        holdout_inputs = np.tile(holdout_inputs[None], [self.num_nets, 1, 1])
-        holdout_targets = np.tile(holdout_targets[None], [self.num_nets, 1, 1])
 
         print('[ BNN ] Training {} | Holdout: {}'.format(inputs.shape, holdout_inputs.shape))
         with self.sess.as_default():
             self.scaler.fit(inputs)
 
-        idxs = np.random.randint(inputs.shape[0], size=[self.num_nets, inputs.shape[0]])
+        if in_graph_batches:
+            self.sess.run(self._dataset_upload_op, feed_dict={
+                self._dataset_in_ph: inputs,
+                self._dataset_targ_ph: targets
+            })
+            epoch_idxs = None
+        else:
+            idxs = [np.random.randint(inputs.shape[0], size=[self.num_nets, inputs.shape[0]])]
+
+            def epoch_idxs(epoch):
+                if epoch > 0:
+                    idxs[0] = shuffle_rows(idxs[0])
+                return idxs[0]
+
+        return self._train_epochs(
+            inputs, targets, epoch_idxs, holdout_inputs, holdout_targets,
+            batch_size=batch_size, max_epochs=max_epochs, max_epochs_since_update=max_epochs_since_update,
+            hide_progress=hide_progress, holdout_ratio=holdout_ratio, max_logging=max_logging,
+            max_grad_updates=max_grad_updates, timer=timer, max_t=max_t, in_graph_steps=in_graph_steps)
+
+    def train_incremental(self, inputs, targets, num_new,
+                          batch_size=32, max_epochs=None, max_epochs_since_update=5,
+                          hide_progress=False, holdout_ratio=0.0, max_logging=5000, max_epoch_rows=None,
+                          max_grad_updates=None, timer=None, max_t=None):
+        """Continues network training on a dataset that grew by num_new rows since the last call.
+
+        Unlike train, the holdout split and the bootstrap assignment of every row persist across
+        calls, and the scaler is updated online from the new training rows only. Each epoch visits all
+        new training rows and a uniformly sampled subset of the old ones, at most max_epoch_rows in
+        total, so that the cost of a retrain does not grow with the size of the dataset.
+
+        Arguments:
+            inputs (np.ndarray): Network inputs of the whole dataset in rows, oldest first. Rows
+                dropped from the front since the last call are forgotten.
+            targets (np.ndarray): Network target outputs in rows corresponding to the rows in inputs.
+            num_new (int): The number of rows appended to the end of the dataset since the last call.
+            max_epoch_rows (int/None): The maximum number of rows visited per epoch. If None, every
+                training row is visited in each epoch.
+            Other arguments are the same as in train.
+
+        Returns: (OrderedDict) Model metrics.
+        """
+        num_rows = inputs.shape[0]
+        num_old = num_rows - min(num_new, num_rows)
+        restart = self._data_holdout is None or num_old > len(self._data_holdout)
+        if restart:
+            # No consistent split to continue from, start over.
+            num_old = 0
+        else:
+            was_holdout = self._data_holdout[len(self._data_holdout) - num_old:]
+        self._update_data_split(num_old, num_rows - num_old, holdout_ratio, max_logging)
+
+        train_rows = np.flatnonzero(~self._data_holdout)
+        new_train_rows = train_rows[train_rows >= num_old]
+        old_train_rows = train_rows[train_rows < num_old]
+
+        # The scaler only sees training rows: the new ones, and old holdout rows released for training.
+        with self.sess.as_default():
+            if restart:
+                self.scaler.fit(inputs[train_rows])
+            else:
+                released_rows = np.flatnonzero(was_holdout & ~self._data_holdout[:num_old])
+                self.scaler.partial_fit(inputs[np.concatenate([released_rows, new_train_rows])])
+        holdout_rows = np.flatnonzero(self._data_holdout)
+        holdout_inputs, holdout_targets = inputs[holdout_rows], targets[holdout_rows]
+
+        print('[ BNN ] Incremental training {} | New: {} | Holdout: {}'.format(
+            train_rows.shape, new_train_rows.shape, holdout_inputs.shape))
+
+        def epoch_idxs(epoch):
+            if max_epoch_rows is None or len(train_rows) <= max_epoch_rows:
+                rows = train_rows
+            elif len(new_train_rows) >= max_epoch_rows:
+                rows = new_train_rows[-max_epoch_rows:]
+            else:
+                num_sampled = max_epoch_rows - len(new_train_rows)
+                rows = np.concatenate([
+                    old_train_rows[np.random.randint(len(old_train_rows), size=num_sampled)],
+                    new_train_rows
+                ])
+
+            # Each network resamples the rows in proportion to its bootstrap counts.
+            idxs = np.empty([self.num_nets, len(rows)], dtype=np.int64)
+            for i in range(self.num_nets):
+                counts = self._data_counts[i, rows]
+                p = counts / counts.sum() if counts.sum() > 0 else None
+                idxs[i] = np.random.choice(rows, size=len(rows), p=p)
+            return idxs
+
+        return self._train_epochs(
+            inputs, targets, epoch_idxs, holdout_inputs, holdout_targets,
+            batch_size=batch_size, max_epochs=max_epochs, max_epochs_since_update=max_epochs_since_update,
+            hide_progress=hide_progress, holdout_ratio=holdout_ratio if len(holdout_rows) else 0.0,
+            max_logging=max_logging, max_grad_updates=max_grad_updates, timer=timer, max_t=max_t)
+
+    def _update_data_split(self, num_old, num_new, holdout_ratio, max_logging):
+        """Keeps the holdout flags and bootstrap counts of the last num_old rows and draws them for
+        num_new appended rows. Once more than max_logging rows are held out, the oldest holdout rows
+        are released for training.
+        """
+        if num_old > 0:
+            holdout = self._data_holdout[len(self._data_holdout) - num_old:]
+            counts = self._data_counts[:, self._data_counts.shape[1] - num_old:]
+        else:
+            holdout = np.zeros([0], dtype=bool)
+            counts = np.zeros([self.num_nets, 0], dtype=np.int64)
+
+        holdout = np.concatenate([holdout, np.random.uniform(size=num_new) < holdout_ratio])
+        counts = np.concatenate([counts, np.random.poisson(size=[self.num_nets, num_new])], axis=1)
+
+        holdout_rows = np.flatnonzero(holdout)
+        if len(holdout_rows) > max_logging:
+            holdout[holdout_rows[:len(holdout_rows) - max_logging]] = False
+
+        self._data_holdout, self._data_counts = holdout, counts
+
+    def _train_epochs(self, inputs, targets, epoch_idxs, holdout_inputs, holdout_targets,
+                      batch_size, max_epochs, max_epochs_since_update, hide_progress, holdout_ratio,
+                      max_logging, max_grad_updates, timer, max_t, in_graph_steps=None):
+        """Runs training epochs until early stopping, restores the best networks and selects the elites.
+
+        Arguments:
+            epoch_idxs (function/None): Maps an epoch number to the [num_nets, num_rows] array of row
+                indices visited by each network in that epoch. If None, the minibatches are drawn
+                from the dataset uploaded to the graph.
+            Other arguments are the same as in train.
+
+        Returns: (OrderedDict) Model metrics.
+        """
+        self._max_epochs_since_update = max_epochs_since_update
+        self._start_train()
+        self.sess.run(self._holdout_upload_op, feed_dict={
+            self.sy_train_in2d: holdout_inputs,
+            self.sy_train_targ2d: holdout_targets
+        })
+        break_train = False
+
         if hide_progress:
             progress = Silent()
         else:
@@ -353,48 +608,57 @@ class BNN:
         # else:
         #     epoch_range = trange(epochs, unit="epoch(s)", desc="Network training")
 
+        def train_losses():
+            if epoch_idxs is None:
+                return self.sess.run(self._dataset_mse_loss, feed_dict={self._dataset_num_logged: max_logging})
+            return self.sess.run(
+                    self.mse_loss,
+                    feed_dict={
+                        self.sy_train_in: inputs[idxs[:, :max_logging]],
+                        self.sy_train_targ: targets[idxs[:, :max_logging]]
+                    }
+                )
+
         t0 = time.time()
         grad_updates = 0
+        idxs = epoch_idxs(0) if epoch_idxs is not None else None
         for epoch in epoch_iter:
-            for batch_num in range(int(np.ceil(idxs.shape[-1] / batch_size))):
-                batch_idxs = idxs[:, batch_num * batch_size:(batch_num + 1) * batch_size]
-                self.sess.run(
-                    self.train_op,
-                    feed_dict={self.sy_train_in: inputs[batch_idxs], self.sy_train_targ: targets[batch_idxs]}
-                )
-                grad_updates += 1
+            if epoch_idxs is None:
+                epoch_done = False
+                while not epoch_done:
+                    steps, epoch_done = self.sess.run(self._dataset_train_op, feed_dict={
+                        self._dataset_batch_size: batch_size,
+                        self._dataset_num_steps: in_graph_steps or np.iinfo(np.int32).max
+                    })
+                    grad_updates += steps
+                self.sess.run(self._dataset_shuffle_op)
+            else:
+                for batch_num in range(int(np.ceil(idxs.shape[-1] / batch_size))):
+                    batch_idxs = idxs[:, batch_num * batch_size:(batch_num + 1) * batch_size]
+                    self.sess.run(
+                        self.train_op,
+                        feed_dict={self.sy_train_in: inputs[batch_idxs], self.sy_train_targ: targets[batch_idxs]}
+                    )
+                    grad_updates += 1
+
+                idxs = epoch_idxs(epoch + 1)
 
-            idxs = shuffle_rows(idxs)
             if not hide_progress:
                 if holdout_ratio < 1e-12:
-                    losses = self.sess.run(
-                            self.mse_loss,
-                            feed_dict={
-                                self.sy_train_in: inputs[idxs[:, :max_logging]],
-                                self.sy_train_targ: targets[idxs[:, :max_logging]]
-                            }
-                        )
+                    losses = train_losses()
                     named_losses = [['M{}'.format(i), losses[i]] for i in range(len(losses))]
                     progress.set_description(named_losses)
+                    log_metrics('model_train', epoch=epoch, grad_updates=grad_updates,
+                                train_loss=np.mean(losses))
                 else:
-                    losses = self.sess.run(
-                            self.mse_loss,
-                            feed_dict={
-                                self.sy_train_in: inputs[idxs[:, :max_logging]],
-                                self.sy_train_targ: targets[idxs[:, :max_logging]]
-                            }
-                        )
-                    holdout_losses = self.sess.run(
-                            self.mse_loss,
-                            feed_dict={
-                                self.sy_train_in: holdout_inputs,
-                                self.sy_train_targ: holdout_targets
-                            }
-                        )
+                    losses = train_losses()
+                    holdout_losses = self.sess.run(self._holdout_mse_loss)
                     named_losses = [['M{}'.format(i), losses[i]] for i in range(len(losses))]
                     named_holdout_losses = [['V{}'.format(i), holdout_losses[i]] for i in range(len(holdout_losses))]
                     named_losses = named_losses + named_holdout_losses + [['T', time.time() - t0]]
                     progress.set_description(named_losses)
+                    log_metrics('model_train', epoch=epoch, grad_updates=grad_updates,
+                                train_loss=np.mean(losses), holdout_loss=np.mean(holdout_losses))
 
                     break_train = self._save_best(epoch, holdout_losses)
 
@@ -415,13 +679,7 @@ class BNN:
         self._set_state()
         if timer: timer.stamp('bnn_set_state')
 
-        holdout_losses = self.sess.run(
-            self.mse_loss,
-            feed_dict={
-                self.sy_train_in: holdout_inputs,
-                self.sy_train_targ: holdout_targets
-            }
-        )
+        holdout_losses = self.sess.run(self._holdout_mse_loss)
 
         if timer: timer.stamp('bnn_holdout')
 
@@ -430,6 +688,7 @@ class BNN:
 
         val_loss = (np.sort(holdout_losses)[:self.num_elites]).mean()
         model_metrics = {'val_loss': val_loss}
+        log_metrics('model_holdout', grad_updates=grad_updates, val_loss=val_loss)
         print('[ BNN ] Holdout', np.sort(holdout_losses), model_metrics)
         return OrderedDict(model_metrics)
         # return np.sort(holdout_losses)[]
@@ -475,6 +734,29 @@ class BNN:
                 feed_dict={self.sy_pred_in3d: inputs}
             )
 
+    def predict_by_inds(self, inputs, model_inds):
+        """Returns the distribution predicted by a single ensemble member for each input vector.
+
+        Row j of inputs is only passed through network model_inds[j], so the cost of the forward
+        pass does not grow with the ensemble size.
+
+        Arguments:
+            inputs (np.ndarray): A 2D array of input vectors in rows.
+            model_inds (np.ndarray): An integer array of shape [batch_size] with the index of the
+                network used for each row.
+
+        Returns: a mean and variance, each of shape [batch_size, output_dim].
+        """
+        return self.sess.run(
+            [self.sy_pred_mean_inds, self.sy_pred_var_inds],
+            feed_dict={self.sy_pred_in2d: inputs, self.sy_pred_inds: model_inds}
+        )
+
+    def create_prediction_tensors_by_inds(self, inputs, model_inds):
+        """See predict_by_inds() above for documentation.
+        """
+        return self._compile_outputs_by_inds(inputs, model_inds)
+
     def create_prediction_tensors(self, inputs, factored=False, *args, **kwargs):
         """See predict() above for documentation.
         """
@@ -487,36 +769,63 @@ class BNN:
         return factored_mean, factored_variance
 
     def save(self, savedir, timestep):
-        """Saves all information required to recreate this model in two files in savedir
-        (or self.model_dir if savedir is None), one containing the model structuure and the other
-        containing all variables in the network.
+        """Saves all information required to recreate this model to a single '{name}_{timestep}.bnn'
+        artifact in savedir (or self.model_dir if savedir is None). The artifact holds the model
+        structure, the elites and the scaler statistics in its header, followed by all variables in
+        the network in one contiguous blob (see mbpo/models/artifact.py).
 
-        savedir (str): (Optional) Path to which files will be saved. If not provided, self.model_dir
-            (the directory provided at initialization) will be used.
+        savedir (str): (Optional) Path to which the artifact will be saved. If not provided,
+            self.model_dir (the directory provided at initialization) will be used.
         """
         if not self.finalized:
             raise RuntimeError()
         model_dir = self.model_dir if savedir is None else savedir
 
-        # Write structure to file
-        with open(os.path.join(model_dir, '{}_{}.nns'.format(self.name, timestep)), "w+") as f:
-            for layer in self.layers[:-1]:
-                f.write("%s\n" % repr(layer))
-            last_layer_copy = self.layers[-1].copy()
-            last_layer_copy.set_activation(self.end_act_name)
-            last_layer_copy.set_output_dim(last_layer_copy.get_output_dim() // 2)
-            f.write("%s\n" % repr(last_layer_copy))
-
-        # Save network parameters (including scalers) in a .mat file
-        var_vals = {}
-        for i, var_val in enumerate(self.sess.run(self.nonoptvars + self.optvars)):
-            var_vals[str(i)] = var_val
-        savemat(os.path.join(model_dir, '{}_{}.mat'.format(self.name, timestep)), var_vals)
+        structure = [self._layer_config(layer) for layer in self.layers[:-1]]
+        last_layer_copy = self.layers[-1].copy()
+        last_layer_copy.set_activation(self.end_act_name)
+        last_layer_copy.set_output_dim(last_layer_copy.get_output_dim() // 2)
+        structure.append(self._layer_config(last_layer_copy))
+
+        # Network parameters (including scalers), in the order of self.nonoptvars + self.optvars
+        arrays = {
+            'var/{}'.format(i): var_val
+            for i, var_val in enumerate(self.sess.run(self.nonoptvars + self.optvars))
+        }
+        arrays['scaler/mean'], arrays['scaler/m2'] = self.scaler.mean, self.scaler.m2
+
+        header = {
+            'name': self.name,
+            'layers': structure,
+            'num_elites': self.num_elites,
+            'model_inds': getattr(self, '_model_inds', None),
+            'scaler_count': int(self.scaler.count),
+            'scaler_fitted': self.scaler.fitted,
+        }
+        write_artifact(os.path.join(model_dir, '{}_{}.bnn'.format(self.name, timestep)), header, arrays)
+
+    @staticmethod
+    def _layer_config(layer):
+        return {
+            'output_dim': layer.get_output_dim(),
+            'input_dim': layer.get_input_dim(),
+            'activation': layer.get_activation(as_func=False),
+            'weight_decay': layer.get_weight_decay(),
+            'ensemble_size': layer.get_ensemble_size(),
+        }
 
     def _load_structure(self):
         """Uses the saved structure in self.model_dir with the name of this network to initialize
-        the structure of this network.
+        the structure of this network. Reads the '.bnn' artifact if there is one, and the legacy
+        '.nns' structure file otherwise.
         """
+        artifact_path = os.path.join(self.model_dir, "%s.bnn" % self.name)
+        if os.path.exists(artifact_path):
+            self._artifact = read_artifact(artifact_path)
+            header, _ = self._artifact
+            self.layers = [FC(**layer_config) for layer_config in header['layers']]
+            return
+
         structure = []
         print("=========Inside load_sturcture:======== ", self.model_dir, self.name)
         with open(os.path.join(self.model_dir, "%s.nns" % self.name), "r") as f:
@@ -533,6 +842,35 @@ class BNN:
                 structure.append(FC(**kwargs))
         self.layers = structure
 
+    def _load_artifact(self, header, arrays):
+        """Loads the variables, scaler statistics and elites of a '.bnn' artifact. All variables
+        are assigned in a single session call, fed directly from the memory-mapped blob.
+        """
+        all_vars = self.nonoptvars + self.optvars
+        if len(arrays) != len(all_vars) + 2:
+            raise ValueError("Artifact of {} has {} variables, the network has {}.".format(
+                self.name, len(arrays) - 2, len(all_vars)))
+        var_vals = [arrays['var/{}'.format(i)] for i in range(len(all_vars))]
+
+        with tf.variable_scope(self.name):
+            var_phs = [
+                tf.placeholder(dtype=var.dtype.base_dtype, shape=var.shape, name="load_var")
+                for var in all_vars
+            ]
+            load_op = tf.group(*[tf.assign(var, var_ph) for var, var_ph in zip(all_vars, var_phs)])
+        self.sess.run(load_op, feed_dict=dict(zip(var_phs, var_vals)))
+
+        self.scaler.count = header['scaler_count']
+        self.scaler.mean = np.array(arrays['scaler/mean'])
+        self.scaler.m2 = np.array(arrays['scaler/m2'])
+        self.scaler.fitted = header['scaler_fitted']
+        self.scaler.cache()
+        if header['model_inds'] is not None:
+            self._model_inds = header['model_inds']
+
+        # Releases the memory map
+        self._artifact = None
+
     #######################
     # Compilation methods #
     #######################
@@ -567,6 +905,61 @@ class BNN:
         else:
             return mean, tf.exp(logvar)
 
+    def _compile_outputs_by_inds(self, inputs, model_inds, ret_log_var=False):
+        """Compiles the output of the network at the given 2D inputs, routing each row to one network.
+
+        Rows are partitioned by model_inds inside the graph, each partition is passed only through
+        its own network, and the results are stitched back into the original row order.
+
+        Arguments:
+            inputs: (tf.Tensor) A 2D tensor representing the inputs to the network.
+            model_inds: (tf.Tensor) A 1D int32 tensor with the network index of every row.
+            ret_log_var: (bool) If True, returns the log variance instead of the variance.
+
+        Returns: (tf.Tensors) The 2D mean and variance/log variance predictions at inputs.
+        """
+        dim_output = self.layers[-1].get_output_dim()
+        cur_in = self.scaler.transform(inputs)
+
+        row_inds = tf.dynamic_partition(tf.range(tf.shape(inputs)[0]), model_inds, self.num_nets)
+        partitions = tf.dynamic_partition(cur_in, model_inds, self.num_nets)
+        outputs = []
+        for i, cur_out in enumerate(partitions):
+            for layer in self.layers:
+                cur_out = layer.compute_member_output_tensor(cur_out, i)
+            outputs.append(cur_out)
+        cur_out = tf.dynamic_stitch(row_inds, outputs)
+        cur_out.set_shape([None, dim_output])
+
+        mean = cur_out[:, :dim_output//2]
+        if self.end_act is not None:
+            mean = self.end_act(mean)
+
+        logvar = self.max_logvar - tf.nn.softplus(self.max_logvar - cur_out[:, dim_output//2:])
+        logvar = self.min_logvar + tf.nn.softplus(logvar - self.min_logvar)
+
+        if ret_log_var:
+            return mean, logvar
+        else:
+            return mean, tf.exp(logvar)
+
+    def _compile_train_loss(self, inputs, targets, decays=None):
+        """Helper method for compiling the training objective: the summed losses of all networks
+        plus weight decay and the log variance bound penalties. Uses self.decays unless other
+        weight decay tensors are given."""
+        train_loss = tf.reduce_sum(self._compile_losses(inputs, targets, inc_var_loss=True))
+        train_loss += tf.add_n(self.decays if decays is None else decays)
+        train_loss += 0.01 * tf.reduce_sum(self.max_logvar) - 0.01 * tf.reduce_sum(self.min_logvar)
+        return train_loss
+
+    def _compile_decays(self):
+        """Compiles the weight decays of all layers again. Unlike self.decays, these read the
+        weights where they are built, e.g. in every iteration of a tf.while_loop body."""
+        return [
+            tf.multiply(layer.get_weight_decay(), tf.nn.l2_loss(layer.weights), name="weight_decay")
+            for layer in self.layers if layer.get_weight_decay() is not None
+        ]
+
     def _compile_losses(self, inputs, targets, inc_var_loss=True):
         """Helper method for compiling the loss function.
 
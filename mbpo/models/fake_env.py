@@ -2,6 +2,9 @@ import numpy as np
 import tensorflow as tf
 import pdb
 
+## diagnostics FakeEnv.step can return in its info dict
+INFO_KEYS = ('mean', 'std', 'log_prob', 'dev')
+
 class FakeEnv:
 
     def __init__(self, model, config):
@@ -26,11 +29,14 @@ class FakeEnv:
         ## [ batch_size ]
         log_prob = np.log(prob)
 
-        stds = np.std(means,0).mean(-1)
-
-        return log_prob, stds
+        return log_prob
 
-    def step(self, obs, act, deterministic=False):
+    def step(self, obs, act, deterministic=False, fused=False, info_keys=INFO_KEYS):
+        '''
+            info_keys : diagnostics to compute and return in info, any of INFO_KEYS.
+                Model rollouts that only need next_obs, rewards and terminals pass ()
+                to skip the passes over the whole ensemble they require.
+        '''
         assert len(obs.shape) == len(act.shape)
         if len(obs.shape) == 1:
             obs = obs[None]
@@ -40,6 +46,9 @@ class FakeEnv:
             return_single = False
 
         inputs = np.concatenate((obs, act), axis=-1)
+        if fused:
+            return self._step_fused(obs, act, inputs, deterministic, return_single, info_keys)
+
         ensemble_model_means, ensemble_model_vars = self.model.predict(inputs, factored=True)
         ensemble_model_means[:,:,1:] += obs
         ensemble_model_stds = np.sqrt(ensemble_model_vars)
@@ -58,52 +67,152 @@ class FakeEnv:
         model_stds = ensemble_model_stds[model_inds, batch_inds]
         ####
 
-        log_prob, dev = self._get_logprob(samples, ensemble_model_means, ensemble_model_vars)
+        rewards, next_obs = samples[:,:1], samples[:,1:]
+        terminals = self.config.termination_fn(obs, act, next_obs)
+
+        info = self._step_info(info_keys, model_means, model_stds, terminals, return_single)
+        if 'log_prob' in info_keys:
+            info['log_prob'] = self._get_logprob(samples, ensemble_model_means, ensemble_model_vars)
+        if 'dev' in info_keys:
+            info['dev'] = np.std(ensemble_model_means, 0).mean(-1)
+
+        if return_single:
+            next_obs = next_obs[0]
+            rewards = rewards[0]
+            terminals = terminals[0]
+
+        return next_obs, rewards, terminals, info
+
+    def _step_info(self, info_keys, model_means, model_stds, terminals, return_single):
+        info = {}
+        if 'mean' in info_keys:
+            return_means = np.concatenate((model_means[:,:1], terminals, model_means[:,1:]), axis=-1)
+            info['mean'] = return_means[0] if return_single else return_means
+        if 'std' in info_keys:
+            batch_size = model_stds.shape[0]
+            return_stds = np.concatenate((model_stds[:,:1], np.zeros((batch_size,1)), model_stds[:,1:]), axis=-1)
+            info['std'] = return_stds[0] if return_single else return_stds
+        return info
+
+    def _step_fused(self, obs, act, inputs, deterministic, return_single, info_keys):
+        """Same as step, but every row is only passed through its chosen elite.
+
+        Noise is drawn for the kept rows only. Since the other ensemble members are
+        never evaluated, 'log_prob' and 'dev' are not available in the returned info.
+        """
+        batch_size = inputs.shape[0]
+        model_inds = self.model.random_inds(batch_size).astype(np.int32)
+        model_means, model_vars = self.model.predict_by_inds(inputs, model_inds)
+        model_means[:,1:] += obs
+        model_stds = np.sqrt(model_vars)
+
+        if deterministic:
+            samples = model_means
+        else:
+            samples = model_means + np.random.normal(size=model_means.shape) * model_stds
 
         rewards, next_obs = samples[:,:1], samples[:,1:]
         terminals = self.config.termination_fn(obs, act, next_obs)
 
-        batch_size = model_means.shape[0]
-        return_means = np.concatenate((model_means[:,:1], terminals, model_means[:,1:]), axis=-1)
-        return_stds = np.concatenate((model_stds[:,:1], np.zeros((batch_size,1)), model_stds[:,1:]), axis=-1)
+        info = self._step_info(info_keys, model_means, model_stds, terminals, return_single)
 
         if return_single:
             next_obs = next_obs[0]
-            return_means = return_means[0]
-            return_stds = return_stds[0]
             rewards = rewards[0]
             terminals = terminals[0]
 
-        info = {'mean': return_means, 'std': return_stds, 'log_prob': log_prob, 'dev': dev}
         return next_obs, rewards, terminals, info
 
     ## for debugging computation graph
-    def step_ph(self, obs_ph, act_ph, deterministic=False):
+    def step_ph(self, obs_ph, act_ph, deterministic=False, model_inds=None):
         assert len(obs_ph.shape) == len(act_ph.shape)
 
         inputs = tf.concat([obs_ph, act_ph], axis=1)
-        # inputs = np.concatenate((obs, act), axis=-1)
-        ensemble_model_means, ensemble_model_vars = self.model.create_prediction_tensors(inputs, factored=True)
-        # ensemble_model_means, ensemble_model_vars = self.model.predict(inputs, factored=True)
-        ensemble_model_means = tf.concat([ensemble_model_means[:,:,0:1], ensemble_model_means[:,:,1:] + obs_ph[None]], axis=-1)
-        # ensemble_model_means[:,:,1:] += obs_ph
-        ensemble_model_stds = tf.sqrt(ensemble_model_vars)
-        # ensemble_model_stds = np.sqrt(ensemble_model_vars)
-
-        if deterministic:
-            ensemble_samples = ensemble_model_means
+        if model_inds is not None:
+            ## route every row through its own elite only
+            model_means, model_vars = self.model.create_prediction_tensors_by_inds(inputs, model_inds)
+            model_means = tf.concat([model_means[:,0:1], model_means[:,1:] + obs_ph], axis=-1)
+            if deterministic:
+                samples = model_means
+            else:
+                samples = model_means + tf.random.normal(tf.shape(model_means)) * tf.sqrt(model_vars)
         else:
-            # ensemble_samples = ensemble_model_means + np.random.normal(size=ensemble_model_means.shape) * ensemble_model_stds
-            ensemble_samples = ensemble_model_means + tf.random.normal(tf.shape(ensemble_model_means)) * ensemble_model_stds
-
-        samples = ensemble_samples[0]
+            # inputs = np.concatenate((obs, act), axis=-1)
+            ensemble_model_means, ensemble_model_vars = self.model.create_prediction_tensors(inputs, factored=True)
+            # ensemble_model_means, ensemble_model_vars = self.model.predict(inputs, factored=True)
+            ensemble_model_means = tf.concat([ensemble_model_means[:,:,0:1], ensemble_model_means[:,:,1:] + obs_ph[None]], axis=-1)
+            # ensemble_model_means[:,:,1:] += obs_ph
+            ensemble_model_stds = tf.sqrt(ensemble_model_vars)
+            # ensemble_model_stds = np.sqrt(ensemble_model_vars)
+
+            if deterministic:
+                ensemble_samples = ensemble_model_means
+            else:
+                # ensemble_samples = ensemble_model_means + np.random.normal(size=ensemble_model_means.shape) * ensemble_model_stds
+                ensemble_samples = ensemble_model_means + tf.random.normal(tf.shape(ensemble_model_means)) * ensemble_model_stds
+
+            samples = ensemble_samples[0]
 
         rewards, next_obs = samples[:,:1], samples[:,1:]
-        terminals = self.config.termination_ph_fn(obs_ph, act_ph, next_obs)
+        terminals = self._termination_ph(obs_ph, act_ph, next_obs)
         info = {}
 
         return next_obs, rewards, terminals, info
 
+    def _termination_ph(self, obs_ph, act_ph, next_obs_ph):
+        if hasattr(self.config, 'termination_ph_fn'):
+            return self.config.termination_ph_fn(obs_ph, act_ph, next_obs_ph)
+
+        ## fall back to the numpy termination function inside the graph
+        terminals = tf.py_func(self.config.termination_fn, [obs_ph, act_ph, next_obs_ph], tf.bool, stateful=False)
+        terminals.set_shape([None, 1])
+        return terminals
+
+    def rollout_ph(self, obs_ph, policy, num_steps_ph, elite_inds_ph, deterministic=False):
+        """Builds a policy -> model -> termination loop of up to num_steps_ph steps as a single
+        tf.while_loop, starting from obs_ph.
+
+        Terminated rows are kept in the batch (frozen at their last observation) instead of being
+        compacted, and an 'alive' mask records which transitions are valid. The loop exits early
+        once every row has terminated.
+
+        Returns: a dict of tensors of shape [ num_steps, batch_size, ... ] with the keys
+            'observations', 'actions', 'next_observations', 'rewards', 'terminals' and 'alive'.
+        """
+        batch_size = tf.shape(obs_ph)[0]
+        num_elites = tf.shape(elite_inds_ph)[0]
+        keys = ('observations', 'actions', 'next_observations', 'rewards', 'terminals', 'alive')
+
+        def cond(t, obs, alive, arrays):
+            return tf.logical_and(t < num_steps_ph, tf.reduce_any(alive))
+
+        def body(t, obs, alive, arrays):
+            act = policy.actions([obs])
+            model_inds = tf.gather(elite_inds_ph, tf.random.uniform([batch_size], maxval=num_elites, dtype=tf.int32))
+            next_obs, rew, term, _ = self.step_ph(obs, act, deterministic=deterministic, model_inds=model_inds)
+
+            values = (obs, act, next_obs, rew, term, alive)
+            arrays = tuple(array.write(t, value) for array, value in zip(arrays, values))
+
+            next_alive = tf.logical_and(alive, tf.logical_not(term[:, 0]))
+            next_obs = tf.where(next_alive, next_obs, obs)
+            return t + 1, next_obs, next_alive, arrays
+
+        arrays = (
+            tf.TensorArray(tf.float32, size=0, dynamic_size=True),
+            tf.TensorArray(tf.float32, size=0, dynamic_size=True),
+            tf.TensorArray(tf.float32, size=0, dynamic_size=True),
+            tf.TensorArray(tf.float32, size=0, dynamic_size=True),
+            tf.TensorArray(tf.bool, size=0, dynamic_size=True),
+            tf.TensorArray(tf.bool, size=0, dynamic_size=True),
+        )
+        _, _, _, arrays = tf.while_loop(
+            cond, body,
+            loop_vars=(tf.constant(0), obs_ph, tf.ones([batch_size], dtype=tf.bool), arrays),
+            back_prop=False)
+
+        return {key: array.stack() for key, array in zip(keys, arrays)}
+
     def close(self):
         pass
 
@@ -42,6 +42,7 @@ class FC:
         # Initialize internal state
         self.variables_constructed = False
         self.weights, self.biases = None, None
+        self.snapshot_weights, self.snapshot_biases = None, None
         self.decays = None
 
     def __repr__(self):
@@ -51,26 +52,39 @@ class FC:
             )
 
     #### Extensions
-    def get_model_vars(self, idx, sess):
-        weights, biases = sess.run([self.weights, self.biases])
-        weight = weights[idx].copy()
-        bias = biases[idx].copy()
-        return {'weights': weight, 'biases': bias}
-
-    def set_model_vars(self, idx, sess, variables):
-        for attr, var in variables.items():
-            tensor = getattr(self, attr)
-            op = tensor[idx].assign(var)
-            sess.run(op)
-            # print('assigned {}: {}'.format(attr, idx))
-
-    def set_model_vars(self, variables):
-        ops = [getattr(self, attr).assign(var) for attr, var in variables.items()]
-        return ops
-        # for attr, var in variables.items():
-            # tensor = getattr(self, attr)
-            # op = tensor.assign(var)
+    def construct_snapshot_ops(self, idx, mask):
+        """Constructs variables holding a snapshot of each network in the ensemble.
 
+        Arguments:
+            idx: (tf.Tensor) Scalar int32 index of the network copied by the returned save ops.
+            mask: (tf.Tensor) Boolean vector of length ensemble_size selecting the networks
+                  overwritten with their snapshot by the returned restore ops.
+
+        Returns: (save_ops, restore_ops), lists of assign ops.
+        """
+        self.snapshot_weights = tf.get_variable(
+            "FC_snapshot_weights",
+            shape=[self.ensemble_size, self.input_dim, self.output_dim],
+            initializer=tf.zeros_initializer(),
+            trainable=False
+        )
+        self.snapshot_biases = tf.get_variable(
+            "FC_snapshot_biases",
+            shape=[self.ensemble_size, 1, self.output_dim],
+            initializer=tf.zeros_initializer(),
+            trainable=False
+        )
+
+        save_ops, restore_ops = [], []
+        for var, snapshot in [(self.weights, self.snapshot_weights), (self.biases, self.snapshot_biases)]:
+            save_ops.append(tf.scatter_update(snapshot, idx, var[idx]))
+            restore_ops.append(tf.assign(var, tf.where(mask, snapshot, var)))
+        return save_ops, restore_ops
+
+    def get_snapshot_vars(self):
+        """Returns the snapshot variables of this layer.
+        """
+        return [self.snapshot_weights, self.snapshot_biases]
 
     def reset(self, sess):
         sess.run(self.weights.initializer)
@@ -103,6 +117,21 @@ class FC:
         # Apply activations if necessary
         return FC._activations[self.activation](raw_output)
 
+    def compute_member_output_tensor(self, input_tensor, idx):
+        """Returns the output of a single network of the ensemble on a 2D input_tensor.
+
+        Unlike compute_output_tensor, only the weights of network idx are used, so rows
+        that are routed to one ensemble member do not pay for the forward pass of the others.
+
+        Arguments:
+            input_tensor: (tf.Tensor) The 2D input to the layer.
+            idx: (int) The index of the network in the ensemble.
+
+        Returns: The 2D output of the layer.
+        """
+        raw_output = tf.matmul(input_tensor, self.weights[idx]) + self.biases[idx]
+        return FC._activations[self.activation](raw_output)
+
     def get_decays(self):
         """Returns the list of losses corresponding to the weight decay imposed on each weight of the
         network.
@@ -34,6 +34,7 @@ class TensorStandardScaler:
             )
 
         self.cached_mu, self.cached_sigma = np.zeros([0, x_dim]), np.ones([1, x_dim])
+        self.count, self.mean, self.m2 = 0, np.zeros([1, x_dim]), np.zeros([1, x_dim])
 
     def fit(self, data):
         """Runs two ops, one for assigning the mean of the data to the internal mean, and
@@ -47,6 +48,7 @@ class TensorStandardScaler:
         """
         mu = np.mean(data, axis=0, keepdims=True)
         sigma = np.std(data, axis=0, keepdims=True)
+        self.count, self.mean, self.m2 = data.shape[0], mu, np.square(sigma) * data.shape[0]
         sigma[sigma < 1e-12] = 1.0
 
         self.mu.load(mu)
@@ -54,6 +56,35 @@ class TensorStandardScaler:
         self.fitted = True
         self.cache()
 
+    def partial_fit(self, data):
+        """Updates the mean and standard deviation with a new batch of data, merging its
+        statistics with those of all the data seen since the last call to fit.
+        This function must be called within a 'with <session>.as_default()' block.
+
+        Arguments:
+        data (np.ndarray): A numpy array containing the new input
+
+        Returns: None.
+        """
+        if data.shape[0] == 0:
+            return
+
+        count = self.count + data.shape[0]
+        data_mean = np.mean(data, axis=0, keepdims=True)
+        delta = data_mean - self.mean
+        self.m2 = self.m2 + np.sum(np.square(data - data_mean), axis=0, keepdims=True) + \
+            np.square(delta) * self.count * data.shape[0] / count
+        self.mean = self.mean + delta * data.shape[0] / count
+        self.count = count
+
+        sigma = np.sqrt(self.m2 / count)
+        sigma[sigma < 1e-12] = 1.0
+
+        self.mu.load(self.mean)
+        self.sigma.load(sigma)
+        self.fitted = True
+        self.cache()
+
     def transform(self, data):
         """Transforms the input matrix data using the parameters of this scaler.
 
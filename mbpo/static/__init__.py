@@ -1,25 +1,54 @@
 import sys
-import os
+import types
 import importlib
-import pdb
 
 
-def import_fns(path, file, fns_name='StaticFns'):
-	full_path = os.path.join(path, file)
-	import_path = full_path.replace('/', '.')
-	module = importlib.import_module(import_path)
+## {domain: module, ... }, modules relative to this package
+STATIC_FNS_MODULES = {
+	'anttruncatedobs': 'ant_truncated_obs',
+	'continuousgrid': 'continuousgrid',
+	'fetchpickandplace': 'fetch_pick_and_place',
+	'fetchpush': 'fetchpush',
+	'halfcheetah': 'halfcheetah',
+	'hopper': 'hopper',
+	'humanoidtruncatedobs': 'humanoid_truncated_obs',
+	'inverteddoublependulum': 'inverted_double_pendulum',
+	'invertedpendulum': 'inverted_pendulum',
+	'myhopper': 'myhopper',
+	'mywalker2d': 'mywalker2d',
+	'reacher': 'reacher',
+	'walker2d': 'walker2d',
+}
+
+
+def import_fns(module_name, fns_name='StaticFns'):
+	module = importlib.import_module('.' + module_name, __name__)
 	fns = getattr(module, fns_name)
 	return fns
 
-cwd = 'mbpo/static'
-files = os.listdir(cwd)
-## remove __init__.py
-files = filter(lambda x: '__' not in x, files)
-## env.py --> env
-files = map(lambda x: x.replace('.py', ''), files)
 
-## {env: StaticFns, ... }
-static_fns = {file.replace('_', ''): import_fns(cwd, file) for file in files}
+class _StaticFnsRegistry(types.ModuleType):
+	"""Makes the package subscriptable by domain, `mbpo.static['hopper']`.
+	A domain's module is only imported the first time it is looked up."""
+
+	_loaded = {}
+
+	def __getitem__(self, domain):
+		if domain not in self._loaded:
+			self._loaded[domain] = import_fns(STATIC_FNS_MODULES[domain])
+		return self._loaded[domain]
+
+	def __contains__(self, domain):
+		return domain in STATIC_FNS_MODULES
+
+	def __iter__(self):
+		return iter(STATIC_FNS_MODULES)
+
+	def __len__(self):
+		return len(STATIC_FNS_MODULES)
+
+	def keys(self):
+		return STATIC_FNS_MODULES.keys()
 
-sys.modules[__name__] = static_fns
 
+sys.modules[__name__].__class__ = _StaticFnsRegistry
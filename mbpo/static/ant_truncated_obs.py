@@ -1,4 +1,5 @@
 import numpy as np
+import tensorflow as tf
 
 class StaticFns:
 
@@ -14,3 +15,14 @@ class StaticFns:
         done = ~not_done
         done = done[:,None]
         return done
+
+    @staticmethod
+    def termination_ph_fn(obs, act, next_obs):
+        x = next_obs[:, 0]
+        not_done = tf.reduce_all(tf.is_finite(next_obs), axis=-1) \
+                   & (x >= 0.2) \
+                   & (x <= 1.0)
+
+        done = tf.logical_not(not_done)
+        done = done[:,None]
+        return done
@@ -1,4 +1,5 @@
 import numpy as np
+import tensorflow as tf
 
 class StaticFns:
 
@@ -7,4 +8,8 @@ class StaticFns:
 
         done = np.array([False]).repeat(len(obs))
         done = done[:,None]
-        return done
\ No newline at end of file
+        return done
+
+    @staticmethod
+    def termination_ph_fn(obs, act, next_obs):
+        return tf.zeros_like(next_obs[:, :1], dtype=tf.bool)
@@ -1,5 +1,6 @@
 import sys
 import numpy as np
+import tensorflow as tf
 import pdb
 
 class StaticFns:
@@ -12,4 +13,12 @@ class StaticFns:
         done = (z < 1.0) + (z > 2.0)
 
         done = done[:,None]
-        return done
\ No newline at end of file
+        return done
+
+    @staticmethod
+    def termination_ph_fn(obs, act, next_obs):
+        z = next_obs[:,0]
+        done = (z < 1.0) | (z > 2.0)
+
+        done = done[:,None]
+        return done
@@ -1,5 +1,6 @@
 import sys
 import numpy as np
+import tensorflow as tf
 import pdb
 
 class StaticFns:
@@ -17,4 +18,17 @@ class StaticFns:
         done = y <= 1
         
         done = done[:,None]
-        return done
\ No newline at end of file
+        return done
+
+    @staticmethod
+    def termination_ph_fn(obs, act, next_obs):
+        sin1, cos1 = next_obs[:,1], next_obs[:,3]
+        sin2, cos2 = next_obs[:,2], next_obs[:,4]
+        theta_1 = tf.atan2(sin1, cos1)
+        theta_2 = tf.atan2(sin2, cos2)
+        y = 0.6 * (cos1 + tf.cos(theta_1 + theta_2))
+
+        done = y <= 1
+
+        done = done[:,None]
+        return done
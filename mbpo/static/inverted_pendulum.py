@@ -1,5 +1,6 @@
 import sys
 import numpy as np
+import tensorflow as tf
 import pdb
 
 class StaticFns:
@@ -14,4 +15,14 @@ class StaticFns:
 
         done = done[:,None]
 
-        return done
\ No newline at end of file
+        return done
+
+    @staticmethod
+    def termination_ph_fn(obs, act, next_obs):
+        notdone = tf.reduce_all(tf.is_finite(next_obs), axis=-1) \
+                  & (tf.abs(next_obs[:,1]) <= .2)
+        done = tf.logical_not(notdone)
+
+        done = done[:,None]
+
+        return done
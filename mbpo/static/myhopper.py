@@ -1,4 +1,5 @@
 import numpy as np
+import tensorflow as tf
 
 class StaticFns:
 
@@ -16,3 +17,16 @@ class StaticFns:
         done = ~not_done
         done = done[:,None]
         return done
+
+    @staticmethod
+    def termination_ph_fn(obs, act, next_obs):
+        height = next_obs[:, 0]
+        angle = next_obs[:, 1]
+        not_done =  tf.reduce_all(tf.is_finite(next_obs), axis=-1) \
+                    & tf.reduce_all(next_obs[:,1:] < 100, axis=-1) \
+                    & (height > .7) \
+                    & (tf.abs(angle) < .2)
+
+        done = tf.logical_not(not_done)
+        done = done[:,None]
+        return done
@@ -1,4 +1,5 @@
 import numpy as np
+import tensorflow as tf
 
 class StaticFns:
 
@@ -15,3 +16,15 @@ class StaticFns:
         done = ~not_done
         done = done[:,None]
         return done
+
+    @staticmethod
+    def termination_ph_fn(obs, act, next_obs):
+        height = next_obs[:, 0]
+        angle = next_obs[:, 1]
+        not_done =  (height > 0.8) \
+                    & (height < 2.0) \
+                    & (angle > -1.0) \
+                    & (angle < 1.0)
+        done = tf.logical_not(not_done)
+        done = done[:,None]
+        return done
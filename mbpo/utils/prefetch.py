@@ -0,0 +1,94 @@
+import queue
+import threading
+from contextlib import contextmanager
+
+
+class BatchPrefetcher:
+    """Assembles training batches in a background thread.
+
+    Up to `buffer_size` batches are kept ready, so that sampling from the
+    replay pools and concatenating the env and model batches overlaps with
+    the gradient steps running in the session. Code that writes to the
+    pools must do so inside `paused()`, which holds the lock the sampling
+    thread takes while reading them, and call `invalidate()` there if the
+    buffered batches should include the new samples.
+    """
+
+    def __init__(self, sample_fn, buffer_size=2):
+        self._sample_fn = sample_fn
+        self._queue = queue.Queue(maxsize=buffer_size)
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._stopped = threading.Event()
+        self._thread = None
+        self._error = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._thread.join()
+        self._thread = None
+        self._drain()
+
+    def get(self):
+        """Returns the next batch sampled since the last invalidation."""
+        self.start()
+        while True:
+            if self._error is not None:
+                raise self._error
+            try:
+                generation, batch = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if generation == self._generation:
+                return batch
+
+    @contextmanager
+    def paused(self, invalidate=False):
+        """Blocks sampling while the pools are modified.
+
+        If `invalidate` is True, the batches buffered so far are dropped,
+        e.g. after the model pool has been refilled with fresh rollouts.
+        """
+        with self._lock:
+            yield
+            if invalidate:
+                self.invalidate()
+
+    def invalidate(self):
+        """Drops the batches sampled so far. Must be called inside `paused()`."""
+        self._generation += 1
+        self._drain()
+
+    def _drain(self):
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def _run(self):
+        while not self._stopped.is_set():
+            with self._lock:
+                generation = self._generation
+                try:
+                    batch = self._sample_fn()
+                except Exception as error:
+                    ## surface the error in the training thread
+                    self._error = error
+                    return
+
+            while not self._stopped.is_set():
+                try:
+                    self._queue.put((generation, batch), timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
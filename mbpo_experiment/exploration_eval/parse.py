@@ -134,7 +134,11 @@ scales = {
         "cnt": 0.1
     }
 }
-with open("%s/%s.pkl"%(EXP_NAME, EXP_INDEX), 'rb') as f:
-    data = pickle.load(f)
+if os.path.isfile("%s/%s.npz"%(EXP_NAME, EXP_INDEX)):
+    data = dict(np.load("%s/%s.npz"%(EXP_NAME, EXP_INDEX)))
+else:
+    # evaluations written before the switch to npz
+    with open("%s/%s.pkl"%(EXP_NAME, EXP_INDEX), 'rb') as f:
+        data = pickle.load(f)
 os.chdir(SAVE_PATH)
 plot(data, style=EXP_NAME)
\ No newline at end of file
@@ -9,7 +9,7 @@ import pdb
 import tensorflow as tf
 import numpy as np
 
-from softlearning.samplers import rollouts
+from softlearning.samplers import rollouts, RemoteEvaluator
 from softlearning.misc.utils import save_video
 
 
@@ -36,6 +36,8 @@ class RLAlgorithm(tf.contrib.checkpoint.Checkpointable):
             eval_deterministic=True,
             eval_render_mode=None,
             video_save_frequency=0,
+            eval_n_workers=0,
+            eval_async=False,
             session=None,
     ):
         """
@@ -51,6 +53,14 @@ class RLAlgorithm(tf.contrib.checkpoint.Checkpointable):
                 deterministic mode when evaluating policy.
             eval_render_mode (`str`): Mode to render evaluation rollouts in.
                 None to disable rendering.
+            eval_n_workers (`int`): Number of worker processes to split the
+                evaluation rollouts across. 0 to run them in this process.
+                Rendered evaluations always run in this process.
+            eval_async (`bool`): If True, the remote evaluation of an epoch
+                runs during the training of the next one, and the evaluation
+                paths reported for an epoch are those of the previous epoch.
+                The evaluation of the last epoch is collected when training
+                finishes and reported with the final diagnostics.
         """
         self.sampler = sampler
 
@@ -69,6 +79,9 @@ class RLAlgorithm(tf.contrib.checkpoint.Checkpointable):
         self._eval_n_episodes = eval_n_episodes
         self._eval_deterministic = eval_deterministic
         self._video_save_frequency = video_save_frequency
+        self._eval_n_workers = eval_n_workers
+        self._eval_async = eval_async
+        self._evaluator = None
 
         if self._video_save_frequency > 0:
             assert eval_render_mode != 'human', (
@@ -256,6 +269,9 @@ class RLAlgorithm(tf.contrib.checkpoint.Checkpointable):
 
             yield diagnostics
 
+        diagnostics.update(
+            self._final_evaluation_diagnostics(evaluation_environment))
+
         self.sampler.terminate()
 
         self._training_after_hook()
@@ -265,6 +281,9 @@ class RLAlgorithm(tf.contrib.checkpoint.Checkpointable):
     def _evaluation_paths(self, policy, evaluation_env):
         if self._eval_n_episodes < 1: return ()
 
+        if self._eval_n_workers > 0 and self._eval_render_mode is None:
+            return self._remote_evaluation_paths(policy, evaluation_env)
+
         with policy.set_deterministic(self._eval_deterministic):
             paths = rollouts(
                 self._eval_n_episodes,
@@ -287,6 +306,40 @@ class RLAlgorithm(tf.contrib.checkpoint.Checkpointable):
 
         return paths
 
+    def _remote_evaluation_paths(self, policy, evaluation_env):
+        if self._evaluator is None:
+            self._evaluator = RemoteEvaluator(
+                evaluation_env, policy, self._eval_n_workers)
+
+        previous_paths = self._evaluator.collect() if self._eval_async else ()
+
+        self._evaluator.submit(
+            policy.get_weights(),
+            self._eval_n_episodes,
+            self.sampler._max_path_length,
+            self._eval_deterministic)
+
+        if self._eval_async:
+            return previous_paths
+
+        return self._evaluator.collect()
+
+    def _final_evaluation_diagnostics(self, evaluation_env):
+        """Collects the evaluation of the last epoch, which asynchronous
+        evaluation submits but only collects during the next epoch."""
+        if self._evaluator is None or not self._eval_async:
+            return {}
+
+        evaluation_paths = self._evaluator.collect()
+        if not evaluation_paths:
+            return {}
+
+        evaluation_metrics = self._evaluate_rollouts(
+            evaluation_paths, evaluation_env)
+        return OrderedDict(
+            (f'evaluation/{key}', evaluation_metrics[key])
+            for key in sorted(evaluation_metrics.keys()))
+
     def _evaluate_rollouts(self, paths, env):
         """Compute evaluation metrics for the given rollouts."""
 
@@ -327,19 +380,37 @@ class RLAlgorithm(tf.contrib.checkpoint.Checkpointable):
 
     def _do_training_repeats(self, timestep):
         """Repeat training _n_train_repeat times every _train_every_n_steps"""
-        if timestep % self._train_every_n_steps > 0: return
+        num_trainings = self._num_period_starts(
+            timestep, self._train_every_n_steps)
+        if num_trainings == 0: return
         trained_enough = (
             self._train_steps_this_epoch
             > self._max_train_repeat_per_timestep * self._timestep)
         if trained_enough: return
 
-        for i in range(self._n_train_repeat):
+        n_train_repeat = self._n_train_repeat * num_trainings
+        self._do_training_steps(timestep, n_train_repeat)
+
+        self._num_train_steps += n_train_repeat
+        self._train_steps_this_epoch += n_train_repeat
+
+        self._policy.refresh_inference_weights()
+
+    def _do_training_steps(self, iteration, num_steps):
+        """Runs `num_steps` training iterations, each on a new batch."""
+        for i in range(num_steps):
             self._do_training(
-                iteration=timestep,
+                iteration=iteration,
                 batch=self._training_batch())
 
-        self._num_train_steps += self._n_train_repeat
-        self._train_steps_this_epoch += self._n_train_repeat
+    def _num_period_starts(self, timestep, period):
+        """Number of multiples of `period` among the timesteps sampled by
+        the last `sampler.sample` call, starting at `timestep`. Always 0 or 1
+        unless the sampler adds several samples per call."""
+        samples_per_step = self.sampler.samples_per_step
+        return (
+            (timestep + samples_per_step - 1) // period
+            - (timestep - 1) // period)
 
     @abc.abstractmethod
     def _do_training(self, iteration, batch):
@@ -353,6 +424,13 @@ class RLAlgorithm(tf.contrib.checkpoint.Checkpointable):
     def tf_saveables(self):
         return {}
 
+    def checkpoint_pools(self, create=False):
+        """Replay pools besides the training pool that are saved with the
+        checkpoints, keyed by a name used for their checkpoint directories.
+        Pools that do not exist yet are left out, unless `create` is set to
+        create them for restoring a checkpoint."""
+        return {}
+
     def __getstate__(self):
         state = {
             '_epoch_length': self._epoch_length,
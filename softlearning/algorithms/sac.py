@@ -117,6 +117,7 @@ class SAC(RLAlgorithm):
         self._init_placeholders()
         self._init_actor_update()
         self._init_critic_update()
+        self._init_target_update()
 
     def train(self, *args, **kwargs):
         """Initiate training of the SAC instance."""
@@ -327,16 +328,30 @@ class SAC(RLAlgorithm):
     def _init_training(self):
         self._update_target(tau=1.0)
 
+    def _init_target_update(self):
+        """Create a single op for the soft update of all the target Qs.
+
+        Keeps the Polyak averaging on the device instead of round-tripping
+        every weight through numpy with `get_weights`/`set_weights`.
+        """
+        self._target_update_tau_ph = tf.placeholder_with_default(
+            tf.constant(self._tau, dtype=tf.float32),
+            shape=(),
+            name='target_update_tau')
+        tau = self._target_update_tau_ph
+
+        self._target_update_op = tf.group(*(
+            tf.assign(target, tau * source + (1.0 - tau) * target)
+            for Q, Q_target in zip(self._Qs, self._Q_targets)
+            for source, target in zip(Q.weights, Q_target.weights)
+        ), name='target_update')
+
     def _update_target(self, tau=None):
         tau = tau or self._tau
 
-        for Q, Q_target in zip(self._Qs, self._Q_targets):
-            source_params = Q.get_weights()
-            target_params = Q_target.get_weights()
-            Q_target.set_weights([
-                tau * source + (1.0 - tau) * target
-                for source, target in zip(source_params, target_params)
-            ])
+        self._session.run(
+            self._target_update_op,
+            feed_dict={self._target_update_tau_ph: tau})
 
     def _do_training(self, iteration, batch):
         """Runs the operations for updating training and target ops."""
@@ -0,0 +1,115 @@
+import numpy as np
+import tensorflow as tf
+
+
+from softlearning.utils.keras import PicklableKerasModel
+
+
+class EnsembleDense(tf.keras.layers.Layer):
+    """Dense layer for `ensemble_size` independent networks at once.
+
+    Weights are stored as `[ensemble_size, input_dim, units]` tensors, like
+    `mbpo.models.fc.FC`. A 2D input `[batch, input_dim]` is shared by all the
+    members; a 3D input `[batch, ensemble_size, input_dim]` feeds each member
+    its own slice. The output is `[batch, ensemble_size, units]`.
+    """
+
+    def __init__(self, units, ensemble_size, activation=None, **kwargs):
+        super(EnsembleDense, self).__init__(**kwargs)
+        self.units = units
+        self.ensemble_size = ensemble_size
+        self.activation = tf.keras.activations.get(activation)
+
+    def build(self, input_shape):
+        input_dim = int(input_shape[-1])
+        # Glorot uniform limit of a single member's [input_dim, units] kernel.
+        limit = np.sqrt(6.0 / (input_dim + self.units))
+        self.kernel = self.add_weight(
+            'kernel',
+            shape=(self.ensemble_size, input_dim, self.units),
+            initializer=tf.keras.initializers.RandomUniform(-limit, limit))
+        self.bias = self.add_weight(
+            'bias',
+            shape=(self.ensemble_size, self.units),
+            initializer=tf.keras.initializers.Zeros())
+        super(EnsembleDense, self).build(input_shape)
+
+    def call(self, inputs):
+        if inputs.shape.ndims == 2:
+            input_dim = self.kernel.shape[1]
+            kernel = tf.reshape(
+                tf.transpose(self.kernel, (1, 0, 2)),
+                (input_dim, self.ensemble_size * self.units))
+            outputs = tf.reshape(
+                tf.matmul(inputs, kernel),
+                (-1, self.ensemble_size, self.units))
+        else:
+            outputs = tf.transpose(
+                tf.matmul(tf.transpose(inputs, (1, 0, 2)), self.kernel),
+                (1, 0, 2))
+
+        return self.activation(outputs + self.bias)
+
+    def compute_output_shape(self, input_shape):
+        return tf.TensorShape(
+            (input_shape[0], self.ensemble_size, self.units))
+
+    def get_config(self):
+        config = {
+            'units': self.units,
+            'ensemble_size': self.ensemble_size,
+            'activation': tf.keras.activations.serialize(self.activation),
+        }
+        base_config = super(EnsembleDense, self).get_config()
+        return dict(list(base_config.items()) + list(config.items()))
+
+
+tf.keras.utils.get_custom_objects()['EnsembleDense'] = EnsembleDense
+
+
+def ensemble_feedforward_model(input_shapes,
+                               output_size,
+                               hidden_layer_sizes,
+                               ensemble_size,
+                               activation='relu',
+                               output_activation='linear',
+                               preprocessors=None,
+                               name='ensemble_feedforward_model'):
+    """Feedforward model with `ensemble_size` independent heads.
+
+    Returns a model with outputs of shape `[batch, ensemble_size * output_size]`,
+    where the outputs of head `i` are
+    `outputs[:, i * output_size:(i + 1) * output_size]`.
+    """
+    inputs = [
+        tf.keras.layers.Input(shape=input_shape)
+        for input_shape in input_shapes
+    ]
+
+    if preprocessors is None:
+        preprocessors = (None, ) * len(inputs)
+
+    preprocessed_inputs = [
+        preprocessor(input_) if preprocessor is not None else input_
+        for preprocessor, input_ in zip(preprocessors, inputs)
+    ]
+
+    concatenated = tf.keras.layers.Lambda(
+        lambda x: tf.concat(x, axis=-1)
+    )(preprocessed_inputs)
+
+    out = concatenated
+    for units in hidden_layer_sizes:
+        out = EnsembleDense(
+            units, ensemble_size, activation=activation
+        )(out)
+
+    out = EnsembleDense(
+        output_size, ensemble_size, activation=output_activation
+    )(out)
+
+    out = tf.keras.layers.Reshape((ensemble_size * output_size, ))(out)
+
+    model = PicklableKerasModel(inputs, out, name=name)
+
+    return model
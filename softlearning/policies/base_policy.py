@@ -9,8 +9,13 @@ class BasePolicy(Serializable):
     def __init__(self):
         self._deterministic = False
 
-    def reset(self):
-        """Reset and clean the policy."""
+    def reset(self, indices=None):
+        """Reset and clean the policy.
+
+        Args:
+            indices: Rows of the batched state to reset, for policies that
+                are stepped on several environments at once. None resets all.
+        """
         raise NotImplementedError
 
     def actions(self, conditions):
@@ -29,6 +34,14 @@ class BasePolicy(Serializable):
         """Compute (numeric) log probs for given observations and actions."""
         raise NotImplementedError
 
+    def refresh_inference_weights(self):
+        """Sync any cached inference weights with the trained model.
+
+        Called after training updates. Policies that compute `actions_np`
+        through their TensorFlow models have nothing to sync.
+        """
+        pass
+
     @contextmanager
     def set_deterministic(self, deterministic=True):
         """Context manager for changing the determinism of the policy.
@@ -76,8 +89,13 @@ class LatentSpacePolicy(BasePolicy):
         self._reset_smoothing_x()
         self._smooth_latents = False
 
-    def _reset_smoothing_x(self):
-        self._smoothing_x = np.zeros((1, *self._output_shape))
+    def _reset_smoothing_x(self, indices=None):
+        # Until actions are computed for a batch, the state is a single row
+        # shared by all environments.
+        if indices is None or self._smoothing_x.shape[0] == 1:
+            self._smoothing_x = np.zeros((1, *self._output_shape))
+        else:
+            self._smoothing_x[indices] = 0.0
 
     def actions_np(self, conditions):
         if self._deterministic:
@@ -94,5 +112,5 @@ class LatentSpacePolicy(BasePolicy):
             return self.actions_model_for_fixed_latents.predict(
                 [*conditions, latents])
 
-    def reset(self):
-        self._reset_smoothing_x()
+    def reset(self, indices=None):
+        self._reset_smoothing_x(indices)
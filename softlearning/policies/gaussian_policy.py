@@ -13,6 +13,14 @@ from .base_policy import LatentSpacePolicy
 
 SCALE_DIAG_MIN_MAX = (-20, 2)
 
+NUMPY_ACTIVATIONS = {
+    None: lambda x: x,
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0),
+    'tanh': np.tanh,
+    'sigmoid': lambda x: 1.0 / (1.0 + np.exp(-x)),
+}
+
 
 class GaussianPolicy(LatentSpacePolicy):
     def __init__(self,
@@ -21,6 +29,7 @@ class GaussianPolicy(LatentSpacePolicy):
                  squash=True,
                  preprocessor=None,
                  name=None,
+                 numpy_inference=False,
                  *args,
                  **kwargs):
         self._Serializable__initialize(locals())
@@ -30,6 +39,8 @@ class GaussianPolicy(LatentSpacePolicy):
         self._squash = squash
         self._name = name
         self._preprocessor = preprocessor
+        self._numpy_inference = numpy_inference
+        self._inference_weights = None
 
         super(GaussianPolicy, self).__init__(*args, **kwargs)
 
@@ -45,10 +56,17 @@ class GaussianPolicy(LatentSpacePolicy):
         if preprocessor is not None:
             conditions = preprocessor(conditions)
 
-        shift_and_log_scale_diag = self._shift_and_log_scale_diag_net(
-            input_shapes=(conditions.shape[1:], ),
-            output_size=output_shape[0] * 2,
-        )(conditions)
+        self._shift_and_log_scale_diag_model = (
+            self._shift_and_log_scale_diag_net(
+                input_shapes=(conditions.shape[1:], ),
+                output_size=output_shape[0] * 2,
+            ))
+        shift_and_log_scale_diag = self._shift_and_log_scale_diag_model(
+            conditions)
+
+        if numpy_inference and preprocessor is not None:
+            raise NotImplementedError(
+                "NumPy inference does not support preprocessors.")
 
         shift, log_scale_diag = tf.keras.layers.Lambda(
             lambda shift_and_log_scale_diag: tf.split(
@@ -67,6 +85,10 @@ class GaussianPolicy(LatentSpacePolicy):
             log_scale_diag
         )
 
+        self.shift_and_log_scale_diag_model = tf.keras.Model(
+            self.condition_inputs,
+            (shift, log_scale_diag))
+
         batch_size = tf.keras.layers.Lambda(
             lambda x: tf.shape(x)[0])(conditions)
 
@@ -163,7 +185,14 @@ class GaussianPolicy(LatentSpacePolicy):
         return self.actions_model.get_weights()
 
     def set_weights(self, *args, **kwargs):
-        return self.actions_model.set_weights(*args, **kwargs)
+        result = self.actions_model.set_weights(*args, **kwargs)
+        self.refresh_inference_weights()
+        return result
+
+    def refresh_inference_weights(self):
+        if self._numpy_inference:
+            self._inference_weights = (
+                self._shift_and_log_scale_diag_model.get_weights())
 
     @property
     def trainable_variables(self):
@@ -185,7 +214,41 @@ class GaussianPolicy(LatentSpacePolicy):
         return self.log_pis_model([*conditions, actions])
 
     def actions_np(self, conditions):
-        return super(GaussianPolicy, self).actions_np(conditions)
+        if not self._numpy_inference:
+            return super(GaussianPolicy, self).actions_np(conditions)
+
+        if self._inference_weights is None:
+            self.refresh_inference_weights()
+
+        shift, log_scale_diag = self._shift_and_log_scale_diag_np(conditions)
+
+        if self._deterministic:
+            raw_actions = shift
+        else:
+            raw_latents = np.random.standard_normal(
+                shift.shape).astype(np.float32)
+            if self._smoothing_alpha == 0:
+                latents = raw_latents
+            else:
+                alpha, beta = self._smoothing_alpha, self._smoothing_beta
+                self._smoothing_x = (
+                    alpha * self._smoothing_x + (1.0 - alpha) * raw_latents)
+                latents = beta * self._smoothing_x
+            raw_actions = shift + np.exp(log_scale_diag) * latents
+
+        actions = np.tanh(raw_actions) if self._squash else raw_actions
+        return actions.astype(np.float32)
+
+    def _shift_and_log_scale_diag_np(self, conditions):
+        """Shift and log scale outputs for the NumPy sampling path.
+
+        Subclasses mirror their network in NumPy with the weights cached by
+        `refresh_inference_weights`. This fallback predicts them with the
+        TensorFlow model.
+        """
+        shift, log_scale_diag = self.shift_and_log_scale_diag_model.predict(
+            conditions)
+        return shift, log_scale_diag
 
     def log_pis_np(self, conditions, actions):
         assert not self._deterministic, self._deterministic
@@ -244,6 +307,31 @@ class FeedforwardGaussianPolicy(GaussianPolicy):
 
         return shift_and_log_scale_diag_net
 
+    def _shift_and_log_scale_diag_np(self, conditions):
+        # Like Keras predict, accept a bare array for the single input.
+        if isinstance(conditions, np.ndarray):
+            conditions = [conditions]
+
+        out = np.concatenate(
+            [np.asarray(condition, dtype=np.float32)
+             for condition in conditions],
+            axis=-1)
+
+        weights = self._inference_weights
+        num_layers = len(weights) // 2
+        for i, (kernel, bias) in enumerate(zip(weights[::2], weights[1::2])):
+            out = out.dot(kernel) + bias
+            activation = (
+                self._output_activation
+                if i == num_layers - 1
+                else self._activation)
+            out = NUMPY_ACTIVATIONS[activation](out)
+
+        shift, log_scale_diag = np.split(out, 2, axis=-1)
+        log_scale_diag = np.clip(log_scale_diag, *SCALE_DIAG_MIN_MAX)
+
+        return shift, log_scale_diag
+
     def get_distribution(self, conditions):
         """Return diagnostic information of the policy.
 
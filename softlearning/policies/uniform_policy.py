@@ -49,7 +49,7 @@ class UniformPolicy(BasePolicy):
     def trainable_variables(self):
         return []
 
-    def reset(self):
+    def reset(self, indices=None):
         pass
 
     def actions(self, conditions):
@@ -2,3 +2,5 @@ from .simple_replay_pool import SimpleReplayPool
 from .extra_policy_info_replay_pool import ExtraPolicyInfoReplayPool
 from .union_pool import UnionPool
 from .trajectory_replay_pool import TrajectoryReplayPool
+from .memmap_replay_pool import MemmapReplayPool
+from .compact_replay_pool import CompactReplayPool
@@ -0,0 +1,285 @@
+import numpy as np
+from gym.spaces import Dict
+
+from .flexible_replay_pool import FlexibleReplayPool
+
+
+OBSERVATION_DTYPES = (None, 'float32', 'float16', 'int16')
+
+
+class CompactReplayPool(FlexibleReplayPool):
+    """Replay pool that stores each observation once and optionally
+    compresses it.
+
+    A transition's next observation is stored by reference to the following
+    row when that row starts with the same observation, which is the case
+    within an episode added in order. Next observations that do not match
+    the following row (episode ends, model rollouts added as independent
+    transitions) go to a side table that grows on demand. Side table entries
+    are freed in FIFO order together with the rows referencing them.
+
+    Observations can be stored as float16, or as int16 affine-quantised
+    between per-dimension `observation_bounds`; they are decoded back to
+    float32 in `batch_by_indices`.
+    """
+
+    def __init__(self,
+                 observation_space,
+                 action_space,
+                 max_size,
+                 observation_dtype=None,
+                 observation_bounds=None):
+        if isinstance(observation_space, Dict):
+            raise NotImplementedError(
+                "{} does not support observation spaces of type '{}'."
+                "".format(type(self).__name__, type(observation_space)))
+        if observation_dtype not in OBSERVATION_DTYPES:
+            raise ValueError(
+                "Invalid observation_dtype '{}', expected one of {}."
+                "".format(observation_dtype, OBSERVATION_DTYPES))
+
+        self._observation_space = observation_space
+        self._action_space = action_space
+        self._observation_dtype = np.dtype(
+            observation_dtype or observation_space.dtype)
+
+        if self._observation_dtype == np.int16:
+            if observation_bounds is None:
+                observation_bounds = (
+                    observation_space.low, observation_space.high)
+            low, high = (
+                np.broadcast_to(
+                    np.asarray(bound, dtype=np.float64),
+                    observation_space.shape)
+                for bound in observation_bounds)
+            if not (np.all(np.isfinite(low)) and np.all(np.isfinite(high))):
+                raise ValueError(
+                    "int16 observations need finite observation_bounds.")
+            self._observation_low = low
+            self._observation_scale = np.maximum(high - low, 1e-8) / 65535.0
+
+        fields = {
+            'observations': {
+                'shape': observation_space.shape,
+                'dtype': self._observation_dtype,
+            },
+            # next_refs[i] == -1: the next observation is observations[i + 1]
+            # next_refs[i] >= 0: it is stored in the side table at next_refs[i]
+            'next_refs': {
+                'shape': (),
+                'dtype': 'int32',
+            },
+            'actions': {
+                'shape': action_space.shape,
+                'dtype': 'float32',
+            },
+            'rewards': {
+                'shape': (1, ),
+                'dtype': 'float32',
+            },
+            'terminals': {
+                'shape': (1, ),
+                'dtype': 'bool',
+            },
+        }
+
+        super(CompactReplayPool, self).__init__(
+            max_size=max_size, fields_attrs=fields)
+
+        self._next_observations = np.zeros(
+            (min(self._max_size, 1024), *observation_space.shape),
+            dtype=self._observation_dtype)
+        self._side_start = 0
+        self._side_count = 0
+
+    def _encode(self, observations):
+        if self._observation_dtype != np.int16:
+            return observations.astype(self._observation_dtype, copy=False)
+
+        quantised = np.round(
+            (observations - self._observation_low) / self._observation_scale)
+        return (np.clip(quantised, 0, 65535) - 32768).astype(np.int16)
+
+    def _decode(self, observations):
+        if self._observation_dtype != np.int16:
+            return observations.astype(np.float32, copy=False)
+
+        return (
+            (observations.astype(np.float64) + 32768)
+            * self._observation_scale
+            + self._observation_low
+        ).astype(np.float32)
+
+    def _oldest_indices(self, count):
+        oldest = self._pointer - self._size
+        return np.arange(oldest, oldest + count) % self._max_size
+
+    def _free_side_entries(self, indices):
+        """Frees the side table entries of the oldest rows `indices`."""
+        freed = np.count_nonzero(self.fields['next_refs'][indices] >= 0)
+        capacity = self._next_observations.shape[0]
+        self._side_start = (self._side_start + freed) % capacity
+        self._side_count -= freed
+
+    def _compact_side_table(self, capacity):
+        """Moves the live side table entries to the front of a table with
+        room for `capacity` entries."""
+        old_capacity = self._next_observations.shape[0]
+        live = (self._side_start + np.arange(self._side_count)) % old_capacity
+
+        next_observations = np.zeros(
+            (capacity, *self._next_observations.shape[1:]),
+            dtype=self._observation_dtype)
+        next_observations[:self._side_count] = self._next_observations[live]
+
+        next_refs = self.fields['next_refs']
+        stored = next_refs >= 0
+        next_refs[stored] = (
+            next_refs[stored] - self._side_start) % old_capacity
+
+        self._next_observations = next_observations
+        self._side_start = 0
+
+    def add_samples(self, samples):
+        num_samples = samples['observations'].shape[0]
+        if num_samples == 0:
+            return
+
+        # Only the last max_size samples would survive the write anyway.
+        skip = max(num_samples - self._max_size, 0)
+        num_samples -= skip
+        self._samples_since_save += skip
+        self._total_samples += skip
+
+        observations = self._encode(samples['observations'][skip:])
+        next_observations = self._encode(samples['next_observations'][skip:])
+
+        num_evicted = max(self._size + num_samples - self._max_size, 0)
+        if num_evicted:
+            self._free_side_entries(self._oldest_indices(num_evicted))
+
+        next_refs = self.fields['next_refs']
+        capacity = self._next_observations.shape[0]
+
+        # The newest row is the only one whose successor is not stored yet,
+        # so its next observation is always the newest side table entry.
+        newest = (self._pointer - 1) % self._max_size
+        newest_side = (
+            self._side_start + self._side_count - 1) % capacity
+        if (num_evicted < self._size
+                and np.array_equal(
+                    self._next_observations[newest_side], observations[0])):
+            next_refs[newest] = -1
+            self._side_count -= 1
+
+        is_successor = np.zeros(num_samples, dtype=bool)
+        is_successor[:-1] = np.all(
+            next_observations[:-1] == observations[1:],
+            axis=tuple(range(1, observations.ndim)))
+        stored = np.flatnonzero(~is_successor)
+
+        if self._side_count + stored.size > capacity:
+            capacity = min(
+                max(2 * capacity, self._side_count + stored.size),
+                self._max_size)
+            self._compact_side_table(capacity)
+
+        side_indices = (
+            self._side_start + self._side_count + np.arange(stored.size)
+        ) % capacity
+        self._next_observations[side_indices] = next_observations[stored]
+        self._side_count += stored.size
+
+        row_next_refs = np.full(num_samples, -1, dtype=np.int32)
+        row_next_refs[stored] = side_indices
+
+        indices = (self._pointer + np.arange(num_samples)) % self._max_size
+        self.fields['observations'][indices] = observations
+        next_refs[indices] = row_next_refs
+        for field_name in ('actions', 'rewards', 'terminals'):
+            self.fields[field_name][indices] = samples[field_name][skip:]
+
+        self._advance(num_samples)
+
+    def add_selected_samples(self, samples, indices):
+        self.add_samples({
+            field_name: samples[field_name][indices]
+            for field_name in (
+                'observations',
+                'next_observations',
+                'actions',
+                'rewards',
+                'terminals',
+            )
+        })
+
+    def reserve_samples(self, num_samples):
+        raise NotImplementedError(
+            "{} does not store next observations as a field, use"
+            " add_samples instead.".format(type(self).__name__))
+
+    def resize(self, max_size, chunk_size=int(1e5)):
+        max_size = int(max_size)
+        num_dropped = max(self._size - max_size, 0)
+        self._free_side_entries(self._oldest_indices(num_dropped))
+
+        self._compact_side_table(
+            max(min(self._next_observations.shape[0], max_size),
+                self._side_count,
+                1))
+
+        return super(CompactReplayPool, self).resize(
+            max_size, chunk_size=chunk_size)
+
+    def batch_by_indices(self, indices, field_name_filter=None):
+        if np.any(indices % self._max_size > self.size):
+            raise ValueError(
+                "Tried to retrieve batch with indices greater than current"
+                " size")
+
+        observations = self.fields['observations']
+        next_refs = self.fields['next_refs'][indices]
+        is_successor = next_refs < 0
+
+        next_observations = np.empty(
+            (indices.shape[0], *observations.shape[1:]),
+            dtype=self._observation_dtype)
+        next_observations[is_successor] = observations[
+            (indices[is_successor] + 1) % self._max_size]
+        next_observations[~is_successor] = self._next_observations[
+            next_refs[~is_successor]]
+
+        batch = {
+            'observations': self._decode(observations[indices]),
+            'next_observations': self._decode(next_observations),
+            'actions': self.fields['actions'][indices],
+            'rewards': self.fields['rewards'][indices],
+            'terminals': self.fields['terminals'][indices],
+        }
+
+        if field_name_filter is not None:
+            filtered_fields = self.filter_fields(
+                batch.keys(), field_name_filter)
+            batch = {
+                field_name: batch[field_name]
+                for field_name in filtered_fields
+            }
+
+        return batch
+
+    def return_all_samples(self):
+        return self.batch_by_indices(np.arange(self._size))
+
+    def __setstate__(self, state):
+        state.setdefault('_total_samples', state['_size'])
+        pad_size = state['_max_size'] - state['_size']
+        for field_name, values in state['fields'].items():
+            state['fields'][field_name] = np.concatenate((
+                values,
+                np.zeros((pad_size, *values.shape[1:]), dtype=values.dtype)
+            ), axis=0)
+
+        self.__dict__ = state
+
+    def terminate_episode(self):
+        pass
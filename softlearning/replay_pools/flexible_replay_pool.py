@@ -1,5 +1,9 @@
 import gzip
+import json
+import os
 import pickle
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 
@@ -21,11 +25,18 @@ class FlexibleReplayPool(ReplayPool):
         self._pointer = 0
         self._size = 0
         self._samples_since_save = 0
+        self._total_samples = 0
 
     @property
     def size(self):
         return self._size
 
+    @property
+    def total_samples(self):
+        """Number of samples added over the lifetime of the pool, including
+        the ones evicted since."""
+        return self._total_samples
+
     @property
     def field_names(self):
         return list(self.fields.keys())
@@ -43,6 +54,7 @@ class FlexibleReplayPool(ReplayPool):
         self._pointer = (self._pointer + count) % self._max_size
         self._size = min(self._size + count, self._max_size)
         self._samples_since_save += count
+        self._total_samples += count
 
     def add_sample(self, sample):
         samples = {
@@ -51,22 +63,172 @@ class FlexibleReplayPool(ReplayPool):
         }
         self.add_samples(samples)
 
+    def _ring_slices(self, num_samples):
+        """Returns the (pool_slice, sample_slice) pairs covering the next
+        num_samples rows of the ring buffer. There are at most two of them,
+        the second one only when the write wraps around the end."""
+        first = min(num_samples, self._max_size - self._pointer)
+        slices = [(slice(self._pointer, self._pointer + first),
+                   slice(0, first))]
+        if first < num_samples:
+            slices.append((slice(0, num_samples - first),
+                           slice(first, num_samples)))
+        return slices
+
     def add_samples(self, samples):
         field_names = list(samples.keys())
         num_samples = samples[field_names[0]].shape[0]
 
-        index = np.arange(
-            self._pointer, self._pointer + num_samples) % self._max_size
+        # Only the last max_size samples would survive the write anyway.
+        skip = max(num_samples - self._max_size, 0)
+        self._advance(skip)
 
         for field_name in self.field_names:
-            default_value = (
-                self.fields_attrs[field_name].get('default_value', 0.0))
-            values = samples.get(field_name, default_value)
-            assert values.shape[0] == num_samples
-            self.fields[field_name][index] = values
-
+            field = self.fields[field_name]
+            if field_name in samples:
+                values = samples[field_name]
+                assert values.shape[0] == num_samples
+                values = values[skip:]
+            else:
+                values = None
+
+            for pool_slice, sample_slice in self._ring_slices(
+                    num_samples - skip):
+                if values is None:
+                    field[pool_slice] = (
+                        self.fields_attrs[field_name].get('default_value', 0.0))
+                else:
+                    field[pool_slice] = values[sample_slice]
+
+        self._advance(num_samples - skip)
+
+    def reserve_samples(self, num_samples):
+        """Reserves the next num_samples rows of the pool for writing.
+
+        Returns a list of (at most two) dicts mapping each field name to a
+        writable view of consecutive pool rows. The rows count as added once
+        this returns, so they have to be filled before the pool is sampled.
+        """
+        assert num_samples <= self._max_size, (num_samples, self._max_size)
+
+        views = [
+            {
+                field_name: field[pool_slice]
+                for field_name, field in self.fields.items()
+            }
+            for pool_slice, _ in self._ring_slices(num_samples)
+        ]
         self._advance(num_samples)
 
+        return views
+
+    def add_selected_samples(self, samples, indices):
+        """Adds the rows `indices` of `samples` without materializing the
+        selection first; rows are gathered straight into the pool. Fields
+        missing from `samples` are filled with their default value."""
+        num_samples = indices.shape[0]
+        num_rows = next(iter(samples.values())).shape[0]
+        # Checked once up front: np.take with out= and mode='raise' would
+        # gather into a temporary buffer instead of the pool.
+        if num_samples and (np.min(indices) < 0 or np.max(indices) >= num_rows):
+            raise IndexError(
+                "Indices out of range for samples with {} rows."
+                "".format(num_rows))
+
+        # Only the last max_size samples would survive the write anyway.
+        skip = max(num_samples - self._max_size, 0)
+        self._advance(skip)
+        indices = indices[skip:]
+
+        start = 0
+        for views in self.reserve_samples(num_samples - skip):
+            stop = start + next(iter(views.values())).shape[0]
+            for field_name in self.field_names:
+                view = views[field_name]
+                if field_name not in samples:
+                    view[...] = (
+                        self.fields_attrs[field_name].get('default_value', 0.0))
+                    continue
+
+                values = samples[field_name]
+                if values.dtype == view.dtype:
+                    np.take(values, indices[start:stop], axis=0, out=view,
+                            mode='clip')
+                else:
+                    view[...] = values[indices[start:stop]]
+            start = stop
+
+    def resize(self, max_size, chunk_size=int(1e5)):
+        """Grows or shrinks the pool in place.
+
+        Samples are first rotated into insertion order, so that after the
+        resize the oldest sample sits at index 0 and eviction continues in
+        FIFO order. When shrinking, only the most recent `max_size` samples
+        are kept. Fields are processed one at a time and rows are moved in
+        chunks of `chunk_size`, so the extra memory needed at any point is
+        bounded by half of the largest field instead of a full copy of the
+        pool.
+
+        Returns:
+            stats (`dict`): Pool size in bytes before and after the resize,
+                and the peak number of bytes held during it.
+        """
+        max_size = int(max_size)
+        keep = min(self._size, max_size)
+        # Samples live in [0, size) in order unless the pool has wrapped.
+        rotation = self._pointer if self._size == self._max_size else 0
+
+        before_bytes = current_bytes = sum(
+            field.nbytes for field in self.fields.values())
+        peak_bytes = before_bytes
+
+        for field_name in self.field_names:
+            field = self.fields[field_name]
+            row_bytes = field.nbytes // max(field.shape[0], 1)
+            old_bytes = field.nbytes
+
+            extra_rows = _rotate_rows(field, rotation, chunk_size)
+            extra_rows += _move_rows(
+                field, self._size - keep, 0, keep, chunk_size)
+            del field
+
+            realloc_bytes = self._resize_field(field_name, max_size, keep)
+
+            new_bytes = self.fields[field_name].nbytes
+            peak_bytes = max(
+                peak_bytes,
+                current_bytes + extra_rows * row_bytes,
+                current_bytes + realloc_bytes)
+            current_bytes += new_bytes - old_bytes
+
+        self._max_size = max_size
+        self._size = keep
+        self._pointer = keep % max_size
+        self._samples_since_save = min(self._samples_since_save, keep)
+
+        return {
+            'before_bytes': before_bytes,
+            'after_bytes': current_bytes,
+            'peak_bytes': max(peak_bytes, current_bytes),
+        }
+
+    def _resize_field(self, field_name, max_size, keep):
+        """Reallocates a field to max_size rows, keeping its first keep rows.
+        Returns the number of bytes temporarily held by a copy."""
+        try:
+            self.fields[field_name].resize(
+                (max_size, *self.fields[field_name].shape[1:]))
+            return 0
+        except ValueError:
+            # The array is referenced elsewhere or does not own its
+            # memory, so it cannot be reallocated in place.
+            old_field = self.fields[field_name]
+            new_field = np.zeros(
+                (max_size, *old_field.shape[1:]), dtype=old_field.dtype)
+            new_field[:keep] = old_field[:keep]
+            self.fields[field_name] = new_field
+            return new_field.nbytes
+
     def random_indices(self, batch_size):
         if self._size == 0: return np.arange(0, 0)
         return np.random.randint(0, self._size, batch_size)
@@ -139,6 +301,77 @@ class FlexibleReplayPool(ReplayPool):
         self.add_samples(latest_samples)
         self._samples_since_save = 0
 
+    def save_latest_chunk(self, directory, compression='zlib'):
+        """Appends the samples added since the last save to `directory`.
+
+        Every field of the new chunk is written to its own file, raw or
+        zlib-compressed, in parallel threads. The chunk is listed in the
+        directory's manifest only once all of its files are written.
+        """
+        if compression not in CHUNK_COMPRESSIONS:
+            raise ValueError(
+                "Invalid compression '{}', expected one of {}."
+                "".format(compression, CHUNK_COMPRESSIONS))
+
+        os.makedirs(directory, exist_ok=True)
+        manifest = _read_manifest(directory)
+
+        latest_samples = self.last_n_batch(self._samples_since_save)
+        num_samples = next(iter(latest_samples.values())).shape[0]
+
+        if num_samples > 0:
+            chunk_name = 'chunk_{:06d}'.format(len(manifest['chunks']))
+            fields = {
+                field_name: {
+                    'file': '{}.{}{}'.format(
+                        chunk_name, field_name, '.z' if compression else ''),
+                    'dtype': values.dtype.str,
+                    'shape': list(values.shape),
+                }
+                for field_name, values in latest_samples.items()
+            }
+
+            with ThreadPoolExecutor() as executor:
+                list(executor.map(
+                    lambda field_name: _write_chunk_field(
+                        os.path.join(directory, fields[field_name]['file']),
+                        latest_samples[field_name],
+                        compression),
+                    fields.keys()))
+
+            manifest['chunks'].append({
+                'name': chunk_name,
+                'num_samples': num_samples,
+                'compression': compression,
+                'fields': fields,
+            })
+
+        _write_manifest(directory, manifest)
+        self._samples_since_save = 0
+
+    def load_chunks(self, directories):
+        """Adds the chunks saved in `directories`, oldest first.
+
+        Chunks whose samples would all be evicted by newer ones are not
+        read. The remaining chunks are read in parallel threads.
+        """
+        chunks = [
+            (directory, chunk)
+            for directory in directories
+            for chunk in _read_manifest(directory)['chunks']
+        ]
+
+        first, num_needed = len(chunks), self._max_size
+        while first > 0 and num_needed > 0:
+            first -= 1
+            num_needed -= chunks[first][1]['num_samples']
+
+        with ThreadPoolExecutor() as executor:
+            for samples in executor.map(_read_chunk, chunks[first:]):
+                self.add_samples(samples)
+
+        self._samples_since_save = 0
+
     def return_all_samples(self):
         return {
             field_name: self.fields[field_name][:self.size]
@@ -155,6 +388,7 @@ class FlexibleReplayPool(ReplayPool):
         return state
 
     def __setstate__(self, state):
+        state.setdefault('_total_samples', state['_size'])
         if state['_size'] < state['_max_size']:
             pad_size = state['_max_size'] - state['_size']
             for field_name in state['fields'].keys():
@@ -165,3 +399,90 @@ class FlexibleReplayPool(ReplayPool):
                 ), axis=0)
 
         self.__dict__ = state
+
+
+CHUNK_COMPRESSIONS = (None, 'zlib')
+CHUNK_MANIFEST = 'manifest.json'
+
+
+def has_chunks(directory):
+    return os.path.exists(os.path.join(directory, CHUNK_MANIFEST))
+
+
+def _read_manifest(directory):
+    if not has_chunks(directory):
+        return {'chunks': []}
+
+    with open(os.path.join(directory, CHUNK_MANIFEST), 'r') as f:
+        return json.load(f)
+
+
+def _write_manifest(directory, manifest):
+    manifest_path = os.path.join(directory, CHUNK_MANIFEST)
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+
+def _write_chunk_field(path, values, compression):
+    data = np.ascontiguousarray(values).tobytes()
+    if compression == 'zlib':
+        # zlib releases the GIL, so the fields compress in parallel.
+        data = zlib.compress(data, 1)
+
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def _read_chunk(directory_and_chunk):
+    directory, chunk = directory_and_chunk
+
+    samples = {}
+    for field_name, field in chunk['fields'].items():
+        with open(os.path.join(directory, field['file']), 'rb') as f:
+            data = f.read()
+        if chunk['compression'] == 'zlib':
+            data = zlib.decompress(data)
+        samples[field_name] = np.frombuffer(
+            data, dtype=np.dtype(field['dtype'])).reshape(field['shape'])
+
+    return samples
+
+
+def _move_rows(array, source, destination, count, chunk_size):
+    """Moves array[source:source + count] to array[destination:...] in
+    chunks, so that overlapping moves never need more than one chunk of
+    temporary memory. Returns the number of temporary rows needed."""
+    if count == 0 or source == destination:
+        return 0
+
+    starts = range(0, count, chunk_size)
+    if destination > source:
+        # Copy back to front so that no row is overwritten before it moved.
+        starts = reversed(starts)
+
+    for start in starts:
+        stop = min(start + chunk_size, count)
+        array[destination + start:destination + stop] = (
+            array[source + start:source + stop])
+
+    return min(chunk_size, count) if abs(destination - source) < count else 0
+
+
+def _rotate_rows(array, shift, chunk_size):
+    """Rotates array in place so that array[shift] becomes array[0].
+    Returns the number of temporary rows needed."""
+    size = array.shape[0]
+    if shift % size == 0:
+        return 0
+
+    if shift <= size - shift:
+        head = array[:shift].copy()
+        moved = _move_rows(array, shift, 0, size - shift, chunk_size)
+        array[size - shift:] = head
+    else:
+        head = array[shift:].copy()
+        moved = _move_rows(array, 0, size - shift, shift, chunk_size)
+        array[:size - shift] = head
+
+    return head.shape[0] + moved
@@ -0,0 +1,92 @@
+import mmap
+import tempfile
+
+import numpy as np
+
+from .simple_replay_pool import SimpleReplayPool
+
+
+class MemmapReplayPool(SimpleReplayPool):
+    """SimpleReplayPool with its fields in memory-mapped temporary files.
+
+    Each field is backed by its own file in `directory` (the system temp
+    directory by default), sized in whole pages and removed when the pool is
+    garbage collected. The OS page cache keeps the recently used pages in
+    memory, so the pool can hold more samples than fit in RAM. Batches are
+    gathered in index order to read the mapped pages sequentially.
+
+    Pickling keeps the configuration of the pool but not its samples, which
+    would have to be read into memory; checkpoint them with
+    `save_latest_chunk` and `load_chunks` instead.
+    """
+
+    def __init__(self, *args, directory=None, **kwargs):
+        self._directory = directory
+        self._field_files = {}
+        super(MemmapReplayPool, self).__init__(*args, **kwargs)
+
+    def add_fields(self, fields_attrs):
+        self.fields_attrs.update(fields_attrs)
+
+        for field_name in fields_attrs.keys():
+            self.fields[field_name] = self._map_field(
+                field_name, self._max_size)
+
+    def _map_field(self, field_name, max_size):
+        field_attrs = self.fields_attrs[field_name]
+        dtype = np.dtype(field_attrs['dtype'])
+        field_shape = (max_size, *field_attrs['shape'])
+
+        if field_name not in self._field_files:
+            self._field_files[field_name] = tempfile.TemporaryFile(
+                dir=self._directory)
+        field_file = self._field_files[field_name]
+
+        # Growing the file fills the new pages with zeros.
+        field_bytes = int(np.prod(field_shape)) * dtype.itemsize
+        field_file.truncate(_round_to_pages(max(field_bytes, 1)))
+
+        return np.memmap(field_file, dtype=dtype, mode='r+', shape=field_shape)
+
+    def _resize_field(self, field_name, max_size, keep):
+        # The kept rows are at the front, so truncating the file keeps them.
+        self.fields[field_name].flush()
+        del self.fields[field_name]
+        self.fields[field_name] = self._map_field(field_name, max_size)
+        return 0
+
+    def batch_by_indices(self, indices, *args, **kwargs):
+        # The rows are put back in the requested order afterwards, which
+        # callers that split or truncate batches rely on.
+        indices = np.asarray(indices)
+        order = np.argsort(indices, kind='stable')
+        batch = super(MemmapReplayPool, self).batch_by_indices(
+            indices[order], *args, **kwargs)
+
+        inverse = np.empty_like(order)
+        inverse[order] = np.arange(order.size)
+        return {
+            field_name: values[inverse]
+            for field_name, values in batch.items()
+        }
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['fields']
+        del state['_field_files']
+
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__ = state
+        self._field_files = {}
+        self.fields = {}
+        self.add_fields(self.fields_attrs)
+
+        self._pointer = 0
+        self._size = 0
+        self._samples_since_save = 0
+
+
+def _round_to_pages(num_bytes):
+    return -(-num_bytes // mmap.PAGESIZE) * mmap.PAGESIZE
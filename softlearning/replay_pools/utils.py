@@ -4,7 +4,9 @@ from . import (
     simple_replay_pool,
     extra_policy_info_replay_pool,
     union_pool,
-    trajectory_replay_pool)
+    trajectory_replay_pool,
+    memmap_replay_pool,
+    compact_replay_pool)
 
 
 POOL_CLASSES = {
@@ -13,6 +15,8 @@ POOL_CLASSES = {
     'ExtraPolicyInfoReplayPool': (
         extra_policy_info_replay_pool.ExtraPolicyInfoReplayPool),
     'UnionPool': union_pool.UnionPool,
+    'MemmapReplayPool': memmap_replay_pool.MemmapReplayPool,
+    'CompactReplayPool': compact_replay_pool.CompactReplayPool,
 }
 
 DEFAULT_REPLAY_POOL = 'SimpleReplayPool'
@@ -2,5 +2,7 @@ from .base_sampler import BaseSampler
 from .dummy_sampler import DummySampler
 from .simple_sampler import SimpleSampler
 from .remote_sampler import RemoteSampler
+from .vector_sampler import VectorSampler
+from .remote_evaluator import RemoteEvaluator
 from .extra_policy_info_sampler import ExtraPolicyInfoSampler
 from .utils import rollout, rollouts
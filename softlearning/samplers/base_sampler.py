@@ -18,6 +18,11 @@ class BaseSampler(object):
         self.policy = None
         self.pool = None
 
+    @property
+    def samples_per_step(self):
+        """Number of samples added by each call to `sample`."""
+        return 1
+
     def initialize(self, env, policy, pool):
         self.env = env
         self.policy = policy
@@ -0,0 +1,66 @@
+import pickle
+
+import ray
+import numpy as np
+
+from .remote_sampler import _RemoteEnv
+
+
+class RemoteEvaluator(object):
+    """Runs evaluation rollouts on a pool of ray actors.
+
+    Each worker holds its own copy of the environment and the policy. The
+    policy weights are put into the object store once per evaluation and
+    shared by all the workers, and the episodes are split evenly among them.
+    """
+
+    def __init__(self, env, policy, n_workers):
+        env_pkl = pickle.dumps(env)
+        policy_pkl = pickle.dumps(policy)
+
+        if not ray.is_initialized():
+            ray.init()
+
+        self._workers = [
+            _RemoteEnv.remote(env_pkl, policy_pkl) for _ in range(n_workers)]
+        self._pending_paths = None
+
+        # Block until the envs and policies are ready
+        initialized = ray.get([
+            worker.initialized.remote() for worker in self._workers])
+        assert all(initialized), initialized
+
+    def submit(self, policy_weights, n_paths, path_length, deterministic):
+        """Starts the rollouts without waiting for them to finish."""
+        assert self._pending_paths is None, (
+            "The previous evaluation has not been collected.")
+
+        policy_weights_id = ray.put(policy_weights)
+        n_paths_per_worker = [
+            len(shard) for shard in
+            np.array_split(np.arange(n_paths), len(self._workers))
+        ]
+        self._pending_paths = [
+            worker.rollouts.remote(
+                policy_weights_id, worker_n_paths, path_length, deterministic)
+            for worker, worker_n_paths
+            in zip(self._workers, n_paths_per_worker)
+            if worker_n_paths > 0
+        ]
+
+    def collect(self):
+        """Waits for the submitted rollouts and returns their paths."""
+        if self._pending_paths is None:
+            return ()
+
+        paths = tuple(
+            path
+            for worker_paths in ray.get(self._pending_paths)
+            for path in worker_paths)
+        self._pending_paths = None
+
+        return paths
+
+    def rollouts(self, *args, **kwargs):
+        self.submit(*args, **kwargs)
+        return self.collect()
@@ -114,3 +114,13 @@ class _RemoteEnv(object):
         path = rollout(self._env, self._policy, path_length)
 
         return path
+
+    def rollouts(self, policy_weights, n_paths, path_length, deterministic):
+        self._policy.set_weights(policy_weights)
+        with self._policy.set_deterministic(deterministic):
+            paths = [
+                rollout(self._env, self._policy, path_length)
+                for _ in range(n_paths)
+            ]
+
+        return paths
@@ -2,6 +2,8 @@ from collections import defaultdict
 
 import numpy as np
 
+from softlearning.utils.metrics import log_metrics
+
 from .base_sampler import BaseSampler
 
 
@@ -73,6 +75,11 @@ class SimpleSampler(BaseSampler):
             self._max_path_return = max(self._max_path_return,
                                         self._path_return)
             self._last_path_return = self._path_return
+            log_metrics(
+                'sampler',
+                total_samples=self._total_samples,
+                path_length=self._path_length,
+                path_return=self._path_return)
 
             self.policy.reset()
             self._current_observation = None
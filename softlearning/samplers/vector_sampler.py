@@ -0,0 +1,157 @@
+import numpy as np
+from gym import spaces
+
+from softlearning.utils.metrics import log_metrics
+
+from .simple_sampler import SimpleSampler
+
+
+class VectorSampler(SimpleSampler):
+    """Steps `num_envs` copies of the environment in lockstep.
+
+    The policy is evaluated on the observations of all the copies in a single
+    batch, and each copy writes its current path into preallocated arrays
+    instead of growing python lists. Every call to `sample` adds `num_envs`
+    samples.
+    """
+    def __init__(self, num_envs=4, **kwargs):
+        super(VectorSampler, self).__init__(**kwargs)
+
+        self._num_envs = num_envs
+        self.envs = None
+        self._reset_paths()
+
+    @property
+    def samples_per_step(self):
+        return self._num_envs
+
+    def _reset_paths(self):
+        self._current_observations = None
+        self._needs_reset = np.ones(self._num_envs, dtype=bool)
+        self._path_lengths = np.zeros(self._num_envs, dtype=np.int64)
+        self._path_returns = np.zeros(self._num_envs)
+        self._path_buffers = None
+        self._path_infos = [[] for _ in range(self._num_envs)]
+
+    def initialize(self, env, policy, pool):
+        super(VectorSampler, self).initialize(env, policy, pool)
+
+        if isinstance(env.observation_space, spaces.Dict):
+            raise NotImplementedError(
+                "{} does not support observation spaces of type '{}'."
+                "".format(type(self).__name__, type(env.observation_space)))
+
+        if self.envs is None or self.envs[0] is not env:
+            self.envs = [env] + [
+                env.copy() for _ in range(self._num_envs - 1)]
+
+        if self._path_buffers is None:
+            path_shape = (self._num_envs, self._max_path_length)
+            self._current_observations = np.zeros(
+                (self._num_envs, *env.observation_space.shape),
+                dtype=env.observation_space.dtype)
+            self._path_buffers = {
+                'observations': np.zeros(
+                    (*path_shape, *env.observation_space.shape),
+                    dtype=env.observation_space.dtype),
+                'actions': np.zeros(
+                    (*path_shape, *env.action_space.shape),
+                    dtype=np.float32),
+                'rewards': np.zeros((*path_shape, 1), dtype=np.float32),
+                'terminals': np.zeros((*path_shape, 1), dtype=bool),
+                'next_observations': np.zeros(
+                    (*path_shape, *env.observation_space.shape),
+                    dtype=env.observation_space.dtype),
+            }
+
+    def sample(self):
+        for i in np.flatnonzero(self._needs_reset):
+            self._current_observations[i] = self.envs[i].reset()
+            self._needs_reset[i] = False
+
+        actions = self.policy.actions_np([
+            self.env.convert_to_active_observation(
+                self._current_observations)
+        ])
+
+        next_observations, rewards, terminals, infos = [], [], [], []
+        for i, (env, action) in enumerate(zip(self.envs, actions)):
+            next_observation, reward, terminal, info = env.step(action)
+
+            t = self._path_lengths[i]
+            self._path_buffers['observations'][i, t] = (
+                self._current_observations[i])
+            self._path_buffers['actions'][i, t] = action
+            self._path_buffers['rewards'][i, t] = reward
+            self._path_buffers['terminals'][i, t] = terminal
+            self._path_buffers['next_observations'][i, t] = next_observation
+            self._path_infos[i].append(info)
+
+            self._path_lengths[i] += 1
+            self._path_returns[i] += reward
+
+            if terminal or self._path_lengths[i] >= self._max_path_length:
+                self._terminate_path(i)
+            else:
+                self._current_observations[i] = next_observation
+
+            next_observations.append(next_observation)
+            rewards.append(reward)
+            terminals.append(terminal)
+            infos.append(info)
+
+        self._total_samples += self._num_envs
+
+        return (np.array(next_observations),
+                np.array(rewards),
+                np.array(terminals),
+                infos)
+
+    def _terminate_path(self, i):
+        path_length = self._path_lengths[i]
+        last_path = {
+            field_name: values[i, :path_length].copy()
+            for field_name, values in self._path_buffers.items()
+        }
+        last_path['infos'] = np.array(self._path_infos[i])
+
+        self.pool.add_path(last_path)
+        self._last_n_paths.appendleft(last_path)
+
+        self._max_path_return = max(self._max_path_return,
+                                    self._path_returns[i])
+        self._last_path_return = self._path_returns[i]
+        log_metrics(
+            'sampler',
+            total_samples=self._total_samples,
+            path_length=path_length,
+            path_return=self._path_returns[i])
+
+        # Only the finished episode's row of the policy state, e.g. the
+        # latent smoothing, is reset; the other episodes keep running.
+        self.policy.reset(indices=[i])
+        self._needs_reset[i] = True
+        self._path_lengths[i] = 0
+        self._path_returns[i] = 0
+        self._path_infos[i] = []
+
+        self._n_episodes += 1
+
+    def terminate(self):
+        for env in self.envs[1:]:
+            env.close()
+        super(VectorSampler, self).terminate()
+
+    def __getstate__(self):
+        state = super(VectorSampler, self).__getstate__()
+        return {
+            key: value for key, value in state.items()
+            if key not in ('envs', '_path_buffers')
+        }
+
+    def __setstate__(self, state):
+        super(VectorSampler, self).__setstate__(state)
+
+        self.envs = None
+        # The partial paths are dropped together with the env copies.
+        self._reset_paths()
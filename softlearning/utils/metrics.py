@@ -0,0 +1,182 @@
+"""Buffered, append-only metrics tables.
+
+Any part of the code can log a row of scalars with
+`log_metrics(table, **values)`. Logging is a no-op until a sink is set with
+`set_metrics_sink`; afterwards the rows are appended to an in-memory buffer
+and a background thread writes them out as columnar part files, one
+directory per table:
+
+    <directory>/<table>/part-000000.parquet (or .npz without pyarrow)
+
+`read_metrics` concatenates the parts of a table back into columns.
+"""
+import glob
+import os
+import threading
+import time
+
+import numpy as np
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+class MetricsSink:
+    def __init__(self,
+                 directory,
+                 flush_interval=30.0,
+                 max_buffered_rows=int(1e4),
+                 file_format=None):
+        """
+        Args:
+            directory (`str`): Directory the tables are written to.
+            flush_interval (`float`): Seconds between background flushes.
+            max_buffered_rows (`int`): Number of buffered rows that triggers
+                a flush before the interval has passed.
+            file_format (`str`): 'parquet' or 'npz'. Defaults to parquet if
+                pyarrow is installed.
+        """
+        if file_format is None:
+            file_format = 'parquet' if pyarrow is not None else 'npz'
+        if file_format not in ('parquet', 'npz'):
+            raise ValueError(
+                "Invalid file_format '{}'.".format(file_format))
+        if file_format == 'parquet' and pyarrow is None:
+            raise ImportError(
+                "Writing parquet metrics requires pyarrow. Run"
+                " `pip install pyarrow` or use file_format='npz'.")
+
+        self._directory = directory
+        self._flush_interval = flush_interval
+        self._max_buffered_rows = max_buffered_rows
+        self._file_format = file_format
+
+        self._rows = {}
+        self._num_rows = 0
+        self._num_parts = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+        self._closed = threading.Event()
+        self._flush_requested = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def log(self, table, **values):
+        values['wall_time'] = time.time()
+
+        with self._lock:
+            self._rows.setdefault(table, []).append(values)
+            self._num_rows += 1
+            if self._num_rows >= self._max_buffered_rows:
+                self._flush_requested.set()
+
+    def flush(self):
+        with self._lock:
+            rows, self._rows, self._num_rows = self._rows, {}, 0
+
+        with self._write_lock:
+            for table, table_rows in rows.items():
+                self._write_part(table, table_rows)
+
+    def close(self):
+        self._closed.set()
+        self._flush_requested.set()
+        self._thread.join()
+        self.flush()
+
+    def _run(self):
+        while not self._closed.is_set():
+            self._flush_requested.wait(self._flush_interval)
+            self._flush_requested.clear()
+            self.flush()
+
+    def _write_part(self, table, rows):
+        table_dir = os.path.join(self._directory, table)
+        if table not in self._num_parts:
+            os.makedirs(table_dir, exist_ok=True)
+            self._num_parts[table] = len(
+                glob.glob(os.path.join(table_dir, 'part-*')))
+
+        column_names = list(dict.fromkeys(
+            column_name for row in rows for column_name in row))
+        columns = {
+            column_name: np.asarray([
+                row.get(column_name, np.nan) for row in rows
+            ])
+            for column_name in column_names
+        }
+
+        part_path = os.path.join(
+            table_dir,
+            'part-{:06d}.{}'.format(
+                self._num_parts[table], self._file_format))
+        # Readers never see a partially written part.
+        with open(part_path + '.tmp', 'wb') as f:
+            if self._file_format == 'parquet':
+                pyarrow.parquet.write_table(pyarrow.table(columns), f)
+            else:
+                np.savez(f, **columns)
+        os.replace(part_path + '.tmp', part_path)
+
+        self._num_parts[table] += 1
+
+
+def _read_part(part_path):
+    if part_path.endswith('.parquet'):
+        part = pyarrow.parquet.read_table(part_path)
+        return {
+            column_name: part.column(column_name).to_numpy()
+            for column_name in part.column_names
+        }
+
+    with np.load(part_path) as part:
+        return dict(part)
+
+
+def read_metrics(directory, table):
+    """Returns the rows logged to `table` as a dict of columns. Columns
+    missing from some of the parts are filled with nan."""
+    parts = [
+        _read_part(part_path)
+        for part_path in sorted(
+            glob.glob(os.path.join(directory, table, 'part-*.parquet'))
+            + glob.glob(os.path.join(directory, table, 'part-*.npz')))
+    ]
+
+    column_names = list(dict.fromkeys(
+        column_name for part in parts for column_name in part))
+
+    return {
+        column_name: np.concatenate([
+            part[column_name]
+            if column_name in part
+            else np.full(len(next(iter(part.values()))), np.nan)
+            for part in parts
+        ])
+        for column_name in column_names
+    }
+
+
+_metrics_sink = None
+
+
+def set_metrics_sink(sink):
+    """Sets the sink `log_metrics` writes to and returns the previous one."""
+    global _metrics_sink
+    previous_sink, _metrics_sink = _metrics_sink, sink
+    return previous_sink
+
+
+def close_metrics_sink():
+    sink = set_metrics_sink(None)
+    if sink is not None:
+        sink.close()
+
+
+def log_metrics(table, **values):
+    if _metrics_sink is not None:
+        _metrics_sink.log(table, **values)
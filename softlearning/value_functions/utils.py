@@ -18,6 +18,10 @@ VALUE_FUNCTIONS = {
     'double_feedforward_Q_function': lambda Q_ensemble, *args, **kwargs: (
         create_double_value_function(
             vanilla.create_feedforward_Q_function, Q_ensemble, *args, **kwargs)),
+    # A single model whose outputs are the Q_ensemble heads, [batch, Q_ensemble].
+    'ensemble_feedforward_Q_function': lambda Q_ensemble, *args, **kwargs: (
+        vanilla.create_ensemble_feedforward_Q_function(
+            *args, ensemble_size=Q_ensemble, **kwargs), ),
 }
 
 
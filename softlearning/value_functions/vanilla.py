@@ -1,4 +1,5 @@
 from softlearning.models.feedforward import feedforward_model
+from softlearning.models.ensemble_feedforward import ensemble_feedforward_model
 
 
 def create_feedforward_Q_function(observation_shape,
@@ -18,6 +19,25 @@ def create_feedforward_Q_function(observation_shape,
         **kwargs)
 
 
+def create_ensemble_feedforward_Q_function(observation_shape,
+                                           action_shape,
+                                           ensemble_size,
+                                           *args,
+                                           observation_preprocessor=None,
+                                           name='ensemble_feedforward_Q',
+                                           **kwargs):
+    input_shapes = (observation_shape, action_shape)
+    preprocessors = (observation_preprocessor, None)
+    return ensemble_feedforward_model(
+        input_shapes,
+        *args,
+        output_size=1,
+        ensemble_size=ensemble_size,
+        preprocessors=preprocessors,
+        name=name,
+        **kwargs)
+
+
 def create_feedforward_V_function(observation_shape,
                                   *args,
                                   observation_preprocessor=None,
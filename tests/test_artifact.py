@@ -0,0 +1,106 @@
+import json
+import os
+import struct
+
+import numpy as np
+import pytest
+
+from mbpo.models.artifact import (
+    ALIGNMENT, MAGIC, VERSION, read_artifact, write_artifact)
+
+
+def make_arrays():
+    rng = np.random.RandomState(0)
+    return {
+        'weights': rng.normal(size=(7, 13)).astype(np.float32),
+        'biases': rng.normal(size=(1, 13)),
+        'mask': rng.rand(5) < 0.5,
+        'scalar': np.array(3, dtype=np.int64),
+        'half': rng.normal(size=(3, 3)).astype(np.float16),
+        'empty': np.zeros((0, 4), dtype=np.float32),
+        'transposed': rng.normal(size=(4, 6)).astype(np.float32).T,
+    }
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / 'model.bnn')
+    arrays = make_arrays()
+    write_artifact(path, {'name': 'model', 'layers': [1, 2]}, arrays)
+
+    header, loaded = read_artifact(path)
+
+    assert header['name'] == 'model'
+    assert header['layers'] == [1, 2]
+    assert header['version'] == VERSION
+    assert loaded.keys() == arrays.keys()
+    for name, array in arrays.items():
+        assert loaded[name].dtype == array.dtype, name
+        np.testing.assert_array_equal(loaded[name], array, err_msg=name)
+        assert not loaded[name].flags.writeable
+
+
+def test_arrays_are_aligned(tmp_path):
+    path = str(tmp_path / 'model.bnn')
+    write_artifact(path, {}, make_arrays())
+
+    with open(path, 'rb') as f:
+        f.read(len(MAGIC))
+        header_length, = struct.unpack('<Q', f.read(8))
+        header = json.loads(f.read(header_length).decode('utf-8'))
+
+    assert (len(MAGIC) + 8 + header_length) % ALIGNMENT == 0
+    for spec in header['arrays']:
+        assert spec['offset'] % ALIGNMENT == 0, spec['name']
+
+
+def test_overwrites_without_leaving_temporary_files(tmp_path):
+    path = str(tmp_path / 'model.bnn')
+    write_artifact(path, {'step': 1}, {'weights': np.zeros(3)})
+    write_artifact(path, {'step': 2}, {'weights': np.ones(5)})
+
+    header, arrays = read_artifact(path)
+    assert header['step'] == 2
+    np.testing.assert_array_equal(arrays['weights'], np.ones(5))
+    assert os.listdir(str(tmp_path)) == ['model.bnn']
+
+
+def test_rejects_other_files(tmp_path):
+    path = str(tmp_path / 'model.bnn')
+    with open(path, 'wb') as f:
+        f.write(b'\x00' * 64)
+
+    with pytest.raises(ValueError, match='not a model artifact'):
+        read_artifact(path)
+
+
+def rewrite_version(path, version):
+    """Replaces the version in the header of the artifact at path, keeping
+    the header length."""
+    with open(path, 'r+b') as f:
+        f.seek(len(MAGIC))
+        header_length, = struct.unpack('<Q', f.read(8))
+        header = json.loads(f.read(header_length).decode('utf-8'))
+        header['version'] = version
+        header_bytes = json.dumps(header).encode('utf-8')
+        assert len(header_bytes) <= header_length
+        f.seek(len(MAGIC) + 8)
+        f.write(header_bytes.ljust(header_length))
+
+
+def test_rejects_newer_versions(tmp_path):
+    path = str(tmp_path / 'model.bnn')
+    write_artifact(path, {}, {'weights': np.zeros(3)})
+    rewrite_version(path, VERSION + 1)
+
+    with pytest.raises(ValueError, match='version'):
+        read_artifact(path)
+
+
+def test_reads_older_versions(tmp_path):
+    path = str(tmp_path / 'model.bnn')
+    write_artifact(path, {}, {'weights': np.arange(3.0)})
+    rewrite_version(path, VERSION - 1)
+
+    header, arrays = read_artifact(path)
+    assert header['version'] == VERSION - 1
+    np.testing.assert_array_equal(arrays['weights'], np.arange(3.0))
@@ -0,0 +1,170 @@
+import pickle
+
+import numpy as np
+import pytest
+from gym.spaces import Box
+
+from softlearning.replay_pools.compact_replay_pool import CompactReplayPool
+from softlearning.replay_pools.simple_replay_pool import SimpleReplayPool
+
+
+OBSERVATION_SPACE = Box(-2, 2, shape=(3, ), dtype=np.float32)
+ACTION_SPACE = Box(-1, 1, shape=(2, ), dtype=np.float32)
+FIELD_NAMES = (
+    'observations', 'next_observations', 'actions', 'rewards', 'terminals')
+
+
+def episode(rng, length):
+    """Transitions of one episode, where each next observation is the
+    following observation."""
+    observations = rng.uniform(
+        -2, 2, size=(length + 1, 3)).astype(np.float32)
+    terminals = np.zeros((length, 1), dtype=bool)
+    terminals[-1] = rng.rand() < 0.5
+    return {
+        'observations': observations[:-1],
+        'next_observations': observations[1:],
+        'actions': rng.uniform(-1, 1, size=(length, 2)).astype(np.float32),
+        'rewards': rng.normal(size=(length, 1)).astype(np.float32),
+        'terminals': terminals,
+    }
+
+
+def rollouts(rng, num_samples):
+    """Independent transitions, as added by model rollouts."""
+    samples = episode(rng, num_samples)
+    samples['next_observations'] = rng.uniform(
+        -2, 2, size=(num_samples, 3)).astype(np.float32)
+    return samples
+
+
+def split(samples, stop):
+    return (
+        {name: values[:stop] for name, values in samples.items()},
+        {name: values[stop:] for name, values in samples.items()},
+    )
+
+
+def add_to_both(pools, samples):
+    for pool in pools:
+        pool.add_samples(samples)
+
+
+def physical_indices(pool, ages):
+    return (pool._pointer - pool.size + ages) % pool._max_size
+
+
+def assert_same_samples(pool, expected, atol=0.0):
+    assert pool.size == expected.size
+    assert pool.total_samples == expected.total_samples
+
+    batch = pool.last_n_batch(pool.size)
+    expected_batch = expected.last_n_batch(expected.size)
+    for name in FIELD_NAMES:
+        np.testing.assert_allclose(
+            batch[name], expected_batch[name], atol=atol, err_msg=name)
+
+    ## the pools can place the same sample in different rows, so compare
+    ## samples by their age
+    ages = np.random.RandomState(0).randint(0, pool.size, 50)
+    batch = pool.batch_by_indices(physical_indices(pool, ages))
+    expected_batch = expected.batch_by_indices(
+        physical_indices(expected, ages))
+    for name in FIELD_NAMES:
+        np.testing.assert_allclose(
+            batch[name], expected_batch[name], atol=atol, err_msg=name)
+
+
+def fill(pools, rng, num_steps=25):
+    """Adds whole episodes, episodes split across calls and rollouts until
+    the pools have wrapped around several times."""
+    for _ in range(num_steps):
+        kind = rng.randint(3)
+        if kind == 0:
+            add_to_both(pools, episode(rng, rng.randint(1, 12)))
+        elif kind == 1:
+            samples = episode(rng, rng.randint(2, 12))
+            for part in split(samples, rng.randint(1, len(samples['actions']))):
+                add_to_both(pools, part)
+        else:
+            add_to_both(pools, rollouts(rng, rng.randint(1, 12)))
+
+
+@pytest.mark.parametrize('max_size', [1, 7, 20])
+def test_matches_simple_pool_across_episodes_and_wraparound(max_size):
+    rng = np.random.RandomState(max_size)
+    pool = CompactReplayPool(OBSERVATION_SPACE, ACTION_SPACE, max_size)
+    expected = SimpleReplayPool(OBSERVATION_SPACE, ACTION_SPACE, max_size)
+
+    for _ in range(4):
+        fill((pool, expected), rng)
+        assert_same_samples(pool, expected)
+
+
+def test_episode_stores_single_next_observation():
+    pool = CompactReplayPool(OBSERVATION_SPACE, ACTION_SPACE, 20)
+    samples = episode(np.random.RandomState(0), 10)
+    for part in split(samples, 4):
+        pool.add_samples(part)
+
+    assert pool._side_count == 1
+    np.testing.assert_array_equal(
+        pool.last_n_batch(10)['next_observations'],
+        samples['next_observations'])
+
+
+@pytest.mark.parametrize('new_max_size', [3, 9, 40])
+def test_resize_matches_simple_pool(new_max_size):
+    rng = np.random.RandomState(new_max_size)
+    pool = CompactReplayPool(OBSERVATION_SPACE, ACTION_SPACE, 9)
+    expected = SimpleReplayPool(OBSERVATION_SPACE, ACTION_SPACE, 9)
+    fill((pool, expected), rng)
+
+    pool.resize(new_max_size, chunk_size=2)
+    expected.resize(new_max_size, chunk_size=2)
+    assert_same_samples(pool, expected)
+
+    fill((pool, expected), rng)
+    assert_same_samples(pool, expected)
+
+
+def test_add_selected_samples_matches_simple_pool():
+    rng = np.random.RandomState(0)
+    pool = CompactReplayPool(OBSERVATION_SPACE, ACTION_SPACE, 8)
+    expected = SimpleReplayPool(OBSERVATION_SPACE, ACTION_SPACE, 8)
+
+    for _ in range(10):
+        samples = rollouts(rng, 12)
+        indices = rng.randint(0, 12, size=rng.randint(1, 20))
+        pool.add_selected_samples(samples, indices)
+        expected.add_selected_samples(samples, indices)
+
+    assert_same_samples(pool, expected)
+
+
+def test_pickle_round_trip():
+    rng = np.random.RandomState(0)
+    pool = CompactReplayPool(OBSERVATION_SPACE, ACTION_SPACE, 10)
+    expected = SimpleReplayPool(OBSERVATION_SPACE, ACTION_SPACE, 10)
+    fill((pool, expected), rng, num_steps=3)
+
+    pool = pickle.loads(pickle.dumps(pool))
+    assert_same_samples(pool, expected)
+
+    fill((pool, expected), rng)
+    assert_same_samples(pool, expected)
+
+
+@pytest.mark.parametrize('observation_dtype,atol', [
+    ('float16', 2e-3),
+    ('int16', 4.0 / 65535),
+])
+def test_compressed_observations_round_trip(observation_dtype, atol):
+    rng = np.random.RandomState(0)
+    pool = CompactReplayPool(
+        OBSERVATION_SPACE, ACTION_SPACE, 15,
+        observation_dtype=observation_dtype)
+    expected = SimpleReplayPool(OBSERVATION_SPACE, ACTION_SPACE, 15)
+
+    fill((pool, expected), rng)
+    assert_same_samples(pool, expected, atol=atol)
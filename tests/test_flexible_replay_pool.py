@@ -0,0 +1,137 @@
+from collections import deque
+
+import numpy as np
+import pytest
+
+from softlearning.replay_pools.flexible_replay_pool import FlexibleReplayPool
+
+
+FIELDS_ATTRS = {
+    'values': {'shape': (2, ), 'dtype': 'int64'},
+    'flags': {'shape': (1, ), 'dtype': 'bool', 'default_value': True},
+}
+
+
+def make_samples(start, num_samples):
+    values = np.arange(start, start + num_samples)
+    return {
+        'values': np.stack([values, -values], axis=1),
+        'flags': (values % 2 == 0)[:, None],
+    }
+
+
+def pool_values(pool):
+    """Rows of the `values` field, oldest first."""
+    return pool.last_n_batch(pool.size)['values'][:, 0].tolist()
+
+
+@pytest.mark.parametrize('max_size', [1, 5, 8])
+def test_add_samples_evicts_like_fifo(max_size):
+    pool = FlexibleReplayPool(max_size, FIELDS_ATTRS)
+    reference = deque(maxlen=max_size)
+    rng = np.random.RandomState(0)
+
+    start = 0
+    for _ in range(30):
+        num_samples = rng.randint(0, 2 * max_size + 2)
+        pool.add_samples(make_samples(start, num_samples))
+        reference.extend(range(start, start + num_samples))
+        start += num_samples
+
+        assert pool.size == len(reference)
+        assert pool_values(pool) == list(reference)
+        assert pool.total_samples == start
+
+
+def test_add_sample_evicts_like_fifo():
+    pool = FlexibleReplayPool(3, FIELDS_ATTRS)
+    reference = deque(maxlen=3)
+
+    for value in range(7):
+        sample = {
+            name: values[0]
+            for name, values in make_samples(value, 1).items()
+        }
+        pool.add_sample(sample)
+        reference.append(value)
+
+        assert pool_values(pool) == list(reference)
+
+
+def test_add_samples_fills_missing_fields():
+    pool = FlexibleReplayPool(4, FIELDS_ATTRS)
+    pool.add_samples({'values': make_samples(0, 3)['values']})
+
+    np.testing.assert_array_equal(
+        pool.last_n_batch(3)['flags'], np.ones((3, 1), dtype=bool))
+
+
+@pytest.mark.parametrize('max_size', [1, 5, 8])
+def test_add_selected_samples_matches_add_samples(max_size):
+    pool = FlexibleReplayPool(max_size, FIELDS_ATTRS)
+    expected = FlexibleReplayPool(max_size, FIELDS_ATTRS)
+    rng = np.random.RandomState(0)
+
+    for step in range(20):
+        samples = make_samples(100 * step, 12)
+        indices = rng.randint(0, 12, size=rng.randint(0, 2 * max_size + 2))
+        pool.add_selected_samples(samples, indices)
+        expected.add_samples({
+            name: values[indices] for name, values in samples.items()})
+
+        assert pool.size == expected.size
+        assert pool.total_samples == expected.total_samples
+        for name, values in expected.last_n_batch(expected.size).items():
+            np.testing.assert_array_equal(
+                pool.last_n_batch(pool.size)[name], values)
+
+
+def test_add_selected_samples_fills_missing_fields():
+    pool = FlexibleReplayPool(4, FIELDS_ATTRS)
+    samples = {'values': make_samples(0, 6)['values']}
+    pool.add_selected_samples(samples, np.array([5, 1]))
+
+    assert pool_values(pool) == [5, 1]
+    np.testing.assert_array_equal(
+        pool.last_n_batch(2)['flags'], np.ones((2, 1), dtype=bool))
+
+
+def test_add_selected_samples_rejects_out_of_range_indices():
+    pool = FlexibleReplayPool(4, FIELDS_ATTRS)
+
+    for indices in ([0, 6], [-1]):
+        with pytest.raises(IndexError):
+            pool.add_selected_samples(make_samples(0, 6), np.array(indices))
+    assert pool.size == 0
+
+
+@pytest.mark.parametrize('new_max_size', [2, 5, 7, 12])
+@pytest.mark.parametrize('num_added', [3, 7, 16])
+def test_resize_keeps_newest_samples_in_fifo_order(num_added, new_max_size):
+    pool = FlexibleReplayPool(7, FIELDS_ATTRS)
+    pool.add_samples(make_samples(0, num_added))
+    reference = deque(range(num_added), maxlen=7)
+
+    pool.resize(new_max_size, chunk_size=2)
+    reference = deque(reference, maxlen=new_max_size)
+    assert pool.size == len(reference)
+    assert pool_values(pool) == list(reference)
+
+    ## eviction continues in FIFO order after the resize
+    for start in (100, 200):
+        pool.add_samples(make_samples(start, 3))
+        reference.extend(range(start, start + 3))
+        assert pool_values(pool) == list(reference)
+
+
+def test_resize_of_referenced_fields_copies():
+    pool = FlexibleReplayPool(4, FIELDS_ATTRS)
+    pool.add_samples(make_samples(0, 6))
+    view = pool.fields['values'][:2]
+
+    stats = pool.resize(8)
+
+    assert stats['peak_bytes'] > stats['before_bytes']
+    assert stats['after_bytes'] == 2 * stats['before_bytes']
+    assert pool_values(pool) == [2, 3, 4, 5]
+    assert view.base is not pool.fields['values']
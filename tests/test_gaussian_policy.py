@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('tensorflow')
+pytest.importorskip('tensorflow_probability')
+
+from softlearning.policies.gaussian_policy import FeedforwardGaussianPolicy
+
+
+OBSERVATION_DIM, ACTION_DIM = 5, 3
+
+
+def make_policy(smoothing_coefficient=None):
+    return FeedforwardGaussianPolicy(
+        input_shapes=((OBSERVATION_DIM, ), ),
+        output_shape=(ACTION_DIM, ),
+        hidden_layer_sizes=(16, 16),
+        numpy_inference=True,
+        smoothing_coefficient=smoothing_coefficient)
+
+
+def random_observations(batch_size=7, seed=0):
+    return np.random.RandomState(seed).normal(
+        size=(batch_size, OBSERVATION_DIM)).astype(np.float32)
+
+
+def test_deterministic_actions_match_tensorflow():
+    policy = make_policy()
+    observations = random_observations()
+
+    with policy.set_deterministic(True):
+        actions = policy.actions_np([observations])
+    expected = policy.deterministic_actions_model.predict([observations])
+
+    np.testing.assert_allclose(actions, expected, atol=1e-5)
+
+
+def test_bare_array_conditions_match_list():
+    policy = make_policy()
+    observations = random_observations()
+
+    with policy.set_deterministic(True):
+        actions = policy.actions_np(observations)
+        expected = policy.actions_np([observations])
+
+    assert actions.shape == (observations.shape[0], ACTION_DIM)
+    np.testing.assert_allclose(actions, expected)
+
+
+@pytest.mark.parametrize('smoothing_coefficient', [None, 0.5])
+def test_stochastic_actions_match_tensorflow(smoothing_coefficient):
+    policy = make_policy(smoothing_coefficient)
+    observations = random_observations()
+    alpha = smoothing_coefficient or 0
+    beta = np.sqrt(1.0 - alpha ** 2) / (1.0 - alpha)
+
+    # Replays the latents drawn by the NumPy path through the TensorFlow
+    # model for fixed latents, over several steps of the smoothing state.
+    policy.reset()
+    smoothing_x = np.zeros((1, ACTION_DIM))
+    for step in range(3):
+        np.random.seed(step)
+        actions = policy.actions_np([observations])
+
+        np.random.seed(step)
+        raw_latents = np.random.standard_normal(
+            (observations.shape[0], ACTION_DIM)).astype(np.float32)
+        if alpha == 0:
+            latents = raw_latents
+        else:
+            smoothing_x = alpha * smoothing_x + (1.0 - alpha) * raw_latents
+            latents = beta * smoothing_x
+        expected = policy.actions_model_for_fixed_latents.predict(
+            [observations, latents])
+
+        np.testing.assert_allclose(actions, expected, atol=1e-5)
+
+
+def test_inference_weights_follow_set_weights():
+    policy = make_policy()
+    observations = random_observations()
+
+    policy.set_weights([
+        np.random.normal(size=weight.shape).astype(np.float32)
+        for weight in policy.get_weights()
+    ])
+
+    with policy.set_deterministic(True):
+        actions = policy.actions_np([observations])
+    expected = policy.deterministic_actions_model.predict([observations])
+
+    np.testing.assert_allclose(actions, expected, atol=1e-5)
@@ -0,0 +1,145 @@
+import json
+import os
+
+import numpy as np
+import pytest
+from gym.spaces import Box
+
+from softlearning.replay_pools import flexible_replay_pool
+from softlearning.replay_pools.compact_replay_pool import CompactReplayPool
+from softlearning.replay_pools.flexible_replay_pool import (
+    FlexibleReplayPool, has_chunks)
+from softlearning.replay_pools.simple_replay_pool import SimpleReplayPool
+
+
+FIELDS_ATTRS = {
+    'values': {'shape': (2, ), 'dtype': 'int64'},
+    'rewards': {'shape': (1, ), 'dtype': 'float32'},
+}
+
+
+def make_samples(start, num_samples):
+    values = np.arange(start, start + num_samples)
+    return {
+        'values': np.stack([values, -values], axis=1),
+        'rewards': values[:, None].astype(np.float32) / 2,
+    }
+
+
+def all_samples(pool):
+    return pool.last_n_batch(pool.size)
+
+
+def assert_same_samples(pool, expected):
+    assert pool.size == expected.size
+    batch, expected_batch = all_samples(pool), all_samples(expected)
+    assert batch.keys() == expected_batch.keys()
+    for name, values in expected_batch.items():
+        np.testing.assert_array_equal(batch[name], values, err_msg=name)
+
+
+@pytest.mark.parametrize('compression', [None, 'zlib'])
+@pytest.mark.parametrize('max_size', [5, 12, 100])
+def test_round_trip_through_wraparound(tmp_path, compression, max_size):
+    pool = FlexibleReplayPool(max_size, FIELDS_ATTRS)
+    rng = np.random.RandomState(max_size)
+
+    start = 0
+    for _ in range(10):
+        num_samples = rng.randint(1, 9)
+        pool.add_samples(make_samples(start, num_samples))
+        start += num_samples
+        pool.save_latest_chunk(str(tmp_path), compression=compression)
+
+    loaded = FlexibleReplayPool(max_size, FIELDS_ATTRS)
+    loaded.load_chunks([str(tmp_path)])
+
+    assert_same_samples(loaded, pool)
+    assert loaded._samples_since_save == 0
+
+
+def test_only_unsaved_samples_are_appended(tmp_path):
+    pool = FlexibleReplayPool(10, FIELDS_ATTRS)
+    pool.add_samples(make_samples(0, 4))
+    pool.save_latest_chunk(str(tmp_path))
+    pool.save_latest_chunk(str(tmp_path))
+    pool.add_samples(make_samples(4, 3))
+    pool.save_latest_chunk(str(tmp_path))
+
+    with open(os.path.join(str(tmp_path), 'manifest.json')) as f:
+        manifest = json.load(f)
+    assert [chunk['num_samples'] for chunk in manifest['chunks']] == [4, 3]
+
+
+def test_load_chunks_from_several_directories(tmp_path):
+    directories = [str(tmp_path / 'first'), str(tmp_path / 'second')]
+    pool = FlexibleReplayPool(8, FIELDS_ATTRS)
+
+    start = 0
+    for directory in directories:
+        for num_samples in (3, 4):
+            pool.add_samples(make_samples(start, num_samples))
+            start += num_samples
+            pool.save_latest_chunk(directory)
+
+    loaded = FlexibleReplayPool(8, FIELDS_ATTRS)
+    loaded.load_chunks(directories)
+    assert_same_samples(loaded, pool)
+
+
+def test_load_chunks_skips_evicted_chunks(tmp_path, monkeypatch):
+    pool = FlexibleReplayPool(100, FIELDS_ATTRS)
+    for start in range(0, 30, 5):
+        pool.add_samples(make_samples(start, 5))
+        pool.save_latest_chunk(str(tmp_path))
+
+    read_chunks = []
+    read_chunk = flexible_replay_pool._read_chunk
+
+    def recording_read_chunk(directory_and_chunk):
+        read_chunks.append(directory_and_chunk[1]['name'])
+        return read_chunk(directory_and_chunk)
+
+    monkeypatch.setattr(flexible_replay_pool, '_read_chunk', recording_read_chunk)
+
+    loaded = FlexibleReplayPool(7, FIELDS_ATTRS)
+    loaded.load_chunks([str(tmp_path)])
+
+    assert sorted(read_chunks) == ['chunk_000004', 'chunk_000005']
+    assert all_samples(loaded)['values'][:, 0].tolist() == list(range(23, 30))
+
+
+def test_missing_directory_loads_nothing(tmp_path):
+    pool = FlexibleReplayPool(4, FIELDS_ATTRS)
+    assert not has_chunks(str(tmp_path / 'missing'))
+    pool.load_chunks([str(tmp_path / 'missing')])
+    assert pool.size == 0
+
+
+def test_invalid_compression(tmp_path):
+    pool = FlexibleReplayPool(4, FIELDS_ATTRS)
+    with pytest.raises(ValueError):
+        pool.save_latest_chunk(str(tmp_path), compression='gzip')
+
+
+@pytest.mark.parametrize('pool_class', [SimpleReplayPool, CompactReplayPool])
+def test_round_trip_of_transition_pools(tmp_path, pool_class):
+    observation_space = Box(-1, 1, shape=(3, ), dtype=np.float32)
+    action_space = Box(-1, 1, shape=(2, ), dtype=np.float32)
+    pool = pool_class(observation_space, action_space, 9)
+    rng = np.random.RandomState(0)
+
+    for _ in range(5):
+        observations = rng.uniform(-1, 1, size=(5, 3)).astype(np.float32)
+        pool.add_samples({
+            'observations': observations[:-1],
+            'next_observations': observations[1:],
+            'actions': rng.uniform(-1, 1, size=(4, 2)).astype(np.float32),
+            'rewards': rng.normal(size=(4, 1)).astype(np.float32),
+            'terminals': np.zeros((4, 1), dtype=bool),
+        })
+        pool.save_latest_chunk(str(tmp_path))
+
+    loaded = pool_class(observation_space, action_space, 9)
+    loaded.load_chunks([str(tmp_path)])
+    assert_same_samples(loaded, pool)
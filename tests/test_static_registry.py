@@ -0,0 +1,64 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import mbpo.static
+
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_python(source, cwd):
+    """Runs `source` in a fresh interpreter, so that no domain module has
+    been imported by other tests."""
+    environment = dict(os.environ, PYTHONPATH=REPOSITORY_ROOT)
+    return subprocess.run(
+        [sys.executable, '-c', source], cwd=cwd, env=environment,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True,
+    ).stdout.decode().strip()
+
+
+def test_import_loads_no_domain_module(tmp_path):
+    source = (
+        "import sys\n"
+        "import mbpo.static\n"
+        "print(sorted(name for name in sys.modules"
+        " if name.startswith('mbpo.static.')))\n"
+    )
+    assert run_python(source, cwd=str(tmp_path)) == '[]'
+
+
+def test_domains_are_listed_without_importing():
+    assert set(mbpo.static.keys()) == set(mbpo.static.STATIC_FNS_MODULES)
+    assert sorted(mbpo.static) == sorted(mbpo.static.STATIC_FNS_MODULES)
+    assert len(mbpo.static) == len(mbpo.static.STATIC_FNS_MODULES)
+    assert 'hopper' in mbpo.static
+    assert 'Hopper' not in mbpo.static
+
+
+def test_unknown_domain_raises_key_error():
+    with pytest.raises(KeyError):
+        mbpo.static['unknown']
+
+
+def test_every_domain_module_exists():
+    static_directory = os.path.dirname(mbpo.static.__file__)
+    for module_name in mbpo.static.STATIC_FNS_MODULES.values():
+        assert os.path.exists(
+            os.path.join(static_directory, module_name + '.py'))
+
+
+def test_lookup_imports_only_that_domain(tmp_path):
+    pytest.importorskip('tensorflow')
+    source = (
+        "import sys\n"
+        "import mbpo.static\n"
+        "static_fns = mbpo.static['hopper']\n"
+        "assert mbpo.static['hopper'] is static_fns\n"
+        "print(static_fns.__module__, sorted(name for name in sys.modules"
+        " if name.startswith('mbpo.static.')))\n"
+    )
+    assert run_python(source, cwd=str(tmp_path)) == (
+        "mbpo.static.hopper ['mbpo.static.hopper']")
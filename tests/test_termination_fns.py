@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+tf = pytest.importorskip('tensorflow')
+
+import mbpo.static
+
+
+## {domain: (observation dim, action dim), ... } of the environments each
+## domain's static functions are used with; the fetch tasks use the
+## concatenated dict observation
+DOMAIN_DIMS = {
+    'anttruncatedobs': (27, 8),
+    'continuousgrid': (2, 2),
+    'fetchpickandplace': (31, 4),
+    'fetchpush': (31, 4),
+    'halfcheetah': (17, 6),
+    'hopper': (11, 3),
+    'humanoidtruncatedobs': (45, 17),
+    'inverteddoublependulum': (11, 1),
+    'invertedpendulum': (4, 1),
+    'myhopper': (11, 3),
+    'mywalker2d': (17, 6),
+    'reacher': (11, 2),
+    'walker2d': (17, 6),
+}
+
+
+def random_batch(batch_size, obs_dim, act_dim, rng):
+    """Observations spread across the termination thresholds of all domains,
+    with a few large and non-finite entries."""
+    obs = rng.uniform(-3, 3, size=(batch_size, obs_dim)).astype(np.float32)
+    act = rng.uniform(-1, 1, size=(batch_size, act_dim)).astype(np.float32)
+    next_obs = rng.uniform(-3, 3, size=(batch_size, obs_dim)).astype(np.float32)
+
+    large = rng.random_sample(next_obs.shape) < 0.01
+    next_obs[large] *= 100
+    for value in (np.inf, -np.inf, np.nan):
+        next_obs[rng.random_sample(next_obs.shape) < 0.001] = value
+
+    return obs, act, next_obs
+
+
+def test_every_domain_has_dims():
+    assert set(DOMAIN_DIMS) == set(mbpo.static.keys())
+
+
+@pytest.mark.parametrize('domain', sorted(DOMAIN_DIMS))
+def test_termination_ph_fn_matches_termination_fn(domain):
+    obs_dim, act_dim = DOMAIN_DIMS[domain]
+    static_fns = mbpo.static[domain]
+    obs, act, next_obs = random_batch(
+        10000, obs_dim, act_dim, np.random.RandomState(0))
+
+    with tf.Graph().as_default():
+        obs_ph = tf.placeholder(tf.float32, (None, obs_dim))
+        act_ph = tf.placeholder(tf.float32, (None, act_dim))
+        next_obs_ph = tf.placeholder(tf.float32, (None, obs_dim))
+        terminals_ph = static_fns.termination_ph_fn(obs_ph, act_ph, next_obs_ph)
+
+        with tf.Session() as session:
+            terminals_tf = session.run(terminals_ph, feed_dict={
+                obs_ph: obs, act_ph: act, next_obs_ph: next_obs})
+
+    with np.errstate(invalid='ignore'):
+        terminals_np = static_fns.termination_fn(obs, act, next_obs)
+
+    assert terminals_tf.shape == terminals_np.shape
+    np.testing.assert_array_equal(terminals_tf, terminals_np)